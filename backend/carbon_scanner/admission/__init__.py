@@ -0,0 +1,5 @@
+from carbon_scanner.admission.controller import AdmissionController
+from carbon_scanner.admission.fair_queue import FairQueue, Overloaded
+from carbon_scanner.admission.token_bucket import RateLimiter, TokenBucket
+
+__all__ = ['AdmissionController', 'FairQueue', 'Overloaded', 'RateLimiter', 'TokenBucket']
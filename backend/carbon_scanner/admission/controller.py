@@ -0,0 +1,50 @@
+import time
+from contextlib import contextmanager
+from typing import Iterator
+from carbon_scanner.admission.fair_queue import FairQueue, Overloaded
+from carbon_scanner.admission.token_bucket import RateLimiter
+from carbon_scanner.metrics import (
+    ADMISSION_QUEUE_DEPTH,
+    ADMISSION_REJECTED,
+    ADMISSION_WAIT,
+)
+
+
+class AdmissionController:
+    """Per client rate limit, then a fair share of the model call slots."""
+
+    def __init__(self, limiter: RateLimiter, queue: FairQueue) -> None:
+        self.limiter: RateLimiter = limiter
+        self.queue: FairQueue = queue
+
+    def charge(self, client: str, cost: float = 1.0) -> None:
+        """Takes `cost` from the client's rate limit, or raises Overloaded."""
+        retry_after = self.limiter.take(client, cost)
+        if retry_after:
+            ADMISSION_REJECTED.labels("rate_limited").inc()
+            raise Overloaded("Rate limit exceeded", retry_after)
+
+    @contextmanager
+    def slot(self, client: str, cost: float = 1.0) -> Iterator[None]:
+        """Holds a model slot for the duration of the block, or raises Overloaded."""
+        ADMISSION_QUEUE_DEPTH.inc()
+        try:
+            waited = self.queue.acquire(client, cost)
+        except Overloaded:
+            ADMISSION_REJECTED.labels("overloaded").inc()
+            raise
+        finally:
+            ADMISSION_QUEUE_DEPTH.dec()
+        ADMISSION_WAIT.observe(waited)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.queue.release(time.monotonic() - start)
+
+    @contextmanager
+    def admit(self, client: str, cost: float = 1.0) -> Iterator[None]:
+        """charge, then slot for the duration of the block."""
+        self.charge(client, cost)
+        with self.slot(client, cost):
+            yield
@@ -0,0 +1,140 @@
+import heapq
+import itertools
+import threading
+import time
+from typing import Dict, List, Optional
+
+
+class Overloaded(Exception):
+    """Raised when a request is turned away; `retry_after` is in seconds."""
+
+    def __init__(self, message: str, retry_after: float) -> None:
+        super().__init__(message)
+        self.retry_after: float = retry_after
+
+
+class _Waiter:
+    __slots__ = ("client", "start", "finish", "previous", "granted", "cancelled")
+
+    def __init__(
+        self, client: str, start: float, finish: float, previous: float
+    ) -> None:
+        self.client = client
+        self.start = start
+        self.finish = finish
+        self.previous = previous
+        self.granted = False
+        self.cancelled = False
+
+
+class FairQueue:
+    """
+    Weighted fair queue in front of `slots` concurrent model calls.
+
+    Each request gets a virtual finish tag of
+    max(virtual time, client's previous tag) + cost / weight, and a freed slot
+    goes to the waiter with the smallest tag. A client sending many requests
+    therefore only delays its own queue, while a light client's request is
+    served after at most one request from each other backlogged client. When
+    the queue is full, a newcomer pushes out the waiter with the latest tag if
+    its own tag is earlier, so the heaviest client is the one turned away.
+    """
+
+    def __init__(
+        self, slots: int, max_depth: int = 64, max_wait: float = 10.0
+    ) -> None:
+        self.slots: int = slots
+        self.max_depth: int = max_depth
+        self.max_wait: float = max_wait
+        self._free: int = slots
+        self._heap: List[tuple] = []
+        self._waiting: int = 0
+        self._virtual: float = 0.0
+        self._finish: Dict[str, float] = {}
+        self._counter = itertools.count()
+        # moving average of how long a slot is held, for Retry-After hints
+        self._service_time: float = 1.0
+        self._cond = threading.Condition()
+
+    @property
+    def depth(self) -> int:
+        """Number of requests waiting for a slot."""
+        return self._waiting
+
+    def _retry_after(self) -> float:
+        return max(1.0, (self._waiting + 1) * self._service_time / self.slots)
+
+    def _withdraw(self, waiter: _Waiter) -> None:
+        waiter.cancelled = True
+        self._waiting -= 1
+        # give back the share of virtual time the request claimed
+        if self._finish.get(waiter.client) == waiter.finish:
+            self._finish[waiter.client] = waiter.previous
+
+    def _make_room(self, finish: float) -> bool:
+        latest = max(
+            (entry for entry in self._heap if not entry[2].cancelled),
+            key=lambda entry: entry[0],
+            default=None,
+        )
+        if latest is None or latest[0] <= finish:
+            return False
+        self._withdraw(latest[2])
+        self._cond.notify_all()
+        return True
+
+    def acquire(self, client: str, cost: float = 1.0, weight: float = 1.0) -> float:
+        """
+        Waits for a slot and returns how long that took. Raises Overloaded if
+        the queue is full or no slot frees up within `max_wait` seconds.
+        """
+        arrived = time.monotonic()
+        with self._cond:
+            previous = self._finish.get(client, 0.0)
+            start = max(self._virtual, previous)
+            if self._free > 0 and not self._waiting:
+                self._free -= 1
+                self._virtual = start
+                self._finish[client] = start + cost / weight
+                return 0.0
+            finish = start + cost / weight
+            if self._waiting >= self.max_depth and not self._make_room(finish):
+                raise Overloaded("Model queue is full", self._retry_after())
+
+            waiter = _Waiter(client, start, finish, previous)
+            self._finish[client] = waiter.finish
+            heapq.heappush(self._heap, (waiter.finish, next(self._counter), waiter))
+            self._waiting += 1
+            deadline = arrived + self.max_wait
+            while not waiter.granted:
+                if waiter.cancelled:
+                    raise Overloaded("Model queue is full", self._retry_after())
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._withdraw(waiter)
+                    raise Overloaded(
+                        "Timed out waiting for the model", self._retry_after()
+                    )
+                self._cond.wait(remaining)
+            return time.monotonic() - arrived
+
+    def release(self, held: Optional[float] = None) -> None:
+        """Frees a slot, handing it to the next waiter by finish tag."""
+        with self._cond:
+            if held is not None:
+                self._service_time += 0.1 * (held - self._service_time)
+            while self._heap:
+                _, _, waiter = heapq.heappop(self._heap)
+                if waiter.cancelled:
+                    continue
+                waiter.granted = True
+                self._waiting -= 1
+                self._virtual = waiter.start
+                self._cond.notify_all()
+                return
+            self._free += 1
+            # once idle, tags at or behind virtual time carry no information
+            if len(self._finish) > 4 * self.max_depth:
+                self._finish = {
+                    c: f for c, f in self._finish.items() if f > self._virtual
+                }
@@ -0,0 +1,57 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+class TokenBucket:
+    """Allows `rate` requests per second on average, in bursts of up to `burst`."""
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate: float = rate
+        self.burst: float = burst
+        self.tokens: float = burst
+        self.updated: float = time.monotonic()
+
+    def take(self, cost: float = 1.0, now: Optional[float] = None) -> float:
+        """
+        Takes `cost` tokens. Returns 0 on success, otherwise the seconds until
+        enough tokens will have accumulated (nothing is taken in that case).
+
+        A cost above `burst` is let through once the bucket is full and leaves
+        it in debt, so it is still charged in full.
+        """
+        now = time.monotonic() if now is None else now
+        needed = min(cost, self.burst)
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= needed:
+            self.tokens -= cost
+            return 0.0
+        return (needed - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """
+    One TokenBucket per client. Only the `max_clients` most recently seen
+    clients are tracked; a forgotten client simply starts with a full bucket.
+    """
+
+    def __init__(self, rate: float, burst: float, max_clients: int = 10000) -> None:
+        self.rate: float = rate
+        self.burst: float = burst
+        self.max_clients: int = max_clients
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, client: str, cost: float = 1.0) -> float:
+        """Like TokenBucket.take, for `client`'s bucket."""
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = self._buckets[client] = TokenBucket(self.rate, self.burst)
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(client)
+            return bucket.take(cost)
@@ -1,13 +1,36 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, session, stream_with_context
+from carbon_scanner.admission import AdmissionController, FairQueue, Overloaded, RateLimiter
 from carbon_scanner.authentication.auth_manager import AuthManager
-from carbon_scanner.genai.gemini_handler import text_resp, image_resp, reciept_resp
+from carbon_scanner.genai.gemini_handler import (
+    text_resp,
+    text_resp_stream,
+    image_resp,
+    reciept_resp,
+    reciept_events,
+    RECIEPT_MODES,
+)
+from carbon_scanner.genai.batch import reciept_batch
+from carbon_scanner.genai.routing import REQUEST_TIERS
+from carbon_scanner.genai.footprint import LineItem, parse_line_item, score_batch, score_items
 from carbon_scanner.database.db_manager import DatabaseManager
 from carbon_scanner.database.sqllite_manager import insert_user, get_coins, inc_coins
-from PIL import Image
 from carbon_scanner.config import config
-from carbon_scanner.images import ImageUploader
+from carbon_scanner.images import (
+    ImageUploader,
+    InvalidImage,
+    load_prepared,
+    preprocess_image,
+)
+from carbon_scanner.jobs import Job, JobQueue, WorkerPool
+from carbon_scanner.metrics import REQUEST_LATENCY, UPLOADED_BYTES, registry
 from flask_cors import CORS, cross_origin
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 import os
+import json
+import math
+import time
+from contextlib import ExitStack
+from functools import wraps
 from werkzeug.utils import secure_filename
 from flask_login import login_required, current_user
 
@@ -32,8 +55,155 @@ def allowed_file(filename):
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request(response):
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    start = g.get("request_start")
+    if start is not None:
+        REQUEST_LATENCY.labels(request.method, route, response.status_code).observe(
+            time.perf_counter() - start
+        )
+    if request.content_length:
+        UPLOADED_BYTES.labels(route).inc(request.content_length)
+    return response
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+
+def event_stream(events):
+    """Wraps (event name, data) pairs as a server-sent event response."""
+
+    def generate():
+        try:
+            for event, data in events:
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 auth_manager = AuthManager(app)
 
+# Per client rate limits and a fair share of the model call slots
+admission = AdmissionController(
+    RateLimiter(config.ADMISSION_RATE, config.ADMISSION_BURST),
+    FairQueue(
+        config.ADMISSION_SLOTS,
+        max_depth=config.ADMISSION_MAX_QUEUE,
+        max_wait=config.ADMISSION_MAX_WAIT,
+    ),
+)
+
+
+def admission_client():
+    # the logged in user, otherwise the client address
+    return session.get("_user_id") or request.remote_addr or "anonymous"
+
+
+def admitted(cost=1.0, slot=True):
+    """
+    Runs the view under admission control, answering 429 when overloaded.
+
+    `cost` is a number of requests, or a function of the request returning
+    one. A streamed response keeps its model slot until the stream closes.
+    With `slot=False` only the rate limit is charged, for views that take
+    model slots themselves.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            client = admission_client()
+            charged = cost() if callable(cost) else cost
+            admission_slot = ExitStack()
+            try:
+                if slot:
+                    admission_slot.enter_context(admission.admit(client, charged))
+                else:
+                    admission.charge(client, charged)
+            except Overloaded as e:
+                return (
+                    jsonify({"error": str(e)}),
+                    429,
+                    {"Retry-After": str(math.ceil(e.retry_after))},
+                )
+            try:
+                response = app.make_response(view(*args, **kwargs))
+            except BaseException:
+                admission_slot.close()
+                raise
+            if response.is_streamed:
+                response.call_on_close(admission_slot.close)
+            else:
+                admission_slot.close()
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def batch_cost():
+    # each reciept in the batch costs as much as one /genai/reciept request,
+    # an oversized batch is refused with 413 and costs nothing
+    images = len(request.files.getlist("images"))
+    return 2.0 * images if images <= config.BATCH_MAX_IMAGES else 0.0
+
+
+def tier_error(tier):
+    """The 400 response for an unknown model tier, None if it is valid."""
+    if tier and tier not in REQUEST_TIERS:
+        return jsonify({"error": f"tier must be one of {', '.join(REQUEST_TIERS)}"}), 400
+    return None
+
+
+def prepare_upload(data: bytes):
+    """Preprocesses an upload for the model, or returns None if it is unreadable."""
+    try:
+        prepared = preprocess_image(data)
+    except InvalidImage as e:
+        app.logger.info("rejected upload: %s", e)
+        return None
+    app.logger.info("preprocessed upload: %s", prepared.report.as_dict())
+    return prepared
+
+
+def run_reciept_job(job: Job) -> str:
+    # the payload was prepared on submit, preprocessing it again would re-encode
+    # it and change the reciept cache key
+    return reciept_resp(
+        load_prepared(job.payload),
+        job.options.get("mode"),
+        tier=job.options.get("tier"),
+    )
+
+
+# Durable queue for reciepts submitted with async=true
+job_queue = JobQueue(
+    config.JOB_DB_PATH,
+    visibility_timeout=config.JOB_VISIBILITY_TIMEOUT,
+    max_attempts=config.JOB_MAX_ATTEMPTS,
+    retry_delay=config.JOB_RETRY_DELAY,
+    retention=config.JOB_RETENTION,
+)
+job_workers = WorkerPool(
+    job_queue, run_reciept_job, workers=config.JOB_WORKERS, permanent=(InvalidImage,)
+)
+job_workers.start()
+
 
 @app.route("/auth/register", methods=["POST"])
 async def register():
@@ -69,30 +239,162 @@ def logout():
 
 
 @app.route("/genai/text", methods=["POST"])
+@admitted()
 def genai_text():
     prompt = request.json.get("prompt", "")
-    response = text_resp(prompt)
+    tier = request.json.get("tier")
+    error = tier_error(tier)
+    if error:
+        return error
+    response = text_resp(prompt, tier)
     return jsonify({"response": response})
 
 
+@app.route("/genai/text/stream", methods=["POST"])
+@admitted()
+def genai_text_stream():
+    prompt = request.json.get("prompt", "")
+    tier = request.json.get("tier")
+    error = tier_error(tier)
+    if error:
+        return error
+
+    def events():
+        for chunk in text_resp_stream(prompt, tier):
+            yield "chunk", {"text": chunk}
+        yield "done", {}
+
+    return event_stream(events())
+
+
 @app.route("/genai/image", methods=["POST"])
+@admitted()
 def genai_image():
     file = request.files.get("image")
     prompt = request.form.get("prompt", "")
     if not file:
         return jsonify({"error": "No image provided"}), 400
-    image_file = Image.open(file)
-    return jsonify({"response": image_resp(prompt, image_file)})
+    tier = request.form.get("tier")
+    error = tier_error(tier)
+    if error:
+        return error
+    prepared = prepare_upload(file.read())
+    if prepared is None:
+        return jsonify({"error": "Unreadable image"}), 400
+    return jsonify({"response": image_resp(prompt, prepared, tier=tier)})
 
 
 @app.route("/genai/reciept", methods=["POST"])
+@admitted(cost=2.0)
 def genai_reciept():
-    print(f"i have recieved a reciept : {request.files}")
     file = request.files.get("image")
     if not file:
         return jsonify({"error": "No image provided"}), 400
-    image_file = Image.open(file)
-    return jsonify({"response": reciept_resp(image_file)})
+    mode = request.form.get("mode")
+    if mode and mode not in RECIEPT_MODES:
+        return jsonify({"error": f"mode must be one of {', '.join(RECIEPT_MODES)}"}), 400
+    tier = request.form.get("tier")
+    error = tier_error(tier)
+    if error:
+        return error
+    prepared = prepare_upload(file.read())
+    if prepared is None:
+        return jsonify({"error": "Unreadable image"}), 400
+    if request.values.get("async", "").lower() in ("1", "true", "yes"):
+        # queues the already prepared bytes, a job never sees an unreadable upload
+        job_id = job_queue.submit(prepared.data, {"mode": mode, "tier": tier})
+        job_workers.notify()
+        return (
+            jsonify({"job_id": job_id, "status": "queued"}),
+            202,
+            {"Location": f"/genai/jobs/{job_id}"},
+        )
+    return jsonify({"response": reciept_resp(prepared, mode, tier=tier)})
+
+
+@app.route("/genai/jobs/<job_id>", methods=["GET"])
+def genai_job(job_id):
+    job = job_queue.get(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+
+@app.route("/genai/reciept/stream", methods=["POST"])
+@admitted(cost=2.0)
+def genai_reciept_stream():
+    file = request.files.get("image")
+    if not file:
+        return jsonify({"error": "No image provided"}), 400
+    mode = request.form.get("mode")
+    if mode and mode not in RECIEPT_MODES:
+        return jsonify({"error": f"mode must be one of {', '.join(RECIEPT_MODES)}"}), 400
+    tier = request.form.get("tier")
+    error = tier_error(tier)
+    if error:
+        return error
+    prepared = prepare_upload(file.read())
+    if prepared is None:
+        return jsonify({"error": "Unreadable image"}), 400
+
+    def events():
+        yield "stage", {"stage": "preprocessing"}
+        for event in reciept_events(prepared, mode, tier=tier):
+            yield event.pop("event"), event
+
+    return event_stream(events())
+
+
+@app.route("/genai/reciept/batch", methods=["POST"])
+# each reciept takes its own model slot while it runs, see reciept_batch
+@admitted(cost=batch_cost, slot=False)
+def genai_reciept_batch():
+    files = request.files.getlist("images")
+    if not files:
+        return jsonify({"error": "No images provided"}), 400
+    if len(files) > config.BATCH_MAX_IMAGES:
+        return (
+            jsonify({"error": f"At most {config.BATCH_MAX_IMAGES} images per batch"}),
+            413,
+        )
+    mode = request.form.get("mode")
+    if mode and mode not in RECIEPT_MODES:
+        return jsonify({"error": f"mode must be one of {', '.join(RECIEPT_MODES)}"}), 400
+    tier = request.form.get("tier")
+    error = tier_error(tier)
+    if error:
+        return error
+    uploads = [(file.filename, file.read()) for file in files]
+    client = admission_client()
+
+    def generate():
+        def admit():
+            return admission.slot(client, 2.0)
+
+        for result in reciept_batch(uploads, mode, tier, admit):
+            yield json.dumps(result) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
+def _line_items(entries):
+    return [
+        parse_line_item(entry)
+        if isinstance(entry, str)
+        else LineItem(entry["name"], float(entry.get("quantity", 1)), entry.get("unit", "kg"))
+        for entry in entries
+    ]
+
+
+@app.route("/genai/footprint", methods=["POST"])
+def genai_footprint():
+    data = request.get_json()
+    try:
+        if "reciepts" in data:
+            return jsonify({"reciepts": score_batch([_line_items(r) for r in data["reciepts"]])})
+        return jsonify(score_items(_line_items(data.get("items", []))))
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid line items: {e}"}), 400
 
 
 @app.route("/db/prompts", methods=["POST"])
@@ -105,6 +407,36 @@ async def store_prompt():
     return jsonify({"message": "Prompt stored"}), 201
 
 
+# Largest page GET /db/prompts returns, whatever `limit` asks for
+MAX_PROMPT_PAGE = 200
+
+
+@app.route("/db/prompts", methods=["GET"])
+async def list_prompts():
+    # the user is named by the request, as POST /db/prompts does
+    try:
+        user_id = int(request.args["user_id"])
+        after = int(request.args.get("cursor") or 0)
+        limit = min(int(request.args.get("limit", 50)), MAX_PROMPT_PAGE)
+    except KeyError:
+        return jsonify({"error": "user_id is required"}), 400
+    except ValueError:
+        return jsonify({"error": "user_id, cursor and limit must be integers"}), 400
+    if after < 0 or limit < 1:
+        return jsonify({"error": "cursor and limit must be positive"}), 400
+    page = await db_manager.get_prompts_page(user_id, after, limit)
+    return jsonify(
+        {
+            "prompts": [
+                {"id": id, "prompt": prompt, "context": context}
+                for id, prompt, context in page
+            ],
+            # keyset cursor: the last id seen, absent once the history is exhausted
+            "next_cursor": str(page[-1][0]) if len(page) == limit else None,
+        }
+    )
+
+
 @app.route("/db/coinsget", methods=["POST"])
 async def get_prompts():
     data = request.get_json()
@@ -118,7 +450,9 @@ async def update_coins():
     data = request.get_json()
     #user = await auth_manager.login(data.get("email"), data.get("password"))
     if coins := data.get("coins"):
-        inc_coins(data.get("email"), coins)
+        key = request.headers.get("Idempotency-Key") or data.get("idempotency_key")
+        if (balance := inc_coins(data.get("email"), coins, key)) is not None:
+            return jsonify({"coins": balance})
 #        result = await db_manager.update_coins_by_id(user_id=user.id, amount=coins)
 #        return (
 #            (jsonify({"message": "Coins updated"}), 201)
@@ -127,7 +461,6 @@ async def update_coins():
 #        )
 #
 #    coins = await db_manager.get_coins_by_id(user.id)
-    print("HELLLL YEA3")
     return jsonify({"coins": get_coins(data.get("email"))})
 
 
@@ -0,0 +1,112 @@
+"""
+Measures the per-request database overhead of DatabaseManager, before and
+after the persistent connection pool.
+
+    python -m carbon_scanner.benchmarks.db --requests 500
+
+Each request runs on its own event loop, as Flask runs async views, and
+does one get_coins_by_id. "connect_per_request" replays what the old
+before_request/teardown hooks did: connect, create the tables, commit, run
+the query and close. "pool" borrows a connection from the worker's pool.
+Overhead is the latency on top of the query alone on a held connection.
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from typing import Any, Callable, Dict
+import aiosqlite
+import numpy as np
+
+
+def percentiles(latencies: np.ndarray) -> Dict[str, float]:
+    p50, p95, p99 = (np.percentile(latencies, [50, 95, 99]) * 1000).tolist()
+    return {"p50_ms": round(p50, 3), "p95_ms": round(p95, 3), "p99_ms": round(p99, 3)}
+
+
+def measure(request: Callable[[], Any], requests: int) -> np.ndarray:
+    latencies = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        asyncio.run(request())
+        latencies.append(time.perf_counter() - start)
+    return np.array(latencies)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = os.path.join(
+        tempfile.mkdtemp(prefix="carbon_scanner_bench_"), "app.db"
+    )
+    from carbon_scanner.database.db_manager import DatabaseManager, get_pool
+    from carbon_scanner.database.migrations import APP_MIGRATIONS
+
+    db = DatabaseManager()
+    pool = get_pool(db.db_url)
+    tables = [sql for _, _, statements in APP_MIGRATIONS for sql in statements]
+
+    async def seed() -> int:
+        await db.create_user(
+            {
+                "email": "bench@example.com",
+                "password_hash": "",
+                "password_salt": "",
+                "created_at": time.time(),
+            }
+        )
+        return (await db.get_user_by_email("bench@example.com"))["id"]
+
+    user_id = asyncio.run(seed())
+
+    async def connect_per_request() -> None:
+        conn = await aiosqlite.connect(db.db_url)
+        try:
+            for statement in tables:
+                await conn.execute(statement)
+            await conn.commit()
+            cursor = await conn.execute(
+                "SELECT coins FROM users WHERE id = ?", (user_id,)
+            )
+            await cursor.fetchone()
+        finally:
+            await conn.close()
+
+    async def pooled() -> None:
+        await db.get_coins_by_id(user_id)
+
+    held: Dict[str, aiosqlite.Connection] = {}
+
+    async def query_only() -> None:
+        if "conn" not in held:
+            held["conn"] = await aiosqlite.connect(db.db_url)
+        cursor = await held["conn"].execute(
+            "SELECT coins FROM users WHERE id = ?", (user_id,)
+        )
+        await cursor.fetchone()
+
+    baseline = measure(query_only, args.requests)
+    report: Dict[str, Any] = {"config": vars(args), "query_only": percentiles(baseline)}
+    for name, request in {
+        "connect_per_request": connect_per_request,
+        "pool": pooled,
+    }.items():
+        latencies = measure(request, args.requests)
+        result = percentiles(latencies)
+        result["overhead_p50_ms"] = round(
+            (np.median(latencies) - np.median(baseline)) * 1000, 3
+        )
+        report[name] = result
+    asyncio.run(held["conn"].close())
+    asyncio.run(pool.close())
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
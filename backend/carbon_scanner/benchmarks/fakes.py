@@ -0,0 +1,246 @@
+"""
+In-process stand-ins for the Gemini SDK model and the LangChain chat model
+and embeddings, with configurable latency and failure rates.
+
+install_fakes() must run before carbon_scanner.app (or anything importing
+carbon_scanner.genai) is imported.
+"""
+import asyncio
+import hashlib
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Iterator, List, Optional
+from google.api_core.exceptions import ServiceUnavailable
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+GROCERIES = [
+    "Beef", "Milk", "Rice", "Coffee", "Bananas", "Cheese", "Eggs", "Tomatoes",
+    "Chicken breast", "Bread", "Olive oil", "Quinoa", "Almond milk", "Avocado",
+    "Tofu", "Oat milk", "Pasta", "Salmon", "Potatoes", "Dark chocolate",
+]
+
+
+@dataclass
+class LatencyDistribution:
+    """
+    Latency in seconds, parsed from "constant:0.2", "uniform:0.1:0.5" or
+    "lognormal:<median>:<sigma>".
+    """
+
+    kind: str = "constant"
+    a: float = 0.0
+    b: float = 0.0
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyDistribution":
+        kind, *params = spec.split(":")
+        values = [float(p) for p in params] + [0.0, 0.0]
+        return cls(kind, values[0], values[1])
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "uniform":
+            return rng.uniform(self.a, self.b)
+        if self.kind == "lognormal":
+            return self.a * rng.lognormvariate(0.0, self.b)
+        return self.a
+
+
+class FakeFailure(ServiceUnavailable):
+    pass
+
+
+class _Behaviour:
+    """Shared latency and failure injection, thread safe."""
+
+    def __init__(
+        self, latency: LatencyDistribution, failure_rate: float, seed: int
+    ) -> None:
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.calls = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw(self) -> float:
+        with self._lock:
+            self.calls += 1
+            if self._rng.random() < self.failure_rate:
+                raise FakeFailure("injected upstream failure")
+            return self.latency.sample(self._rng)
+
+
+def _items_in(text: str) -> List[str]:
+    match = re.search(r"in this list\? (.*)", text, re.S)
+    if not match:
+        return []
+    return [i.strip() for i in match.group(1).split("\n")[0].split(",") if i.strip()]
+
+
+def _estimates(items: List[str]) -> str:
+    return "{" + ", ".join(
+        f'"{item}": [{len(item) % 7 + 0.5}, 0.8]' for item in items
+    ) + "}"
+
+
+def gemini_reply(contents: Any) -> str:
+    """Plausible answers for each kind of prompt carbon_scanner sends Gemini."""
+    parts = contents if isinstance(contents, list) else [contents]
+    prompt = str(parts[0])
+    image = parts[1] if len(parts) > 1 else b""
+    image = image["data"] if isinstance(image, dict) else repr(image).encode()
+    # the same reciept always "contains" the same items
+    items = random.Random(hashlib.sha256(image).digest()).sample(GROCERIES, 6)
+    if "kg CO2 equivalent" in prompt:
+        return _estimates(items)
+    if "comma seperated list" in prompt:
+        return ", ".join(items)
+    return "Beef has one of the highest footprints of any food, mostly from methane. " * 4
+
+
+# latency and failure injection for each fake, replaced by install_fakes()
+behaviours = {
+    "model": _Behaviour(LatencyDistribution(), 0.0, 0),
+    "llm": _Behaviour(LatencyDistribution(), 0.0, 1),
+    "embeddings": _Behaviour(LatencyDistribution(), 0.0, 2),
+}
+
+
+def set_behaviour(
+    fake: str, latency: LatencyDistribution, failure_rate: float = 0.0, seed: int = 0
+) -> None:
+    """Sets the latency and failure rate of "model", "llm" or "embeddings"."""
+    behaviours[fake] = _Behaviour(latency, failure_rate, seed)
+
+
+class FakeGenerativeModel:
+    """Stand-in for google.generativeai.GenerativeModel."""
+
+    def __init__(self, model_name: str = "fake", **_: Any) -> None:
+        self.model_name = model_name
+
+    @staticmethod
+    def _response(text: str) -> SimpleNamespace:
+        usage = SimpleNamespace(
+            prompt_token_count=258, candidates_token_count=len(text) // 4
+        )
+        return SimpleNamespace(text=text, usage_metadata=usage)
+
+    def generate_content(self, contents: Any, stream: bool = False, **_: Any) -> Any:
+        time.sleep(behaviours["model"].draw())
+        response = self._response(gemini_reply(contents))
+        return iter([response]) if stream else response
+
+    async def generate_content_async(
+        self, contents: Any, stream: bool = False, **_: Any
+    ) -> Any:
+        await asyncio.sleep(behaviours["model"].draw())
+        text = gemini_reply(contents)
+        if not stream:
+            return self._response(text)
+
+        async def chunks() -> AsyncIterator[SimpleNamespace]:
+            for i in range(0, len(text), 24):
+                await asyncio.sleep(0)
+                yield SimpleNamespace(text=text[i : i + 24])
+
+        return chunks()
+
+
+class FakeChatModel(BaseChatModel):
+    """Stand-in for langchain_google_genai.ChatGoogleGenerativeAI."""
+
+    model: str = "fake"
+    temperature: float = 0.0
+    max_retries: int = 1
+    timeout: Optional[float] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-gemini"
+
+    def _reply(self, messages: List[BaseMessage]) -> str:
+        time.sleep(behaviours["llm"].draw())
+        return _estimates(_items_in(str(messages[-1].content)))
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **_: Any,
+    ) -> ChatResult:
+        message = AIMessage(content=self._reply(messages))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **_: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        text = self._reply(messages)
+        for i in range(0, len(text), 24):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=text[i : i + 24]))
+
+
+class FakeEmbeddings(Embeddings):
+    """Deterministic hash embeddings standing in for GoogleGenerativeAIEmbeddings."""
+
+    def __init__(self, model: str = "fake", size: int = 64, **_: Any) -> None:
+        self.size = size
+
+    def _embed(self, text: str) -> List[float]:
+        rng = random.Random(hashlib.sha256(text.encode()).digest())
+        return [rng.gauss(0, 1) for _ in range(self.size)]
+
+    def embed_documents(self, texts: List[str], **_: Any) -> List[List[float]]:
+        time.sleep(behaviours["embeddings"].draw())
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(behaviours["embeddings"].draw())
+        return self._embed(text)
+
+
+def install_fakes(
+    model_latency: LatencyDistribution,
+    llm_latency: LatencyDistribution,
+    embed_latency: LatencyDistribution,
+    failure_rate: float = 0.0,
+    seed: int = 0,
+) -> str:
+    """
+    Swaps the real model clients for fakes and points every database and
+    cache at a fresh scratch directory, which is returned.
+    """
+    import google.generativeai
+    import langchain_google_genai
+
+    set_behaviour("model", model_latency, failure_rate, seed)
+    set_behaviour("llm", llm_latency, failure_rate, seed + 1)
+    set_behaviour("embeddings", embed_latency, 0.0, seed + 2)
+    google.generativeai.GenerativeModel = FakeGenerativeModel
+    langchain_google_genai.ChatGoogleGenerativeAI = FakeChatModel
+    langchain_google_genai.GoogleGenerativeAIEmbeddings = FakeEmbeddings
+
+    workdir = tempfile.mkdtemp(prefix="carbon_scanner_bench_")
+    for key in ("GEMINI_API_KEY", "GOOGLE_API_KEY"):
+        os.environ.setdefault(key, "fake")
+    os.environ["DATABASE_URL"] = os.path.join(workdir, "app.db")
+    os.environ["RESULT_CACHE_PATH"] = os.path.join(workdir, "cache.db")
+    os.environ["JOB_DB_PATH"] = os.path.join(workdir, "jobs.db")
+    os.environ["RAG_INDEX_DIR"] = os.path.join(workdir, "rag")
+    os.environ["FACTOR_STORE_DIR"] = os.path.join(workdir, "factors")
+    # sqllite_manager opens carbon.db relative to the working directory
+    os.chdir(workdir)
+    return workdir
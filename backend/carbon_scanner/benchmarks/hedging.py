@@ -0,0 +1,149 @@
+"""
+Measures what retries and hedging buy on a long tailed fake model, for both
+the Gemini client (image_resp/text_resp) and the LangChain LLM stream.
+
+    python -m carbon_scanner.benchmarks.hedging --requests 400 \
+        --latency lognormal:0.1:0.8 --failure-rate 0.02
+
+For each policy it reports p50/p95/p99 latency, failures and the extra
+upstream calls spent, relative to a single attempt without hedging.
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+import numpy as np
+from carbon_scanner.benchmarks import fakes
+from carbon_scanner.benchmarks.fakes import (
+    FakeChatModel,
+    FakeGenerativeModel,
+    LatencyDistribution,
+    install_fakes,
+)
+
+POLICIES = {
+    "single": (1, None),
+    "retry": (3, None),
+    "hedge": (1, 95.0),
+    "retry+hedge": (3, 95.0),
+}
+
+
+def measure(
+    call: Callable[[int], Any], requests: int, concurrency: int
+) -> Dict[str, Any]:
+    def timed(i: int) -> Optional[float]:
+        start = time.perf_counter()
+        try:
+            call(i)
+        except Exception:
+            return None
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(timed, range(requests)))
+    latencies = np.array([r for r in results if r is not None]) * 1000
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]).tolist()
+    return {
+        "p50_ms": round(p50, 1),
+        "p95_ms": round(p95, 1),
+        "p99_ms": round(p99, 1),
+        "failures": results.count(None),
+    }
+
+
+def gemini_client(
+    attempts: int, percentile: Optional[float], min_delay: float, deadline: float
+) -> Dict[str, Any]:
+    from carbon_scanner.genai.async_client import AsyncGeminiClient, GeminiBackend
+    from carbon_scanner.genai.resilience import Deadline, HedgePolicy, RetryPolicy
+
+    hedge = HedgePolicy(percentile, min_delay) if percentile else None
+    client = AsyncGeminiClient(
+        GeminiBackend(FakeGenerativeModel()),
+        max_concurrency=64,
+        timeout=deadline,
+        retry=RetryPolicy(attempts, base_delay=0.05, max_delay=0.5),
+        hedge=hedge,
+    )
+    return {
+        "call": lambda i: client.generate(f"prompt {i}", deadline=Deadline(deadline)),
+        "extra": lambda: dict(client.extra_calls),
+    }
+
+
+def langchain_llm(
+    attempts: int, percentile: Optional[float], min_delay: float, deadline: float
+) -> Dict[str, Any]:
+    from carbon_scanner.genai.resilience import (
+        Deadline,
+        HedgePolicy,
+        LatencyTracker,
+        RetryPolicy,
+        hedged_stream,
+    )
+
+    llm = FakeChatModel()
+    retry = RetryPolicy(attempts, base_delay=0.05, max_delay=0.5)
+    hedge = HedgePolicy(percentile, min_delay) if percentile else None
+    tracker = LatencyTracker()
+    extra = {"hedge": 0, "retry": 0}
+
+    def on_extra(kind: str) -> None:
+        extra[kind] += 1
+
+    def call(i: int) -> str:
+        question = f"carbon footprint for each item in this list? Beef, Rice {i}"
+        chunks = hedged_stream(
+            lambda: llm.stream(question),
+            Deadline(deadline),
+            retry,
+            hedge,
+            tracker,
+            on_extra,
+        )
+        return "".join(chunk.content for chunk in chunks)
+
+    return {"call": call, "extra": lambda: dict(extra)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", default="lognormal:0.1:0.8")
+    parser.add_argument("--failure-rate", type=float, default=0.02)
+    parser.add_argument("--hedge-min-delay", type=float, default=0.2)
+    parser.add_argument("--deadline", type=float, default=10.0)
+    args = parser.parse_args()
+
+    latency = LatencyDistribution.parse(args.latency)
+    # the genai package builds its model clients on import
+    install_fakes(latency, latency, LatencyDistribution())
+    report: Dict[str, Any] = {"config": vars(args)}
+    for name, (fake, build) in {
+        "gemini_client": ("model", gemini_client),
+        "langchain_llm": ("llm", langchain_llm),
+    }.items():
+        results: Dict[str, Any] = {}
+        for policy, (attempts, percentile) in POLICIES.items():
+            fakes.set_behaviour(fake, latency, args.failure_rate, seed=1)
+            target = build(attempts, percentile, args.hedge_min_delay, args.deadline)
+            result = measure(target["call"], args.requests, args.concurrency)
+            calls = fakes.behaviours[fake].calls
+            result["upstream_calls"] = calls
+            result["extra_calls"] = target["extra"]()
+            result["extra_call_rate"] = round(calls / args.requests - 1, 3)
+            results[policy] = result
+        baseline = results["single"]["p99_ms"]
+        for result in results.values():
+            result["p99_vs_single"] = round(result["p99_ms"] / baseline - 1, 3)
+        report[name] = results
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
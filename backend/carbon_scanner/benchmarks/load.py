@@ -0,0 +1,236 @@
+"""
+Offline load test of the Flask app. Gemini and the LangChain models are
+replaced by in-process fakes, so no API key or network is needed.
+
+    python -m carbon_scanner.benchmarks.load --rps 20 --duration 30 \
+        --model-latency lognormal:0.8:0.4 --out after.json --baseline before.json
+
+Requests are sent open loop at the target rate and latency is measured from
+each request's scheduled send time, so a saturated server shows up as queueing
+delay instead of a silently lower request rate.
+"""
+import argparse
+import asyncio
+import io
+import json
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
+from PIL import Image
+from carbon_scanner.benchmarks.fakes import LatencyDistribution, install_fakes
+
+ENDPOINTS = ("reciept", "text", "coins", "login")
+DEFAULT_MIX = "reciept:2,text:3,coins:4,login:1"
+USER_EMAIL = "load@example.com"
+USER_PASSWORD = "load-test-password"
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition(":")
+        if name not in ENDPOINTS:
+            raise ValueError(f"unknown endpoint {name!r}, expected one of {ENDPOINTS}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def reciept_png(seed: int) -> bytes:
+    """A small distinct image per request, so the result caches stay cold."""
+    rng = random.Random(seed)
+    image = Image.new("RGB", (320, 480), (250, 250, 250))
+    for y in range(20, 460, 24):
+        shade = rng.randrange(0, 120)
+        image.paste((shade, shade, shade), (20, y, 20 + rng.randrange(80, 280), y + 10))
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def seed_users() -> None:
+    from carbon_scanner.authentication.auth_manager import User
+    from carbon_scanner.database import sqllite_manager
+    from carbon_scanner.database.db_manager import DatabaseManager
+
+    sqllite_manager.insert_user(USER_EMAIL, 0)
+
+    async def create() -> None:
+        hashed_pw, salt = User.hash_password(USER_PASSWORD)
+        async with DatabaseManager() as db:
+            await db.create_user(
+                {
+                    "email": USER_EMAIL,
+                    "password_hash": hashed_pw,
+                    "password_salt": salt,
+                    "created_at": time.time(),
+                }
+            )
+
+    asyncio.run(create())
+
+
+def make_request(app: Any, endpoint: str, seq: int) -> int:
+    """Sends one request and returns its status code."""
+    client = app.test_client()
+    if endpoint == "reciept":
+        data = {"image": (io.BytesIO(reciept_png(seq)), f"reciept-{seq}.png")}
+        response = client.post("/genai/reciept", data=data)
+    elif endpoint == "text":
+        response = client.post(
+            "/genai/text", json={"prompt": f"How green is oat milk? ({seq})"}
+        )
+    elif endpoint == "coins":
+        response = client.post("/db/coins", json={"email": USER_EMAIL, "coins": 1})
+    else:
+        response = client.post(
+            "/auth/login", json={"email": USER_EMAIL, "password": USER_PASSWORD}
+        )
+    response.close()
+    return response.status_code
+
+
+def run_load(
+    send: Callable[[str, int], int],
+    mix: Dict[str, float],
+    rps: float,
+    duration: float,
+    concurrency: int,
+    seed: int = 0,
+) -> List[Tuple[str, float, Optional[int]]]:
+    """Returns (endpoint, latency seconds, status or None on exception) per request."""
+    rng = random.Random(seed)
+    names, weights = list(mix), list(mix.values())
+    results: List[Tuple[str, float, Optional[int]]] = []
+    lock = threading.Lock()
+
+    def fire(endpoint: str, seq: int, scheduled: float) -> None:
+        try:
+            status: Optional[int] = send(endpoint, seq)
+        except Exception:
+            status = None
+        latency = time.perf_counter() - scheduled
+        with lock:
+            results.append((endpoint, latency, status))
+
+    with ThreadPoolExecutor(concurrency, thread_name_prefix="load") as pool:
+        start = time.perf_counter()
+        for seq in range(int(rps * duration)):
+            scheduled = start + seq / rps
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            endpoint = rng.choices(names, weights)[0]
+            pool.submit(fire, endpoint, seq, scheduled)
+    return results
+
+
+def summarise(
+    results: List[Tuple[str, float, Optional[int]]], elapsed: float
+) -> Dict[str, Any]:
+    by_endpoint: Dict[str, List[Tuple[float, Optional[int]]]] = defaultdict(list)
+    for endpoint, latency, status in results:
+        by_endpoint[endpoint].append((latency, status))
+        by_endpoint["all"].append((latency, status))
+    report = {}
+    for endpoint, samples in sorted(by_endpoint.items()):
+        latencies = np.array([latency for latency, _ in samples]) * 1000
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99]).tolist()
+        errors = sum(1 for _, status in samples if status is None or status >= 500)
+        report[endpoint] = {
+            "requests": len(samples),
+            "throughput_rps": round(len(samples) / elapsed, 2),
+            "p50_ms": round(p50, 1),
+            "p95_ms": round(p95, 1),
+            "p99_ms": round(p99, 1),
+            "max_ms": round(float(latencies.max()), 1),
+            "error_rate": round(errors / len(samples), 4),
+            "status": dict(
+                Counter(str(status or "exception") for _, status in samples)
+            ),
+        }
+    return report
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any]) -> Dict[str, Any]:
+    """Relative change of each metric against a previous report."""
+    deltas: Dict[str, Any] = {}
+    for endpoint, metrics in report["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(endpoint)
+        if not before:
+            continue
+        deltas[endpoint] = {
+            key: round((metrics[key] - before[key]) / before[key], 3)
+            if before[key]
+            else None
+            for key in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms", "error_rate")
+        }
+    return deltas
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--rps", type=float, default=10.0, help="target request rate")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds")
+    parser.add_argument("--concurrency", type=int, default=64, help="client threads")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="endpoint:weight,...")
+    parser.add_argument("--model-latency", default="lognormal:0.8:0.4")
+    parser.add_argument("--llm-latency", default="lognormal:0.6:0.4")
+    parser.add_argument("--embed-latency", default="constant:0.05")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write the JSON report here as well")
+    parser.add_argument("--baseline", help="previous report to compare against")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    workdir = install_fakes(
+        LatencyDistribution.parse(args.model_latency),
+        LatencyDistribution.parse(args.llm_latency),
+        LatencyDistribution.parse(args.embed_latency),
+        args.failure_rate,
+        args.seed,
+    )
+    # Only import the app once the fakes are in place
+    from carbon_scanner.app import app
+    from carbon_scanner.benchmarks import fakes
+
+    app.logger.disabled = True
+    seed_users()
+
+    start = time.perf_counter()
+    results = run_load(
+        lambda endpoint, seq: make_request(app, endpoint, seq),
+        mix,
+        args.rps,
+        args.duration,
+        args.concurrency,
+        args.seed,
+    )
+    elapsed = time.perf_counter() - start
+
+    report: Dict[str, Any] = {
+        "config": {**vars(args), "workdir": workdir},
+        "elapsed_s": round(elapsed, 2),
+        "upstream_calls": {
+            name: behaviour.calls for name, behaviour in fakes.behaviours.items()
+        },
+        "endpoints": summarise(results, elapsed),
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["vs_baseline"] = compare(report, json.load(f))
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Compares latency and token cost of the two reciept pipeline modes against the
+real Gemini API.
+
+    python -m carbon_scanner.benchmarks.reciept_modes genai/reciept.png --runs 3
+"""
+import argparse
+import json
+import statistics
+import time
+from typing import Any, Dict, List
+from langchain_core.callbacks import get_usage_metadata_callback
+from carbon_scanner.genai import gemini_handler, lang_chain_process
+from carbon_scanner.genai.cache import TieredCache
+from carbon_scanner.images.preprocess import PreparedImage, preprocess_image
+
+PIPELINES = {
+    "two_stage": gemini_handler.reciept_two_stage,
+    "multimodal": gemini_handler.reciept_multimodal,
+}
+
+
+def gemini_usage() -> Dict[str, int]:
+    """Token counts summed over the fast and strong tier clients."""
+    usages = [client.backend.usage for client in gemini_handler.clients.values()]
+    return {key: sum(usage[key] for usage in usages) for key in usages[0]}
+
+
+def run_mode(mode: str, images: List[PreparedImage], runs: int) -> Dict[str, Any]:
+    pipeline = PIPELINES[mode]
+    latencies: List[float] = []
+    prompt_tokens = output_tokens = 0
+    for _ in range(runs):
+        for image in images:
+            before = gemini_usage()
+            with get_usage_metadata_callback() as callback:
+                start = time.perf_counter()
+                pipeline(image)
+                latencies.append(time.perf_counter() - start)
+            usage = gemini_usage()
+            prompt_tokens += usage["prompt_tokens"] - before["prompt_tokens"]
+            output_tokens += usage["output_tokens"] - before["output_tokens"]
+            for chain_usage in callback.usage_metadata.values():
+                prompt_tokens += chain_usage.get("input_tokens", 0)
+                output_tokens += chain_usage.get("output_tokens", 0)
+    calls = len(latencies)
+    return {
+        "mode": mode,
+        "reciepts": calls,
+        "latency_mean_s": round(statistics.mean(latencies), 3),
+        "latency_p50_s": round(statistics.median(latencies), 3),
+        "latency_max_s": round(max(latencies), 3),
+        "prompt_tokens_per_reciept": round(prompt_tokens / calls, 1),
+        "output_tokens_per_reciept": round(output_tokens / calls, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("images", nargs="+", help="reciept image files")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--modes", nargs="+", default=list(PIPELINES))
+    args = parser.parse_args()
+
+    images = []
+    for path in args.images:
+        with open(path, "rb") as f:
+            images.append(preprocess_image(f.read()))
+    # Measure cold estimates, not the per item cache
+    lang_chain_process.item_cache = TieredCache(":memory:", ttl=0)
+    results = [run_mode(mode, images, args.runs) for mode in args.modes]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
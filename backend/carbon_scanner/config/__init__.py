@@ -18,5 +18,228 @@ class Config:
     def SECRET_KEY(self) -> str:
         return os.getenv("SECRET_KEY", "")
 
+    @property
+    def RESULT_CACHE_PATH(self) -> str:
+        return os.getenv("RESULT_CACHE_PATH", "/tmp/carbon_scanner_cache.db")
+
+    @property
+    def RESULT_CACHE_SIZE(self) -> int:
+        return int(os.getenv("RESULT_CACHE_SIZE", "256"))
+
+    @property
+    def RESULT_CACHE_TTL(self) -> float:
+        return float(os.getenv("RESULT_CACHE_TTL", str(7 * 24 * 3600)))
+
+    # Rows each SQLite cache table keeps, oldest are evicted beyond it
+    @property
+    def RESULT_CACHE_MAX_ROWS(self) -> int:
+        return int(os.getenv("RESULT_CACHE_MAX_ROWS", "100000"))
+
+    @property
+    def GEMINI_MAX_CONCURRENCY(self) -> int:
+        return int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+
+    @property
+    def GEMINI_TIMEOUT(self) -> float:
+        return float(os.getenv("GEMINI_TIMEOUT", "60"))
+
+    @property
+    def BATCH_MAX_WORKERS(self) -> int:
+        return int(os.getenv("BATCH_MAX_WORKERS", "4"))
+
+    # Most images one /genai/reciept/batch request may upload
+    @property
+    def BATCH_MAX_IMAGES(self) -> int:
+        return int(os.getenv("BATCH_MAX_IMAGES", "20"))
+
+    @property
+    def IMAGE_MAX_EDGE(self) -> int:
+        return int(os.getenv("IMAGE_MAX_EDGE", "1600"))
+
+    @property
+    def IMAGE_JPEG_QUALITY(self) -> int:
+        return int(os.getenv("IMAGE_JPEG_QUALITY", "80"))
+
+    @property
+    def IMAGE_GRAYSCALE_MAX_SATURATION(self) -> float:
+        return float(os.getenv("IMAGE_GRAYSCALE_MAX_SATURATION", "24"))
+
+    @property
+    def RAG_INDEX_DIR(self) -> str:
+        return os.getenv("RAG_INDEX_DIR", "/tmp/carbon_scanner_rag")
+
+    # "hybrid" (BM25, embedding the query only when that is weak) or "vector"
+    @property
+    def RAG_RETRIEVER(self) -> str:
+        return os.getenv("RAG_RETRIEVER", "hybrid")
+
+    # Best BM25 score at which the hybrid retriever skips the embedding call
+    @property
+    def RAG_MIN_LEXICAL_SCORE(self) -> float:
+        return float(os.getenv("RAG_MIN_LEXICAL_SCORE", "3"))
+
+    # "per_item": top RAG_ITEM_K rows per reciept item, as one compact table;
+    # "query": the retriever's top chunks for the whole item list
+    @property
+    def RAG_CONTEXT(self) -> str:
+        return os.getenv("RAG_CONTEXT", "per_item")
+
+    @property
+    def RAG_ITEM_K(self) -> int:
+        return int(os.getenv("RAG_ITEM_K", "2"))
+
+    @property
+    def ITEM_CACHE_SIZE(self) -> int:
+        return int(os.getenv("ITEM_CACHE_SIZE", "4096"))
+
+    @property
+    def ITEM_CACHE_TTL(self) -> float:
+        return float(os.getenv("ITEM_CACHE_TTL", str(30 * 24 * 3600)))
+
+    @property
+    def RECIEPT_MODE(self) -> str:
+        return os.getenv("RECIEPT_MODE", "two_stage")
+
+    @property
+    def JOB_DB_PATH(self) -> str:
+        return os.getenv("JOB_DB_PATH", "/tmp/carbon_scanner_jobs.db")
+
+    @property
+    def JOB_WORKERS(self) -> int:
+        return int(os.getenv("JOB_WORKERS", "2"))
+
+    @property
+    def JOB_MAX_ATTEMPTS(self) -> int:
+        return int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+    @property
+    def JOB_VISIBILITY_TIMEOUT(self) -> float:
+        return float(os.getenv("JOB_VISIBILITY_TIMEOUT", "300"))
+
+    @property
+    def JOB_RETRY_DELAY(self) -> float:
+        return float(os.getenv("JOB_RETRY_DELAY", "5"))
+
+    # Seconds a finished job's status stays available before it is deleted
+    @property
+    def JOB_RETENTION(self) -> float:
+        return float(os.getenv("JOB_RETENTION", str(7 * 24 * 3600)))
+
+    @property
+    def ADMISSION_RATE(self) -> float:
+        return float(os.getenv("ADMISSION_RATE", "1"))
+
+    @property
+    def ADMISSION_BURST(self) -> float:
+        return float(os.getenv("ADMISSION_BURST", "10"))
+
+    @property
+    def ADMISSION_SLOTS(self) -> int:
+        return int(os.getenv("ADMISSION_SLOTS", str(self.GEMINI_MAX_CONCURRENCY)))
+
+    @property
+    def ADMISSION_MAX_QUEUE(self) -> int:
+        return int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+
+    @property
+    def ADMISSION_MAX_WAIT(self) -> float:
+        return float(os.getenv("ADMISSION_MAX_WAIT", "10"))
+
+    @property
+    def MODEL_ATTEMPTS(self) -> int:
+        return int(os.getenv("MODEL_ATTEMPTS", "3"))
+
+    @property
+    def MODEL_RETRY_BASE_DELAY(self) -> float:
+        return float(os.getenv("MODEL_RETRY_BASE_DELAY", "0.5"))
+
+    @property
+    def MODEL_RETRY_MAX_DELAY(self) -> float:
+        return float(os.getenv("MODEL_RETRY_MAX_DELAY", "8"))
+
+    # Hedge calls slower than this latency percentile, 0 disables hedging
+    @property
+    def MODEL_HEDGE_PERCENTILE(self) -> float:
+        return float(os.getenv("MODEL_HEDGE_PERCENTILE", "95"))
+
+    @property
+    def MODEL_HEDGE_MIN_DELAY(self) -> float:
+        return float(os.getenv("MODEL_HEDGE_MIN_DELAY", "2"))
+
+    @property
+    def RECIEPT_DEADLINE(self) -> float:
+        return float(os.getenv("RECIEPT_DEADLINE", "90"))
+
+    # Cosine similarity above which a /genai/text prompt reuses a cached answer
+    @property
+    def SEMANTIC_CACHE_THRESHOLD(self) -> float:
+        return float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.93"))
+
+    @property
+    def SEMANTIC_CACHE_SIZE(self) -> int:
+        return int(os.getenv("SEMANTIC_CACHE_SIZE", "2048"))
+
+    @property
+    def SEMANTIC_CACHE_TTL(self) -> float:
+        return float(os.getenv("SEMANTIC_CACHE_TTL", str(24 * 3600)))
+
+    @property
+    def FAST_MODEL(self) -> str:
+        return os.getenv("FAST_MODEL", "gemini-2.0-flash")
+
+    @property
+    def STRONG_MODEL(self) -> str:
+        return os.getenv("STRONG_MODEL", "gemini-2.5-pro")
+
+    # Prompts longer than this (characters) go to STRONG_MODEL, 0 disables
+    @property
+    def ROUTE_MAX_FAST_CHARS(self) -> int:
+        return int(os.getenv("ROUTE_MAX_FAST_CHARS", "4000"))
+
+    # Images larger than this (width * height) go to STRONG_MODEL, 0 disables
+    @property
+    def ROUTE_MAX_FAST_PIXELS(self) -> int:
+        return int(os.getenv("ROUTE_MAX_FAST_PIXELS", "2000000"))
+
+    # Fast model estimates below this confidence are re-asked of STRONG_MODEL
+    @property
+    def ESCALATION_CONFIDENCE(self) -> float:
+        return float(os.getenv("ESCALATION_CONFIDENCE", "0.5"))
+
+    # Number of recent fast model confidences the router averages
+    @property
+    def ROUTE_HISTORY(self) -> int:
+        return int(os.getenv("ROUTE_HISTORY", "50"))
+
+    # Compiled emissions datasets, see carbon_scanner.factors
+    @property
+    def FACTOR_STORE_DIR(self) -> str:
+        return os.getenv("FACTOR_STORE_DIR", "/tmp/carbon_scanner_factors")
+
+    # Seconds between checks for a newly compiled dataset version
+    @property
+    def FACTOR_RELOAD_INTERVAL(self) -> float:
+        return float(os.getenv("FACTOR_RELOAD_INTERVAL", "5"))
+
+    # SQLite file behind sqllite_manager, relative to the working directory
+    @property
+    def CARBON_DB_PATH(self) -> str:
+        return os.getenv("CARBON_DB_PATH", "carbon.db")
+
+    @property
+    def SQLITE_POOL_SIZE(self) -> int:
+        return int(os.getenv("SQLITE_POOL_SIZE", "8"))
+
+    # Seconds a statement waits for a locked database before failing
+    @property
+    def SQLITE_BUSY_TIMEOUT(self) -> float:
+        return float(os.getenv("SQLITE_BUSY_TIMEOUT", "5"))
+
+    # NORMAL is durable across application crashes in WAL mode, FULL also
+    # across power loss
+    @property
+    def SQLITE_SYNCHRONOUS(self) -> str:
+        return os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+
 
 config = Config()
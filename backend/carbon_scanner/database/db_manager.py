@@ -1,26 +1,90 @@
+import functools
+import threading
+import time
 import aiosqlite
 from carbon_scanner.config import config
+from carbon_scanner.database.migrations import migrate
+from carbon_scanner.database.sqlite_pool import AsyncSQLitePool
+from carbon_scanner.metrics import DB_QUERY_LATENCY, statement_kind
+from contextvars import ContextVar
 from datetime import datetime
-from typing import Optional, Dict, Any, List, Tuple, Union
-from flask import Flask, current_app
+from typing import AsyncIterator, Optional, Dict, Any, List, Tuple, Union
+from flask import Flask
 
 DATABASE_URL = config.DATABASE_URL
 
+# one pool per database file and worker process, shared by every request
+_pools: Dict[str, AsyncSQLitePool] = {}
+_pools_lock = threading.Lock()
+# connection lent to the running task, see _with_connection
+_connection: ContextVar[Optional[aiosqlite.Connection]] = ContextVar(
+    "db_connection", default=None
+)
+
+
+def get_pool(db_url: str = DATABASE_URL) -> AsyncSQLitePool:
+    """
+    Returns this worker's pool for `db_url`, creating it on first use.
+
+    Creating it applies any pending migrations, which is a no-op once the
+    deploy step has run them.
+    """
+    with _pools_lock:
+        pool = _pools.get(db_url)
+        if pool is None:
+            migrate(db_url)
+            pool = _pools[db_url] = AsyncSQLitePool(
+                db_url,
+                size=config.SQLITE_POOL_SIZE,
+                timeout=config.SQLITE_BUSY_TIMEOUT,
+                synchronous=config.SQLITE_SYNCHRONOUS,
+            )
+        return pool
+
+
+def _with_connection(method):
+    """Runs a method on a pooled connection, unless the task already holds one."""
+
+    @functools.wraps(method)
+    async def wrapper(self: "DatabaseManager", *args: Any, **kwargs: Any) -> Any:
+        if _connection.get() is not None:
+            return await method(self, *args, **kwargs)
+        async with self.pool.connection() as conn:
+            token = _connection.set(conn)
+            try:
+                return await method(self, *args, **kwargs)
+            finally:
+                _connection.reset(token)
+
+    return wrapper
+
 
 class DatabaseManager:
     def __init__(self, db_url: str = DATABASE_URL) -> None:
         self.db_url: str = db_url
-        self.conn: Optional[aiosqlite.Connection] = None
         self._app: Optional[Flask] = None
+        self._held: List[Tuple[Any, Any]] = []
+
+    @property
+    def pool(self) -> AsyncSQLitePool:
+        return get_pool(self.db_url)
+
+    @property
+    def conn(self) -> Optional[aiosqlite.Connection]:
+        """The connection the running task holds, if any."""
+        return _connection.get()
 
     async def __aenter__(self) -> "DatabaseManager":
-        self.conn = await aiosqlite.connect(self.db_url)
-        await self._initialize_tables()
+        # holds one pooled connection for the whole block
+        context = self.pool.connection()
+        token = _connection.set(await context.__aenter__())
+        self._held.append((context, token))
         return self
 
     async def __aexit__(self, exc_type: Any, exc_val: Any, exc_tb: Any) -> None:
-        if self.conn:
-            await self.conn.close()
+        context, token = self._held.pop()
+        _connection.reset(token)
+        await context.__aexit__(exc_type, exc_val, exc_tb)
 
     def init_app(self, app: Flask) -> None:
         """Initialize the database manager with a Flask application."""
@@ -31,52 +95,35 @@ class DatabaseManager:
             app.extensions = {}
         app.extensions["db"] = self
 
-        # Configure teardown handler to close connections
-        @app.teardown_appcontext
-        async def close_connection(_: Optional[Exception]) -> None:
-            if self.conn:
-                await self.conn.close()
-                self.conn = None
-
-        # Register before_request handler to ensure connection is available
-        @app.before_request
-        async def ensure_connection() -> None:
-            if not self.conn:
-                self.conn = await aiosqlite.connect(self.db_url)
-                await self._initialize_tables()
-
-    async def _initialize_tables(self) -> None:
-        # Create a simple users table and prompts table for storing context
-        await self.conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                password TEXT,
-                email TEXT UNIQUE,
-                password_hash TEXT,
-                password_salt TEXT,
-                created_at TEXT,
-                last_login TEXT,
-                coins INTEGER DEFAULT 0
-            );
-            """
-        )
-        await self.conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS prompts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                prompt TEXT NOT NULL,
-                context TEXT,
-                FOREIGN KEY(user_id) REFERENCES users(id)
-            );
-        """
-        )
-        await self.conn.commit()
+        # Migrate and create the pool once per worker rather than per request;
+        # each method borrows a connection for as long as it runs
+        get_pool(self.db_url)
+
+    async def _execute(
+        self, sql: str, parameters: Tuple[Any, ...] = ()
+    ) -> aiosqlite.Cursor:
+        """Runs a statement on the connection, recording its latency."""
+        start = time.perf_counter()
+        try:
+            return await self.conn.execute(sql, parameters)
+        finally:
+            DB_QUERY_LATENCY.labels("app", statement_kind(sql)).observe(
+                time.perf_counter() - start
+            )
+
+    async def _commit(self) -> None:
+        start = time.perf_counter()
+        try:
+            await self.conn.commit()
+        finally:
+            DB_QUERY_LATENCY.labels("app", "COMMIT").observe(
+                time.perf_counter() - start
+            )
 
+    @_with_connection
     async def get_user_by_id(self, user_id: str) -> Optional[Dict[str, Any]]:
         """Get a user by their ID."""
-        cursor = await self.conn.execute(
+        cursor = await self._execute(
             "SELECT id, email, password_hash, password_salt, created_at, last_login FROM users WHERE id = ?",
             (user_id,),
         )
@@ -94,9 +141,10 @@ class DatabaseManager:
             "last_login": row[5],
         }
 
+    @_with_connection
     async def get_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
         """Get a user by their email."""
-        cursor = await self.conn.execute(
+        cursor = await self._execute(
             "SELECT id, email, password_hash, password_salt, created_at, last_login FROM users WHERE email = ?",
             (email,),
         )
@@ -114,8 +162,9 @@ class DatabaseManager:
             "last_login": row[5],
         }
 
+    @_with_connection
     async def create_user(self, user_data: Dict[str, Any]) -> None:
-        await self.conn.execute(
+        await self._execute(
             "INSERT INTO users (email, password_hash, password_salt, created_at) VALUES (?, ?, ?, ?)",
             (
                 user_data["email"],
@@ -124,32 +173,63 @@ class DatabaseManager:
                 str(user_data["created_at"]),
             ),
         )
-        await self.conn.commit()
+        await self._commit()
 
+    @_with_connection
     async def update_user_login(self, user_id: str) -> None:
-        await self.conn.execute(
+        await self._execute(
             "UPDATE users SET last_login = ? WHERE id = ?",
             (datetime.now().isoformat(), user_id),
         )
-        await self.conn.commit()
+        await self._commit()
 
+    @_with_connection
     async def store_prompt_context(
         self, user_id: int, prompt: str, context: Optional[str] = None
     ) -> None:
-        await self.conn.execute(
+        await self._execute(
             "INSERT INTO prompts (user_id, prompt, context) VALUES (?, ?, ?)",
             (user_id, prompt, context),
         )
-        await self.conn.commit()
+        await self._commit()
 
-    async def get_prompts_for_user(self, user_id: int) -> List[Tuple[int, str, str]]:
-        cursor = await self.conn.execute(
-            "SELECT id, prompt, context FROM prompts WHERE user_id = ?", (user_id,)
+    @_with_connection
+    async def get_prompts_page(
+        self, user_id: int, after: int = 0, limit: int = 50
+    ) -> List[Tuple[int, str, str]]:
+        """
+        Returns up to `limit` of a user's prompts with ids above `after`, oldest
+        first. Pass the last id of one page as `after` to get the next; the
+        (user_id, id) index seeks straight to it however deep the history is.
+        """
+        cursor = await self._execute(
+            "SELECT id, prompt, context FROM prompts WHERE user_id = ? AND id > ? "
+            "ORDER BY id LIMIT ?",
+            (user_id, after, limit),
         )
         return await cursor.fetchall()
 
+    async def iter_prompts_for_user(
+        self, user_id: int, after: int = 0, page_size: int = 200
+    ) -> AsyncIterator[Tuple[int, str, str]]:
+        """
+        Yields a user's prompts page by page, so a long history is never held
+        in memory at once. Each page borrows a connection only while it runs.
+        """
+        while True:
+            page = await self.get_prompts_page(user_id, after, page_size)
+            for row in page:
+                yield row
+            if len(page) < page_size:
+                return
+            after = page[-1][0]
+
+    async def get_prompts_for_user(self, user_id: int) -> List[Tuple[int, str, str]]:
+        return [row async for row in self.iter_prompts_for_user(user_id)]
+
+    @_with_connection
     async def get_coins_by_id(self, user_id: int) -> int:
-        cursor = await self.conn.execute(
+        cursor = await self._execute(
             "SELECT coins FROM users WHERE id = ?", (user_id,)
         )
         row = await cursor.fetchone()
@@ -157,8 +237,9 @@ class DatabaseManager:
             return 0
         return row[0] or 0
 
+    @_with_connection
     async def get_coins_by_email(self, email: str) -> int:
-        cursor = await self.conn.execute(
+        cursor = await self._execute(
             "SELECT coins FROM users WHERE email = ?", (email,)
         )
         row = await cursor.fetchone()
@@ -166,36 +247,82 @@ class DatabaseManager:
             return 0
         return row[0] or 0
 
-    async def update_coins_by_id(self, user_id: int, amount: int) -> bool:
-        cursor = await self.conn.execute(
-            "SELECT coins FROM users WHERE id = ?", (user_id,)
-        )
-        row = await cursor.fetchone()
-        if not row:
-            return False
-        current_coins = row[0] or 0
-        new_coins = current_coins + amount
-        if new_coins < 0:
-            return False
-        await self.conn.execute(
-            "UPDATE users SET coins = ? WHERE id = ?", (new_coins, user_id)
-        )
-        await self.conn.commit()
-        return True
+    async def _change_coins(
+        self,
+        column: str,
+        value: Union[int, str],
+        amount: int,
+        idempotency_key: Optional[str] = None,
+    ) -> Optional[int]:
+        # takes the write lock up front, so a repeated key waits for the first
+        await self._execute("BEGIN IMMEDIATE")
+        try:
+            cursor = await self._execute(
+                f"SELECT id FROM users WHERE {column} = ?", (value,)
+            )
+            user = await cursor.fetchone()
+            if not user:
+                await self._commit()
+                return None
+            # keys are scoped to the user, another user's key never matches
+            if idempotency_key is not None:
+                cursor = await self._execute(
+                    "SELECT balance FROM coin_ledger "
+                    "WHERE user_id = ? AND idempotency_key = ?",
+                    (user[0], idempotency_key),
+                )
+                row = await cursor.fetchone()
+                if row:
+                    await self._commit()
+                    return row[0]
+            cursor = await self._execute(
+                "UPDATE users SET coins = COALESCE(coins, 0) + ? "
+                "WHERE id = ? AND COALESCE(coins, 0) + ? >= 0 "
+                "RETURNING coins",
+                (amount, user[0], amount),
+            )
+            row = await cursor.fetchone()
+            if row:
+                await self._execute(
+                    "INSERT INTO coin_ledger "
+                    "(user_id, amount, balance, idempotency_key, created_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (
+                        user[0],
+                        amount,
+                        row[0],
+                        idempotency_key,
+                        datetime.now().isoformat(),
+                    ),
+                )
+            await self._commit()
+        except BaseException:
+            await self.conn.rollback()
+            raise
+        return row[0] if row else None
 
-    async def update_coins_by_email(self, email: str, amount: int) -> bool:
-        cursor = await self.conn.execute(
-            "SELECT coins FROM users WHERE email = ?", (email,)
-        )
-        row = await cursor.fetchone()
-        if not row:
-            return False
-        current_coins = row[0] or 0
-        new_coins = current_coins + amount
-        if new_coins < 0:
-            return False
-        await self.conn.execute(
-            "UPDATE users SET coins = ? WHERE email = ?", (new_coins, email)
-        )
-        await self.conn.commit()
-        return True
+    @_with_connection
+    async def change_coins(
+        self, user_id: int, amount: int, idempotency_key: Optional[str] = None
+    ) -> Optional[int]:
+        """
+        Adds `amount` coins (negative to spend) to a user's balance and records
+        it in the ledger, in one transaction. Returns the new balance, or None
+        if the user does not exist or cannot afford it. Repeating an
+        idempotency key applies nothing and returns the balance the first call
+        left.
+        """
+        return await self._change_coins("id", user_id, amount, idempotency_key)
+
+    @_with_connection
+    async def update_coins_by_id(
+        self, user_id: int, amount: int, idempotency_key: Optional[str] = None
+    ) -> bool:
+        return await self.change_coins(user_id, amount, idempotency_key) is not None
+
+    @_with_connection
+    async def update_coins_by_email(
+        self, email: str, amount: int, idempotency_key: Optional[str] = None
+    ) -> bool:
+        balance = await self._change_coins("email", email, amount, idempotency_key)
+        return balance is not None
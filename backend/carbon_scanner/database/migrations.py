@@ -0,0 +1,176 @@
+"""
+Versioned schema migrations for the app database (DatabaseManager) and the
+coins database (sqllite_manager).
+
+Run once per deploy, before the workers start:
+
+    python -m carbon_scanner.database.migrations
+
+Each migration is applied in its own transaction and recorded in
+schema_migrations, so running it again only applies what is new.
+"""
+import sqlite3
+from datetime import datetime
+from typing import List, Sequence, Tuple
+from carbon_scanner.config import config
+
+# (version, name, statements), append new ones and never edit applied ones
+Migration = Tuple[int, str, Sequence[str]]
+
+APP_MIGRATIONS: List[Migration] = [
+    (
+        1,
+        "users and prompts",
+        (
+            """
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                password TEXT,
+                email TEXT UNIQUE,
+                password_hash TEXT,
+                password_salt TEXT,
+                created_at TEXT,
+                last_login TEXT,
+                coins INTEGER DEFAULT 0
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS prompts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                prompt TEXT NOT NULL,
+                context TEXT,
+                FOREIGN KEY(user_id) REFERENCES users(id)
+            )
+            """,
+        ),
+    ),
+    (
+        2,
+        "coin ledger",
+        (
+            # Append-only record of every coin change, users.coins holds the balance
+            """
+            CREATE TABLE IF NOT EXISTS coin_ledger (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                amount INTEGER NOT NULL,
+                balance INTEGER NOT NULL,
+                idempotency_key TEXT,
+                created_at TEXT NOT NULL,
+                FOREIGN KEY(user_id) REFERENCES users(id),
+                UNIQUE(user_id, idempotency_key)
+            )
+            """,
+        ),
+    ),
+    (
+        3,
+        "prompt history index",
+        # serves WHERE user_id = ? ORDER BY id, the keyset pagination order
+        ("CREATE INDEX IF NOT EXISTS prompts_user_id ON prompts (user_id, id)",),
+    ),
+]
+
+CARBON_MIGRATIONS: List[Migration] = [
+    (
+        1,
+        "users and coin ledger",
+        (
+            """
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY,
+                name text NOT NULL,
+                coins INTEGER DEFAULT 0
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS coin_ledger (
+                id INTEGER PRIMARY KEY,
+                user_id INTEGER NOT NULL REFERENCES users(id),
+                amount INTEGER NOT NULL,
+                balance INTEGER NOT NULL,
+                idempotency_key TEXT,
+                created_at TEXT NOT NULL,
+                UNIQUE(user_id, idempotency_key)
+            )
+            """,
+        ),
+    ),
+    (
+        2,
+        "user name index",
+        # names are not unique, (name, id) finds the first account directly
+        ("CREATE INDEX IF NOT EXISTS users_name ON users (name, id)",),
+    ),
+]
+
+
+def applied_versions(conn: sqlite3.Connection) -> List[int]:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        )
+        """
+    )
+    rows = conn.execute("SELECT version FROM schema_migrations ORDER BY version")
+    return [row[0] for row in rows]
+
+
+def migrate(
+    path: str, migrations: Sequence[Migration] = APP_MIGRATIONS
+) -> List[int]:
+    """
+    Applies the migrations `path` has not seen yet, in version order.
+
+    Each one is re-checked under the write lock, so workers or deploy steps
+    racing on the same file apply it once. Returns the versions applied.
+    """
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    applied: List[int] = []
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        done = set(applied_versions(conn))
+        for version, name, statements in sorted(migrations, key=lambda m: m[0]):
+            if version in done:
+                continue
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # another process may have applied it since the check above
+                if version in applied_versions(conn):
+                    conn.execute("COMMIT")
+                    continue
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute(
+                    "INSERT INTO schema_migrations (version, name, applied_at) "
+                    "VALUES (?, ?, ?)",
+                    (version, name, datetime.now().isoformat()),
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            applied.append(version)
+    finally:
+        conn.close()
+    return applied
+
+
+def main() -> None:
+    for path, migrations in (
+        (config.DATABASE_URL, APP_MIGRATIONS),
+        (config.CARBON_DB_PATH, CARBON_MIGRATIONS),
+    ):
+        applied = migrate(path, migrations)
+        if applied:
+            print(f"Applied migrations {applied} to {path}")
+        else:
+            print(f"{path} is up to date")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+import asyncio
+import queue
+import sqlite3
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Callable, Iterator, Optional, Set
+import aiosqlite
+
+
+class SQLitePool:
+    """
+    Bounded pool of sqlite3 connections to one database file.
+
+    Every connection runs in WAL mode, so readers never wait for the writer,
+    and waits up to `timeout` seconds for a lock instead of failing at once.
+    Each keeps its own compiled statement cache, which the module level SQL
+    constants hit on every reuse.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        size: int = 8,
+        timeout: float = 5.0,
+        synchronous: str = "NORMAL",
+        cached_statements: int = 256,
+        setup: Optional[Callable[[sqlite3.Connection], None]] = None,
+    ) -> None:
+        self.path: str = path
+        self.size: int = max(1, size)
+        self.timeout: float = timeout
+        self.synchronous: str = synchronous
+        self.cached_statements: int = cached_statements
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._all: Set[sqlite3.Connection] = set()
+        self._lock = threading.Lock()
+        if setup:
+            with self.connection() as conn:
+                setup(conn)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.timeout,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        conn.execute(f"PRAGMA busy_timeout={int(self.timeout * 1000)}")
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._all) < self.size:
+                conn = self._connect()
+                self._all.add(conn)
+                return conn
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No free connection to {self.path}") from None
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """
+        Lends a connection for one unit of work, committing it on success
+        and rolling it back on error before it goes back to the pool.
+        """
+        conn = self._acquire()
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            if conn in self._all:
+                self._idle.put(conn)
+            else:
+                # the pool was closed while this one was lent out
+                conn.close()
+
+    def close(self) -> None:
+        """Closes every connection; the pool opens new ones if used again."""
+        with self._lock:
+            connections, self._all = self._all, set()
+        while True:
+            try:
+                self._idle.get_nowait()
+            except queue.Empty:
+                break
+        for conn in connections:
+            conn.close()
+
+
+class AsyncSQLitePool:
+    """
+    Bounded pool of aiosqlite connections, the async twin of SQLitePool.
+
+    Meant to live for the whole worker process: Flask runs every async view
+    on its own event loop, which aiosqlite connections tolerate, so the pool
+    is shared across requests and guarded with thread primitives rather than
+    asyncio ones.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        size: int = 8,
+        timeout: float = 5.0,
+        synchronous: str = "NORMAL",
+    ) -> None:
+        self.path: str = path
+        self.size: int = max(1, size)
+        self.timeout: float = timeout
+        self.synchronous: str = synchronous
+        self._idle: "queue.LifoQueue[aiosqlite.Connection]" = queue.LifoQueue()
+        self._all: Set[aiosqlite.Connection] = set()
+        self._opening: int = 0
+        self._lock = threading.Lock()
+
+    async def _connect(self) -> aiosqlite.Connection:
+        conn = aiosqlite.connect(self.path, timeout=self.timeout)
+        # the pool outlives requests, its threads must not hold up shutdown
+        conn.daemon = True
+        await conn
+        await conn.execute("PRAGMA journal_mode=WAL")
+        await conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        await conn.execute(f"PRAGMA busy_timeout={int(self.timeout * 1000)}")
+        return conn
+
+    async def _acquire(self) -> aiosqlite.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            # counts connections still being opened, outside the lock
+            grow = len(self._all) + self._opening < self.size
+            if grow:
+                self._opening += 1
+        if grow:
+            try:
+                conn = await self._connect()
+                with self._lock:
+                    self._all.add(conn)
+                return conn
+            finally:
+                with self._lock:
+                    self._opening -= 1
+        try:
+            return await asyncio.to_thread(self._idle.get, timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No free connection to {self.path}") from None
+
+    @asynccontextmanager
+    async def connection(self) -> AsyncIterator[aiosqlite.Connection]:
+        """
+        Lends a connection for one unit of work, committing it on success
+        and rolling it back on error before it goes back to the pool.
+        """
+        conn = await self._acquire()
+        try:
+            yield conn
+            if conn.in_transaction:
+                await conn.commit()
+        except BaseException:
+            if conn.in_transaction:
+                await conn.rollback()
+            raise
+        finally:
+            if conn in self._all:
+                self._idle.put(conn)
+            else:
+                await conn.close()
+
+    async def close(self) -> None:
+        """Closes every connection; the pool opens new ones if used again."""
+        with self._lock:
+            connections, self._all = self._all, set()
+        while True:
+            try:
+                self._idle.get_nowait()
+            except queue.Empty:
+                break
+        for conn in connections:
+            await conn.close()
@@ -1,35 +1,92 @@
 import sqlite3
+import time
+from datetime import datetime
+from typing import Optional
+from carbon_scanner.config import config
+from carbon_scanner.database.migrations import CARBON_MIGRATIONS, migrate
+from carbon_scanner.database.sqlite_pool import SQLitePool
+from carbon_scanner.metrics import DB_QUERY_LATENCY, statement_kind
 
-# Initialize connection and cursor at module level
-conn = sqlite3.connect("carbon.db", check_same_thread=False)
-cursor = conn.cursor()
-cursor.execute(
-"""CREATE TABLE IF NOT EXISTS users (
-id INTEGER PRIMARY KEY,
-name text NOT NULL,
-coins INTEGER DEFAULT 0)""")
+# Schema migrations, a no-op once the deploy step has applied them
+migrate(config.CARBON_DB_PATH, CARBON_MIGRATIONS)
 
-conn.commit()
+# Each call borrows its own connection, so concurrent requests never share a cursor
+pool = SQLitePool(
+    config.CARBON_DB_PATH,
+    size=config.SQLITE_POOL_SIZE,
+    timeout=config.SQLITE_BUSY_TIMEOUT,
+    synchronous=config.SQLITE_SYNCHRONOUS,
+)
+
+def _execute(conn : sqlite3.Connection, sql : str, parameters : tuple = ()):
+    """Runs a statement on a pooled connection, recording its latency."""
+    start = time.perf_counter()
+    try:
+        return conn.execute(sql, parameters)
+    finally:
+        DB_QUERY_LATENCY.labels("carbon", statement_kind(sql)).observe(time.perf_counter() - start)
+
+# Several rows may share a name, the first one is the user's account
+USER_ID = """(SELECT id FROM users WHERE name = ? ORDER BY id LIMIT 1)"""
+
+def _record(conn : sqlite3.Connection, user_id : int, amount : int, balance : int,
+            key : Optional[str] = None):
+    _execute(conn, """INSERT INTO coin_ledger(user_id, amount, balance, idempotency_key,
+    created_at) VALUES(?,?,?,?,?);""", (user_id, amount, balance, key,
+                                        datetime.now().isoformat()))
 
 def insert_user(user : str, coins : int = 0):
-    cursor.execute("""INSERT INTO users(name, coins) VALUES(?,?);""", (user, coins))
-    conn.commit()  # Add commit to save changes
+    with pool.connection() as conn:
+        user_id = _execute(conn, """INSERT INTO users(name, coins) VALUES(?,?);""",
+                           (user, coins)).lastrowid
+        if coins:
+            _record(conn, user_id, coins, coins)
 
 def get_user(user : str):
-    cursor.execute("""SELECT * FROM users WHERE name = ?;""", (user,))
-    return cursor.fetchone()
+    with pool.connection() as conn:
+        return _execute(conn, """SELECT * FROM users WHERE name = ?;""", (user,)).fetchone()
 
 def set_coins(user : str, coins : int):
-    cursor.execute("""UPDATE users SET coins = ? WHERE name = ?;""", (coins, user))
-    conn.commit()  # Add commit to save changes
+    with pool.connection() as conn:
+        _execute(conn, """BEGIN IMMEDIATE;""")
+        row = _execute(conn, f"""SELECT id, coins FROM users WHERE id = {USER_ID};""",
+                       (user,)).fetchone()
+        if row is None:
+            return
+        _execute(conn, """UPDATE users SET coins = ? WHERE id = ?;""", (coins, row[0]))
+        _record(conn, row[0], coins - (row[1] or 0), coins)
 
 def get_coins(user : str):
-    cursor.execute("""SELECT coins FROM users WHERE name = ?;""", (user,))
-    return cursor.fetchone()
+    with pool.connection() as conn:
+        return _execute(conn, f"""SELECT coins FROM users WHERE id = {USER_ID};""",
+                        (user,)).fetchone()
 
-def inc_coins(user : str, coins : int):
-    user_coins = get_coins(user)
-    set_coins(user, user_coins[0] + coins)
+def inc_coins(user : str, coins : int, idempotency_key : Optional[str] = None):
+    """
+    Adds coins to the user's balance and records the change in the ledger, in
+    one transaction. Returns the new balance as a row like get_coins, or None
+    if there is no such user. Repeating an idempotency key applies nothing
+    and returns the balance the first call left.
+    """
+    with pool.connection() as conn:
+        # takes the write lock up front, so a repeated key waits for the first
+        _execute(conn, """BEGIN IMMEDIATE;""")
+        row = _execute(conn, f"""SELECT id FROM users WHERE id = {USER_ID};""",
+                       (user,)).fetchone()
+        if row is None:
+            return None
+        user_id = row[0]
+        # keys are scoped to the user, another user's key never matches
+        if idempotency_key is not None:
+            row = _execute(conn, """SELECT balance FROM coin_ledger
+            WHERE user_id = ? AND idempotency_key = ?;""",
+                           (user_id, idempotency_key)).fetchone()
+            if row is not None:
+                return row
+        row = _execute(conn, """UPDATE users SET coins = COALESCE(coins, 0) + ?
+        WHERE id = ? RETURNING coins;""", (coins, user_id)).fetchone()
+        _record(conn, user_id, coins, row[0], idempotency_key)
+        return row
 
 #insert_user("dude", 0)
 #print(get_user("dude"))
@@ -0,0 +1,9 @@
+from carbon_scanner.factors.store import (
+    DATASETS,
+    FactorStore,
+    FactorTable,
+    compile_dataset,
+    store,
+)
+
+__all__ = ['DATASETS', 'FactorStore', 'FactorTable', 'compile_dataset', 'store']
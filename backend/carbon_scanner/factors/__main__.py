@@ -0,0 +1,3 @@
+from carbon_scanner.factors.store import main
+
+main()
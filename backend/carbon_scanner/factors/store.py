@@ -0,0 +1,295 @@
+"""
+Compiled emissions datasets.
+
+A CSV is compiled once into a versioned columnar file: a JSON header followed
+by one aligned, typed array per column plus a sorted name index. Workers
+memory-map the compiled file instead of parsing the CSV, so they share one
+copy in the page cache, and follow a `<dataset>.current` pointer so a newly
+compiled version is picked up without a restart.
+
+    python -m carbon_scanner.factors
+    python -m carbon_scanner.factors --csv new.csv --key Item --name mine
+"""
+import argparse
+import csv
+import glob
+import hashlib
+import json
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from carbon_scanner.config import config
+
+MAGIC = b"CSCOLS01"
+ALIGN = 64
+INDEX_KEYS = "__index_keys"
+INDEX_ROWS = "__index_rows"
+
+# not imported from carbon_scanner.genai, which connects to Gemini on import
+GENAI_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "genai")
+
+# Datasets shipped with the app: name -> (source CSV, name column, encoding)
+DATASETS: Dict[str, Tuple[str, str, str]] = {
+    "food_production": (
+        os.path.join(GENAI_DIR, "Food_Production.csv"),
+        "Food product",
+        "utf-8",
+    ),
+    # exported by openLCA with its quotes escaped as UTF-7
+    "lca_inventory": (os.path.join(GENAI_DIR, "temp.csv"), "Flow", "utf-7"),
+}
+
+
+def _index_key(name: str) -> str:
+    return " ".join(name.lower().split())
+
+
+def _typed(values: List[str]) -> np.ndarray:
+    """float64 if every non-blank value is a number (blanks become NaN), else text."""
+    try:
+        return np.array(
+            [float(v) if v.strip() else math.nan for v in values], dtype=np.float64
+        )
+    except ValueError:
+        return np.array(values, dtype=str)
+
+
+def _columns(path: str, key: str, encoding: str) -> Dict[str, np.ndarray]:
+    with open(path, newline="", encoding=encoding) as f:
+        reader = csv.DictReader(f)
+        rows = list(reader)
+        names = reader.fieldnames or []
+    if key not in names:
+        raise ValueError(f"{path} has no {key!r} column")
+    columns = {name: _typed([row[name] or "" for row in rows]) for name in names}
+    keys = np.array([_index_key(row[key]) for row in rows], dtype=str)
+    order = np.argsort(keys, kind="stable")
+    columns[INDEX_KEYS] = keys[order]
+    columns[INDEX_ROWS] = order.astype(np.int32)
+    return columns
+
+
+def _source_version(path: str, key: str, encoding: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        digest.update(f.read())
+    digest.update(f"{MAGIC.decode()}:{key}:{encoding}".encode())
+    return digest.hexdigest()[:12]
+
+
+def _pointer(directory: str, dataset: str) -> str:
+    return os.path.join(directory, f"{dataset}.current")
+
+
+def _replace(path: str, data: bytes) -> None:
+    """Writes `path` so readers see the old or the new file, never a partial one."""
+    fd, scratch = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(scratch, path)
+
+
+def compile_dataset(
+    dataset: str,
+    path: str,
+    key: str,
+    directory: Optional[str] = None,
+    encoding: str = "utf-8",
+    keep: int = 3,
+) -> str:
+    """
+    Compiles `path` into `directory`, publishes it as the dataset's current
+    version and returns the compiled file. Older versions beyond `keep` are
+    removed; workers still mapping one keep their view until they reload.
+    """
+    directory = directory or config.FACTOR_STORE_DIR
+    os.makedirs(directory, exist_ok=True)
+    version = _source_version(path, key, encoding)
+    target = os.path.join(directory, f"{dataset}-{version}.cols")
+    if not os.path.exists(target):
+        columns = _columns(path, key, encoding)
+        header: Dict[str, Any] = {
+            "dataset": dataset,
+            "version": version,
+            "source": os.path.basename(path),
+            "key": key,
+            "rows": len(columns[INDEX_ROWS]),
+            "compiled_at": time.time(),
+            "columns": [],
+        }
+        # offsets are relative to the end of the header, which is padded
+        offset = 0
+        for name, array in columns.items():
+            offset = -(-offset // ALIGN) * ALIGN
+            header["columns"].append(
+                {
+                    "name": name,
+                    "dtype": array.dtype.str,
+                    "offset": offset,
+                    "count": len(array),
+                }
+            )
+            offset += array.nbytes
+        encoded = json.dumps(header).encode()
+        start = -(-(len(MAGIC) + 8 + len(encoded)) // ALIGN) * ALIGN
+        body = bytearray(start + offset)
+        body[: len(MAGIC)] = MAGIC
+        body[len(MAGIC) : len(MAGIC) + 8] = struct.pack("<Q", len(encoded))
+        body[len(MAGIC) + 8 : len(MAGIC) + 8 + len(encoded)] = encoded
+        for column, array in zip(header["columns"], columns.values()):
+            at = start + column["offset"]
+            body[at : at + array.nbytes] = array.tobytes()
+        _replace(target, bytes(body))
+    _replace(_pointer(directory, dataset), os.path.basename(target).encode())
+
+    versions = sorted(
+        glob.glob(os.path.join(directory, f"{dataset}-*.cols")), key=os.path.getmtime
+    )
+    for old in versions[:-keep]:
+        if old != target:
+            os.remove(old)
+    return target
+
+
+class FactorTable:
+    """Read-only, memory-mapped view of one compiled dataset version."""
+
+    def __init__(self, path: str) -> None:
+        self.path: str = path
+        with open(path, "rb") as f:
+            # the mapping outlives the file handle, and every column view holds it
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[: len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a compiled dataset")
+        (length,) = struct.unpack("<Q", self._map[len(MAGIC) : len(MAGIC) + 8])
+        header = json.loads(self._map[len(MAGIC) + 8 : len(MAGIC) + 8 + length])
+        start = -(-(len(MAGIC) + 8 + length) // ALIGN) * ALIGN
+        self.dataset: str = header["dataset"]
+        self.version: str = header["version"]
+        self.key: str = header["key"]
+        self.rows: int = header["rows"]
+        self._columns: Dict[str, np.ndarray] = {
+            c["name"]: np.frombuffer(
+                self._map, np.dtype(c["dtype"]), c["count"], start + c["offset"]
+            )
+            for c in header["columns"]
+        }
+        self.columns: List[str] = [c for c in self._columns if not c.startswith("__")]
+
+    def column(self, name: str) -> np.ndarray:
+        """The whole column as a read-only array."""
+        return self._columns[name]
+
+    def find(self, item: str) -> np.ndarray:
+        """Rows whose name column equals `item`, ignoring case and spacing."""
+        keys = self._columns[INDEX_KEYS]
+        key = _index_key(item)
+        lo = np.searchsorted(keys, key, "left")
+        hi = np.searchsorted(keys, key, "right")
+        return np.sort(self._columns[INDEX_ROWS][lo:hi])
+
+    def factors(
+        self, item: str, stages: Optional[Sequence[str]] = None
+    ) -> List[Dict[str, float]]:
+        """
+        The numeric columns (or just `stages`) of every row named `item`,
+        skipping blanks. Empty if the dataset has no such item.
+        """
+        names = stages or [
+            c for c in self.columns if self._columns[c].dtype.kind == "f"
+        ]
+        results = []
+        for row in self.find(item).tolist():
+            values = {name: float(self._columns[name][row]) for name in names}
+            results.append({k: v for k, v in values.items() if not math.isnan(v)})
+        return results
+
+    def factor(self, item: str, stage: str) -> Optional[float]:
+        """A single stage's factor for the first row named `item`, or None."""
+        rows = self.find(item)
+        if not len(rows):
+            return None
+        value = float(self._columns[stage][rows[0]])
+        return None if math.isnan(value) else value
+
+    def record(self, row: int) -> Dict[str, Any]:
+        """Every column of one row."""
+        return {name: self._columns[name][row].item() for name in self.columns}
+
+
+class FactorStore:
+    """
+    The current compiled version of each dataset in `directory`.
+
+    table() checks the dataset's pointer at most once every `check_interval`
+    seconds and maps a newly published version in place of the old one; a
+    reference to a table stays valid however many reloads happen meanwhile.
+    Datasets that were never compiled are compiled on first use.
+    """
+
+    def __init__(self, directory: str, check_interval: float = 5.0) -> None:
+        self.directory: str = directory
+        self.check_interval: float = check_interval
+        self._tables: Dict[str, FactorTable] = {}
+        self._checked: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _current(self, dataset: str) -> Optional[str]:
+        try:
+            with open(_pointer(self.directory, dataset)) as f:
+                return os.path.join(self.directory, f.read().strip())
+        except FileNotFoundError:
+            return None
+
+    def reload(self, dataset: str) -> FactorTable:
+        """Maps the dataset's current version now, compiling it if there is none."""
+        with self._lock:
+            path = self._current(dataset)
+            if path is None or not os.path.exists(path):
+                source, key, encoding = DATASETS[dataset]
+                path = compile_dataset(dataset, source, key, self.directory, encoding)
+            table = self._tables.get(dataset)
+            if table is None or table.path != path:
+                table = self._tables[dataset] = FactorTable(path)
+            self._checked[dataset] = time.monotonic()
+            return table
+
+    def table(self, dataset: str = "food_production") -> FactorTable:
+        table = self._tables.get(dataset)
+        checked = self._checked.get(dataset, 0.0)
+        if table is None or time.monotonic() - checked >= self.check_interval:
+            table = self.reload(dataset)
+        return table
+
+
+store = FactorStore(config.FACTOR_STORE_DIR, config.FACTOR_RELOAD_INTERVAL)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("datasets", nargs="*", help=f"any of {', '.join(DATASETS)}")
+    parser.add_argument("--csv", help="compile this CSV instead")
+    parser.add_argument("--key", help="name column of --csv")
+    parser.add_argument("--name", help="dataset name for --csv")
+    parser.add_argument("--encoding", default="utf-8", help="encoding of --csv")
+    parser.add_argument("--dir", default=config.FACTOR_STORE_DIR)
+    args = parser.parse_args()
+
+    if args.csv:
+        if not (args.key and args.name):
+            parser.error("--csv needs --key and --name")
+        targets = {args.name: (args.csv, args.key, args.encoding)}
+    else:
+        targets = {name: DATASETS[name] for name in args.datasets or DATASETS}
+    for name, (path, key, encoding) in targets.items():
+        compiled = compile_dataset(name, path, key, args.dir, encoding)
+        table = FactorTable(compiled)
+        print(f"{name}: {table.rows} rows, version {table.version} -> {compiled}")
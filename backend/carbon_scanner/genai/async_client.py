@@ -0,0 +1,294 @@
+import asyncio
+import hashlib
+import queue
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Union
+from PIL import Image
+from carbon_scanner.genai.cache import image_digest, make_key
+from carbon_scanner.genai.resilience import (
+    Deadline,
+    HedgePolicy,
+    LatencyTracker,
+    RetryPolicy,
+    is_retryable,
+)
+from carbon_scanner.metrics import MODEL_EXTRA_CALLS, MODEL_TOKENS
+
+Contents = Union[str, List[Any]]
+
+
+def _part_key(part: Any) -> str:
+    if isinstance(part, Image.Image):
+        return image_digest(part)
+    if isinstance(part, dict) and "data" in part:
+        return hashlib.sha256(part["data"]).hexdigest()
+    return str(part)
+
+
+def contents_key(contents: Contents) -> str:
+    """
+    Builds a single-flight key from a prompt, hashing PIL images by pixels and
+    inline blobs by their encoded bytes.
+    """
+    parts = contents if isinstance(contents, list) else [contents]
+    return make_key(*(_part_key(part) for part in parts))
+
+
+class GeminiBackend:
+    """
+    Backend that calls a google.generativeai GenerativeModel.
+
+    `usage` accumulates the token counts reported by the API.
+    """
+
+    def __init__(self, model: Any) -> None:
+        self.model = model
+        self.usage: Dict[str, int] = {"prompt_tokens": 0, "output_tokens": 0}
+        name = getattr(model, "model_name", "gemini")
+        self._tokens = {
+            kind: MODEL_TOKENS.labels(name, kind) for kind in ("prompt", "output")
+        }
+
+    async def generate(self, contents: Contents) -> str:
+        response = await self.model.generate_content_async(contents)
+        metadata = getattr(response, "usage_metadata", None)
+        if metadata:
+            prompt_tokens = metadata.prompt_token_count or 0
+            output_tokens = metadata.candidates_token_count or 0
+            self.usage["prompt_tokens"] += prompt_tokens
+            self.usage["output_tokens"] += output_tokens
+            self._tokens["prompt"].inc(prompt_tokens)
+            self._tokens["output"].inc(output_tokens)
+        return response.text
+
+    async def stream(self, contents: Contents) -> AsyncIterator[str]:
+        response = await self.model.generate_content_async(contents, stream=True)
+        async for chunk in response:
+            yield chunk.text
+
+
+class FakeBackend:
+    """
+    Offline backend for tests and benchmarks.
+
+    Sleeps for `latency` seconds and answers with `responder(contents)`.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        responder: Optional[Callable[[Contents], str]] = None,
+    ) -> None:
+        self.latency: float = latency
+        self.responder: Callable[[Contents], str] = responder or (lambda _: "")
+        self.calls: int = 0
+        self.usage: Dict[str, int] = {"prompt_tokens": 0, "output_tokens": 0}
+
+    async def generate(self, contents: Contents) -> str:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return self.responder(contents)
+
+    async def stream(self, contents: Contents) -> AsyncIterator[str]:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        text = self.responder(contents)
+        for i in range(0, len(text), 16):
+            yield text[i : i + 16]
+
+
+class AsyncGeminiClient:
+    """
+    Runs model calls on a dedicated event loop thread.
+
+    At most `max_concurrency` calls are in flight upstream, each is bounded by
+    a timeout, and identical concurrent requests share a single upstream call.
+    Failed calls are retried per `retry` and slow ones hedged per `hedge`, all
+    within the caller's Deadline.
+    """
+
+    def __init__(
+        self,
+        backend: Any,
+        max_concurrency: int = 8,
+        timeout: float = 60.0,
+        retry: Optional[RetryPolicy] = None,
+        hedge: Optional[HedgePolicy] = None,
+    ) -> None:
+        self.backend = backend
+        self.max_concurrency: int = max_concurrency
+        self.timeout: float = timeout
+        self.retry: RetryPolicy = retry or RetryPolicy(attempts=1)
+        self.hedge: Optional[HedgePolicy] = hedge
+        self.latencies = LatencyTracker()
+        self.extra_calls: Dict[str, int] = {"hedge": 0, "retry": 0}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._start_lock = threading.Lock()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=loop.run_forever, name="gemini-client", daemon=True
+                ).start()
+                self._loop = loop
+        return self._loop
+
+    def _limit(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def _extra(self, kind: str) -> None:
+        self.extra_calls[kind] += 1
+        MODEL_EXTRA_CALLS.labels("gemini", kind).inc()
+
+    def _deadline(
+        self, timeout: Optional[float], deadline: Optional[Deadline]
+    ) -> Deadline:
+        if deadline is not None:
+            return deadline
+        return Deadline(timeout if timeout is not None else self.timeout)
+
+    async def _attempt(self, contents: Contents, deadline: Deadline) -> str:
+        async with self._limit():
+            start = time.monotonic()
+            result = await asyncio.wait_for(
+                self.backend.generate(contents), deadline.budget(self.timeout)
+            )
+            self.latencies.record(time.monotonic() - start)
+            return result
+
+    async def _hedged(self, contents: Contents, deadline: Deadline) -> str:
+        started = time.monotonic()
+        tasks = [asyncio.ensure_future(self._attempt(contents, deadline))]
+        try:
+            if self.hedge is not None:
+                delay = self.hedge.delay(self.latencies)
+                if delay < deadline.remaining():
+                    await asyncio.wait(tasks, timeout=delay)
+                    if not tasks[0].done():
+                        self._extra("hedge")
+                        tasks.append(
+                            asyncio.ensure_future(self._attempt(contents, deadline))
+                        )
+            pending = set(tasks)
+            while True:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        if task is not tasks[0]:
+                            # the slow primary is cancelled, so record how long
+                            # it had taken or the tail would go unseen
+                            self.latencies.record(time.monotonic() - started)
+                        return task.result()
+                if not pending:
+                    # every attempt failed, report the first one's error
+                    raise tasks[0].exception()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _call(self, contents: Contents, deadline: Deadline) -> str:
+        for attempt in range(1, self.retry.attempts + 1):
+            try:
+                return await self._hedged(contents, deadline)
+            except Exception as e:
+                delay = self.retry.backoff(attempt)
+                if (
+                    attempt == self.retry.attempts
+                    or not is_retryable(e)
+                    or delay >= deadline.remaining()
+                ):
+                    raise
+                self._extra("retry")
+                await asyncio.sleep(delay)
+
+    async def _generate(self, key: str, contents: Contents, deadline: Deadline) -> str:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._call(contents, deadline))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    def generate(
+        self,
+        contents: Contents,
+        timeout: Optional[float] = None,
+        deadline: Optional[Deadline] = None,
+    ) -> str:
+        """
+        Blocking call for use from Flask request threads. `deadline` bounds
+        the call including retries and hedges, otherwise `timeout` (default
+        the client's) does.
+        """
+        # Hash in the caller's thread so large images don't stall the loop
+        future = asyncio.run_coroutine_threadsafe(
+            self._generate(
+                contents_key(contents), contents, self._deadline(timeout, deadline)
+            ),
+            self._ensure_loop(),
+        )
+        return future.result()
+
+    async def agenerate(
+        self,
+        contents: Contents,
+        timeout: Optional[float] = None,
+        deadline: Optional[Deadline] = None,
+    ) -> str:
+        """Awaitable call, usable from any event loop."""
+        future = asyncio.run_coroutine_threadsafe(
+            self._generate(
+                contents_key(contents), contents, self._deadline(timeout, deadline)
+            ),
+            self._ensure_loop(),
+        )
+        return await asyncio.wrap_future(future)
+
+    def stream(
+        self,
+        contents: Contents,
+        timeout: Optional[float] = None,
+        deadline: Optional[Deadline] = None,
+    ) -> Iterator[str]:
+        """
+        Yields response text chunks as the model produces them.
+
+        Closing the generator early cancels the upstream call and frees its
+        concurrency slot. Streams are never shared between callers.
+        """
+        chunks: "queue.Queue[Any]" = queue.Queue()
+        done = object()
+        deadline = self._deadline(timeout, deadline)
+
+        async def produce() -> None:
+            try:
+                async with self._limit():
+                    async with asyncio.timeout(deadline.budget(self.timeout)):
+                        async for chunk in self.backend.stream(contents):
+                            chunks.put(chunk)
+            except Exception as e:
+                chunks.put(e)
+            finally:
+                chunks.put(done)
+
+        future = asyncio.run_coroutine_threadsafe(produce(), self._ensure_loop())
+        try:
+            while (chunk := chunks.get()) is not done:
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield chunk
+        finally:
+            future.cancel()
+
+    def inflight(self) -> int:
+        """Number of distinct upstream calls currently in flight."""
+        return len(self._inflight)
@@ -0,0 +1,63 @@
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+from typing import Any, Callable, ContextManager, Dict, Iterator, List, Optional, Tuple
+from carbon_scanner.config import config
+from carbon_scanner.genai.gemini_handler import reciept_resp
+from carbon_scanner.images.preprocess import preprocess_image
+
+# Shared across requests so concurrent batches can't multiply the worker count
+executor = ThreadPoolExecutor(
+    max_workers=config.BATCH_MAX_WORKERS, thread_name_prefix="reciept-batch"
+)
+
+
+def _process(data: bytes, mode: Optional[str], tier: Optional[str]) -> str:
+    return reciept_resp(preprocess_image(data), mode, tier=tier)
+
+
+def _admitted(
+    admit: Callable[[], ContextManager],
+    data: bytes,
+    mode: Optional[str],
+    tier: Optional[str],
+) -> str:
+    with admit():
+        return _process(data, mode, tier)
+
+
+def reciept_batch(
+    uploads: List[Tuple[str, bytes]],
+    mode: Optional[str] = None,
+    tier: Optional[str] = None,
+    admit: Callable[[], ContextManager] = nullcontext,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Runs reciept_resp over many images concurrently, yielding each result as
+    soon as it completes.
+
+    Parameters:
+        uploads: (filename, raw image bytes) pairs.
+        mode: The reciept_resp pipeline mode.
+        tier: The reciept_resp model tier.
+        admit: Context manager factory held around each reciept, e.g. a model
+            slot, so the batch holds as many slots as it has reciepts running.
+
+    A failure only affects its own entry, which is reported with an "error" key.
+    """
+    futures: Dict[Future, int] = {
+        executor.submit(_admitted, admit, data, mode, tier): index
+        for index, (_, data) in enumerate(uploads)
+    }
+    try:
+        for future in as_completed(futures):
+            index = futures[future]
+            result: Dict[str, Any] = {"index": index, "filename": uploads[index][0]}
+            try:
+                result["response"] = future.result()
+            except Exception as e:
+                result["error"] = str(e)
+            yield result
+    finally:
+        # The client went away before the batch finished
+        for future in futures:
+            future.cancel()
@@ -0,0 +1,151 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from PIL import Image
+from carbon_scanner.metrics import CACHE_REQUESTS
+
+
+def image_digest(image: Image.Image) -> str:
+    """
+    Hashes the decoded pixels of an image, so the same photo re-encoded or
+    re-uploaded by a client maps to the same key.
+    """
+    normalized = image.convert("RGB")
+    digest = hashlib.sha256()
+    digest.update(f"{normalized.width}x{normalized.height}".encode())
+    digest.update(normalized.tobytes())
+    return digest.hexdigest()
+
+
+def make_key(*parts: str) -> str:
+    """Builds a cache key from an ordered list of string parts."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class TieredCache:
+    """
+    Two tier string cache: an in-process LRU in front of a SQLite table.
+
+    Entries older than `ttl` seconds are treated as missing in both tiers.
+    Every `purge_every` writes, expired rows are deleted from the SQLite tier
+    and the oldest ones beyond `max_rows` are evicted.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        table: str = "results",
+        max_entries: int = 256,
+        ttl: float = 7 * 24 * 3600,
+        max_rows: int = 100_000,
+        purge_every: int = 512,
+    ) -> None:
+        self.table: str = table
+        self.max_entries: int = max_entries
+        self.ttl: float = ttl
+        self.max_rows: int = max_rows
+        self.purge_every: int = max(1, purge_every)
+        self._writes: int = 0
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats: Dict[str, int] = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        self._counters = {
+            outcome: CACHE_REQUESTS.labels(table, outcome) for outcome in self._stats
+        }
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            f"""CREATE TABLE IF NOT EXISTS {table} (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            created_at REAL NOT NULL)"""
+        )
+        self._conn.execute(
+            f"CREATE INDEX IF NOT EXISTS {table}_created_at ON {table} (created_at)"
+        )
+        self._conn.commit()
+
+    def _expired(self, created_at: float) -> bool:
+        return time.time() - created_at > self.ttl
+
+    def _remember(self, key: str, value: str, created_at: float) -> None:
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[str]:
+        """Returns the cached value for `key`, or None on a miss."""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and not self._expired(entry[1]):
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                self._counters["memory_hits"].inc()
+                return entry[0]
+            self._memory.pop(key, None)
+
+            row = self._conn.execute(
+                f"SELECT value, created_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row and not self._expired(row[1]):
+                self._remember(key, row[0], row[1])
+                self._stats["disk_hits"] += 1
+                self._counters["disk_hits"].inc()
+                return row[0]
+            if row:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self._conn.commit()
+            self._stats["misses"] += 1
+            self._counters["misses"].inc()
+            return None
+
+    def set(self, key: str, value: str) -> None:
+        """Stores `value` in both tiers."""
+        created_at = time.time()
+        with self._lock:
+            self._remember(key, value, created_at)
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, created_at) VALUES (?, ?, ?)",
+                (key, value, created_at),
+            )
+            self._writes += 1
+            if self._writes % self.purge_every == 0:
+                self._purge()
+            self._conn.commit()
+
+    def _purge(self) -> int:
+        removed = self._conn.execute(
+            f"DELETE FROM {self.table} WHERE created_at < ?",
+            (time.time() - self.ttl,),
+        ).rowcount
+        if self.max_rows:
+            # keeps the newest max_rows, LIMIT -1 means no limit
+            removed += self._conn.execute(
+                f"""DELETE FROM {self.table} WHERE key IN (
+                SELECT key FROM {self.table} ORDER BY created_at DESC
+                LIMIT -1 OFFSET ?)""",
+                (self.max_rows,),
+            ).rowcount
+        return removed
+
+    def purge_expired(self) -> int:
+        """
+        Deletes expired rows from the SQLite tier and evicts the oldest beyond
+        `max_rows`, returns how many were removed.
+        """
+        with self._lock:
+            removed = self._purge()
+            self._conn.commit()
+            return removed
+
+    def stats(self) -> Dict[str, int]:
+        """Returns hit/miss counters and the current in-memory size."""
+        with self._lock:
+            return {**self._stats, "memory_entries": len(self._memory)}
@@ -0,0 +1,189 @@
+import difflib
+import re
+import threading
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, List, Optional, Tuple
+from carbon_scanner.factors import FactorStore, FactorTable, store
+
+# Words on a reciept that don't change which dataset row an item belongs to
+MODIFIERS = {
+    "organic", "fresh", "whole", "raw", "large", "small", "sliced", "diced",
+    "frozen", "ground", "minced", "mince", "free", "range", "farmed",
+    "skimmed", "semi", "lean", "boneless", "skinless", "breast", "fillet",
+    "thigh", "steak", "pack", "bag", "loaf", "of", "and", "the",
+}
+
+# Everyday names for rows whose dataset name a reciept wouldn't use
+SYNONYMS = {
+    "pork": "Pig Meat",
+    "ham": "Pig Meat",
+    "bacon": "Pig Meat",
+    "chicken": "Poultry Meat",
+    "turkey": "Poultry Meat",
+    "prawn": "Shrimps (farmed)",
+    "salmon": "Fish (farmed)",
+    "chocolate": "Dark Chocolate",
+    "sugar": "Cane Sugar",
+    "soy milk": "Soymilk",
+    "corn": "Maize (Meal)",
+    "peanut": "Groundnuts",
+    "oat": "Oatmeal",
+    "lentil": "Other Pulses",
+    "bean": "Other Pulses",
+    "chickpea": "Other Pulses",
+    "carrot": "Root Vegetables",
+    "broccoli": "Brassicas",
+    "cabbage": "Brassicas",
+    "orange": "Citrus Fruit",
+    "lemon": "Citrus Fruit",
+    "grape": "Berries & Grapes",
+    "strawberry": "Berries & Grapes",
+}
+
+
+@dataclass
+class Match:
+    """A reciept item resolved against a dataset row."""
+
+    item: str
+    product: str
+    emissions: float
+    score: float
+    method: str
+
+
+def _singular(word: str) -> str:
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith("oes"):
+        return word[:-2]
+    if word.endswith("s") and not word.endswith("ss") and len(word) > 3:
+        return word[:-1]
+    return word
+
+
+def tokens(name: str) -> Tuple[str, ...]:
+    """Lowercased, singular word tokens of a name."""
+    words = re.findall(r"[a-z]+", name.lower())
+    return tuple(_singular(w) for w in words)
+
+
+def normalize(name: str) -> str:
+    """Canonical form of an item name, with reciept modifiers removed."""
+    return " ".join(t for t in tokens(name) if t not in MODIFIERS)
+
+
+class _Aliases:
+    """Name indexes over one version of the dataset."""
+
+    def __init__(self, table: FactorTable) -> None:
+        self.version: str = table.version
+        self.emissions: Dict[str, float] = dict(
+            zip(
+                table.column("Food product").tolist(),
+                table.column("Total_emissions").tolist(),
+            )
+        )
+        self.exact: Dict[str, str] = {p.lower(): p for p in self.emissions}
+        self.normalized: Dict[str, str] = {}
+        for product in self.emissions:
+            self.normalized.setdefault(normalize(product), product)
+            for part in re.split(r"[&()]", product):
+                if normalize(part):
+                    self.normalized.setdefault(normalize(part), product)
+        for alias, product in SYNONYMS.items():
+            self.normalized.setdefault(normalize(alias), product)
+        self.aliases: List[str] = list(self.normalized)
+        self.alias_tokens: List[FrozenSet[str]] = [
+            frozenset(alias.split()) for alias in self.aliases
+        ]
+        # inverted index so token matching only scores aliases sharing a word
+        self.by_token: Dict[str, List[int]] = {}
+        for i, alias_words in enumerate(self.alias_tokens):
+            for word in alias_words:
+                self.by_token.setdefault(word, []).append(i)
+
+
+class EmissionsLookup:
+    """
+    Resolves item names to rows of the emissions dataset without any model call.
+
+    Names are tried exactly, then in normalized form (which includes aliases
+    such as each part of "Onions & Leeks"), then by token overlap and finally
+    by fuzzy string similarity. The indexes are rebuilt whenever `store`
+    publishes a new version of the dataset.
+    """
+
+    def __init__(
+        self,
+        store: FactorStore = store,
+        dataset: str = "food_production",
+        min_token_score: float = 0.6,
+        min_fuzzy_score: float = 0.85,
+    ) -> None:
+        self.store: FactorStore = store
+        self.dataset: str = dataset
+        self.min_token_score: float = min_token_score
+        self.min_fuzzy_score: float = min_fuzzy_score
+        self._aliases: Optional[_Aliases] = None
+        self._lock = threading.Lock()
+
+    def _current(self) -> _Aliases:
+        table = self.store.table(self.dataset)
+        aliases = self._aliases
+        if aliases is None or aliases.version != table.version:
+            with self._lock:
+                aliases = self._aliases
+                if aliases is None or aliases.version != table.version:
+                    # swapped in whole, so a match never mixes two versions
+                    aliases = self._aliases = _Aliases(table)
+        return aliases
+
+    @property
+    def version(self) -> str:
+        return self._current().version
+
+    @property
+    def emissions(self) -> Dict[str, float]:
+        """Total kg CO2e per kg of each dataset product."""
+        return self._current().emissions
+
+    def match(self, item: str) -> Optional[Match]:
+        """Returns the best dataset row for `item`, or None if nothing is close enough."""
+        index = self._current()
+
+        def result(product: str, score: float, method: str) -> Match:
+            emissions = index.emissions[product]
+            return Match(item, product, emissions, round(score, 2), method)
+
+        key = item.strip().lower()
+        if key in index.exact:
+            return result(index.exact[key], 1.0, "exact")
+
+        normalized = normalize(item)
+        if not normalized:
+            return None
+        if normalized in index.normalized:
+            return result(index.normalized[normalized], 1.0, "normalized")
+
+        words = frozenset(normalized.split())
+        candidates = {i for word in words for i in index.by_token.get(word, ())}
+        best: Optional[Tuple[float, str]] = None
+        for i in sorted(candidates):
+            alias_words = index.alias_tokens[i]
+            score = len(words & alias_words) / len(words | alias_words)
+            if best is None or score > best[0]:
+                best = (score, index.normalized[index.aliases[i]])
+        if best and best[0] >= self.min_token_score:
+            return result(best[1], best[0], "token")
+
+        close = difflib.get_close_matches(
+            normalized, index.aliases, n=1, cutoff=self.min_fuzzy_score
+        )
+        if close:
+            score = difflib.SequenceMatcher(None, normalized, close[0]).ratio()
+            return result(index.normalized[close[0]], score, "fuzzy")
+        return None
+
+
+lookup = EmissionsLookup()
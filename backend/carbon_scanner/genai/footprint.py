@@ -0,0 +1,236 @@
+import re
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+import numpy as np
+from carbon_scanner.genai.emissions_lookup import lookup
+from carbon_scanner.factors import FactorTable, store
+
+# (CSV column, reported name) of each supply chain stage, in kg CO2e per kg
+STAGES = (
+    ("Land use change", "Land use change"),
+    ("Animal Feed", "Animal feed"),
+    ("Farm", "Farm"),
+    ("Processing", "Processing"),
+    ("Transport", "Transport"),
+    ("Packging", "Packaging"),
+    ("Retail", "Retail"),
+)
+
+# Liquids are taken as 1 kg per litre
+UNIT_KG = {
+    "kg": 1.0,
+    "g": 0.001,
+    "lb": 0.45359237,
+    "oz": 0.028349523,
+    "l": 1.0,
+    "ml": 0.001,
+    "cl": 0.01,
+}
+
+_LINE = re.compile(
+    r"""^\s*(?:(?P<count>\d+)\s*[x*]\s*)?
+    (?:(?P<lead_qty>\d+(?:\.\d+)?)\s*(?P<lead_unit>kg|g|lb|oz|ml|cl|l)\b\s*)?
+    (?P<name>.*?)
+    (?:\s+(?P<qty>\d+(?:\.\d+)?)\s*(?P<unit>kg|g|lb|oz|ml|cl|l))?\s*$""",
+    re.IGNORECASE | re.VERBOSE,
+)
+
+
+@dataclass
+class LineItem:
+    """
+    A reciept line. `quantity` is in `unit`, which defaults to kilograms;
+    units other than the UNIT_KG weights and volumes raise ValueError.
+    """
+
+    name: str
+    quantity: float = 1.0
+    unit: str = "kg"
+
+    def __post_init__(self) -> None:
+        # a guessed weight would silently skew the footprint, e.g. for "pcs"
+        self.unit = self.unit.strip().lower()
+        if self.unit not in UNIT_KG:
+            raise ValueError(
+                f"Unknown unit {self.unit!r} for {self.name!r}, "
+                f"expected one of {', '.join(UNIT_KG)}"
+            )
+
+    @property
+    def kilograms(self) -> float:
+        return self.quantity * UNIT_KG[self.unit]
+
+
+def parse_line_item(text: str) -> LineItem:
+    """Parses lines such as "2 x Milk 1L", "500g Beef mince" or "Rice"."""
+    match = _LINE.match(text)
+    count = float(match.group("count") or 1)
+    quantity = match.group("qty") or match.group("lead_qty")
+    unit = match.group("unit") or match.group("lead_unit") or "kg"
+    return LineItem(
+        name=match.group("name").strip(),
+        quantity=count * float(quantity or 1),
+        unit=unit.lower(),
+    )
+
+
+class EmissionsFactors:
+    """Per stage emission factors of one dataset version, as one float array."""
+
+    def __init__(self, table: FactorTable) -> None:
+        self.version: str = table.version
+        self.products: List[str] = table.column("Food product").tolist()
+        self.row_of: Dict[str, int] = {p: i for i, p in enumerate(self.products)}
+        rows = np.column_stack([table.column(column) for column, _ in STAGES])
+        # an extra all zero row stands in for unresolved items
+        self.stages: np.ndarray = np.vstack(
+            [np.nan_to_num(rows), np.zeros(len(STAGES))]
+        )
+        self.stage_names: Tuple[str, ...] = tuple(name for _, name in STAGES)
+
+    @property
+    def missing(self) -> int:
+        return len(self.products)
+
+
+_factors: Optional[EmissionsFactors] = None
+_factors_lock = threading.Lock()
+
+
+def current_factors() -> EmissionsFactors:
+    """Factors of the dataset version the store currently publishes."""
+    global _factors
+    table = store.table("food_production")
+    factors = _factors
+    if factors is None or factors.version != table.version:
+        with _factors_lock:
+            if _factors is None or _factors.version != table.version:
+                _factors = EmissionsFactors(table)
+            factors = _factors
+    return factors
+
+
+@lru_cache(maxsize=8192)
+def _resolve(name: str, version: str) -> Tuple[str, float]:
+    # keyed on the version so a reload never serves a stale match
+    match = lookup.match(name)
+    if match is None:
+        return "", 0.0
+    return match.product, match.score
+
+
+def weighted_scores(
+    estimates: Mapping[str, Sequence[float]],
+    kilograms: Optional[Mapping[str, float]] = None,
+) -> Dict[str, float]:
+    """
+    Vectorised `round(cost * confidence * kg, 2)` over {item: [cost,
+    confidence]}, with each item's kg from `kilograms`, 1 if it is not there.
+    """
+    if not estimates:
+        return {}
+    values = np.asarray(list(estimates.values()), dtype=np.float64).reshape(-1, 2)
+    weights = np.fromiter(
+        ((kilograms or {}).get(item, 1.0) for item in estimates),
+        np.float64,
+        len(estimates),
+    )
+    scores = np.round(values[:, 0] * values[:, 1] * weights, 2)
+    return dict(zip(estimates, scores.tolist()))
+
+
+def _score_arrays(
+    factors: EmissionsFactors,
+    items: Sequence[LineItem],
+    confidences: Optional[Sequence[float]],
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    resolved = [_resolve(item.name, factors.version) for item in items]
+    rows = np.fromiter(
+        (factors.row_of.get(product, factors.missing) for product, _ in resolved),
+        np.intp,
+        len(items),
+    )
+    confidence = (
+        np.asarray(confidences, dtype=np.float64)
+        if confidences is not None
+        else np.fromiter((score for _, score in resolved), np.float64, len(items))
+    )
+    kilograms = np.fromiter(
+        (item.kilograms for item in items), np.float64, len(items)
+    )
+    breakdown = factors.stages[rows] * (kilograms * confidence)[:, None]
+    return rows, kilograms, confidence, breakdown
+
+
+def _summary(
+    factors: EmissionsFactors,
+    items: Sequence[LineItem],
+    rows: np.ndarray,
+    kilograms: np.ndarray,
+    confidence: np.ndarray,
+    breakdown: np.ndarray,
+) -> Dict[str, Any]:
+    per_item = breakdown.sum(axis=1)
+    resolved = (rows != factors.missing).tolist()
+    stage_totals = np.round(breakdown.sum(axis=0), 2).tolist()
+    return {
+        "items": [
+            {
+                "name": item.name,
+                "product": factors.products[row],
+                "kilograms": round(kg, 3),
+                "confidence": round(conf, 2),
+                "footprint": round(total, 2),
+            }
+            for item, row, kg, conf, total, ok in zip(
+                items,
+                rows.tolist(),
+                kilograms.tolist(),
+                confidence.tolist(),
+                per_item.tolist(),
+                resolved,
+            )
+            if ok
+        ],
+        "unresolved": [item.name for item, ok in zip(items, resolved) if not ok],
+        "stages": dict(zip(factors.stage_names, stage_totals)),
+        "total": round(float(per_item.sum()), 2),
+    }
+
+
+def score_items(
+    items: Sequence[LineItem], confidences: Optional[Sequence[float]] = None
+) -> Dict[str, Any]:
+    """
+    Scores one reciept's line items against the dataset.
+
+    Each item's footprint is kilograms * per stage factors * confidence, where
+    confidence defaults to how well the name matched a dataset row. Returns
+    per item footprints, per stage totals and the overall total, in kg CO2e.
+    """
+    factors = current_factors()
+    return _summary(factors, items, *_score_arrays(factors, items, confidences))
+
+
+def score_batch(reciepts: Sequence[Sequence[LineItem]]) -> List[Dict[str, Any]]:
+    """
+    Scores many reciepts with one set of array operations, e.g. to rescore
+    history after a dataset update.
+    """
+    flat = [item for reciept in reciepts for item in reciept]
+    factors = current_factors()
+    rows, kilograms, confidence, breakdown = _score_arrays(factors, flat, None)
+    bounds = np.cumsum([0] + [len(reciept) for reciept in reciepts])
+    return [
+        _summary(
+            factors,
+            flat[start:end],
+            rows[start:end],
+            kilograms[start:end],
+            confidence[start:end],
+            breakdown[start:end],
+        )
+        for start, end in zip(bounds[:-1].tolist(), bounds[1:].tolist())
+    ]
@@ -1,37 +1,295 @@
 import os
+import json
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
 import google.generativeai as genai
 from PIL import Image, ImageFile
 from carbon_scanner.config import config
 from carbon_scanner.genai import lang_chain_process
+from carbon_scanner.genai.async_client import AsyncGeminiClient, GeminiBackend, contents_key
+from carbon_scanner.genai.cache import TieredCache, make_key
+from carbon_scanner.genai.emissions_lookup import lookup
+from carbon_scanner.genai.resilience import Deadline, hedge_policy, retry_policy
+from carbon_scanner.genai.routing import TIERS, router
+from carbon_scanner.genai.semantic_cache import SemanticCache
+from carbon_scanner.genai.stream_parser import EstimateStreamParser, parse_estimates
+from carbon_scanner.images.preprocess import PreparedImage
+from carbon_scanner.metrics import MODEL_LATENCY
 
 assert config.GEMINI_API_KEY, "GEMINI_API_KEY is not set in the environment variables."
 genai.configure(api_key=os.environ["GEMINI_API_KEY"])
-model = genai.GenerativeModel('gemini-2.0-flash')
-# gemini-2.0-pro-exp-02-05
+MODEL_NAME = config.FAST_MODEL
+STRONG_MODEL_NAME = config.STRONG_MODEL
+model = genai.GenerativeModel(MODEL_NAME)
+strong_model = genai.GenerativeModel(STRONG_MODEL_NAME)
+# one client per tier, so hedging delays follow each model's own latency
+clients = {
+    tier: AsyncGeminiClient(
+        GeminiBackend(tier_model),
+        max_concurrency=config.GEMINI_MAX_CONCURRENCY,
+        timeout=config.GEMINI_TIMEOUT,
+        retry=retry_policy(),
+        hedge=hedge_policy(),
+    )
+    for tier, tier_model in zip(TIERS, (model, strong_model))
+}
+client = clients["fast"]
 
-def image_resp(prompt: str, image: ImageFile) -> str:
+RECIEPT_PROMPT = "break down all items in this reciept into a list of the raw materials, keeping the quantity and weight or volume printed for each (for example 2 x Milk 1L, 500g Beef mince), then return that as a comma seperated list"
+# Single call alternative to RECIEPT_PROMPT followed by the RAG chain: the
+# dataset is small enough to send whole alongside the image
+MULTIMODAL_TEMPLATE = """You are a personal carbon footprint estimator expert.
+Break down all items in this reciept into a list of the raw materials.
+Estimate each one for the quantity bought, using the weights and volumes printed on the reciept.
+Base your estimates on this table of kg CO2 equivalent emitted per kg of product:
+{context}
+if the table does not have the answer, please provide your best estimate based on information you have found from the web.
+Respond in numbers only, in a the following format, do not explain or format the output.
+Give me the JSON data as plain text, without using code blocks or formatting markers.
+{{<item name>: [<carbon cost>, <confidence>]}},
+Where confidence is a value between 0 and 1, with 1 being completely confident and 0 being not confident at all.
+"""
+# (emissions table, prompt) for the dataset version last used
+_multimodal_prompt: Tuple[Dict[str, float], str] = ({}, "")
+
+def multimodal_prompt() -> str:
+    """MULTIMODAL_TEMPLATE filled in with the current version of the dataset."""
+    global _multimodal_prompt
+    emissions = lookup.emissions
+    cached, prompt = _multimodal_prompt
+    if cached is not emissions:
+        prompt = MULTIMODAL_TEMPLATE.format(
+            context="\n".join(f"{p}: {e:.1f}" for p, e in emissions.items())
+        )
+        _multimodal_prompt = (emissions, prompt)
+    return prompt
+RECIEPT_MODES = ("two_stage", "multimodal")
+
+reciept_cache = TieredCache(
+    config.RESULT_CACHE_PATH,
+    table="reciept_results",
+    max_entries=config.RESULT_CACHE_SIZE,
+    ttl=config.RESULT_CACHE_TTL,
+    max_rows=config.RESULT_CACHE_MAX_ROWS,
+)
+
+text_cache = SemanticCache(
+    lang_chain_process.embeddings.embed_query,
+    name="text_results",
+    threshold=config.SEMANTIC_CACHE_THRESHOLD,
+    max_entries=config.SEMANTIC_CACHE_SIZE,
+    ttl=config.SEMANTIC_CACHE_TTL,
+)
+
+def _as_part(image: Union[ImageFile, PreparedImage]) -> Any:
+    return image.part if isinstance(image, PreparedImage) else image
+
+def _pixels(image: Union[ImageFile, PreparedImage]) -> int:
+    size = image.image.size if isinstance(image, PreparedImage) else image.size
+    return size[0] * size[1]
+
+def _choose_for_image(
+    prompt: str,
+    image: Union[ImageFile, PreparedImage],
+    tier: Optional[str],
+    history: bool = True,
+) -> str:
+    return router.choose(
+        tier, chars=len(prompt), pixels=_pixels(image), history=history
+    )
+
+def _image_call(
+    prompt: str,
+    image: Union[ImageFile, PreparedImage],
+    deadline: Optional[Deadline],
+    tier: str,
+) -> str:
+    with MODEL_LATENCY.labels("image_resp").time():
+        return clients[tier].generate([prompt, _as_part(image)], deadline=deadline)
+
+def image_resp(
+    prompt: str,
+    image: Union[ImageFile, PreparedImage],
+    deadline: Optional[Deadline] = None,
+    tier: Optional[str] = None,
+) -> str:
     """
     Sends an image object and prompt to Google Gemini, returns the response.
 
     Parameters:
         prompt: The prompt to send Gemini.
-        image: An image object given by PIL.Image.open.
+        image: An image object given by PIL.Image.open, or an upload prepared
+            by carbon_scanner.images.preprocess_image.
+        deadline: Time budget for the call, including retries and hedges.
+        tier: "fast", "strong", or None to route by prompt and image size.
     """
-    response = model.generate_content([prompt, image])
-    return response.text
+    # free text answers carry no confidences for the history to judge
+    chosen = _choose_for_image(prompt, image, tier, history=False)
+    return _image_call(prompt, image, deadline, chosen)
+
+def _text_prompt(prompt: str) -> str:
+    return f"given the following prompt, restrict your response to less than 300 words {prompt}"
 
-def text_resp(prompt: str) -> str:
+def text_resp(prompt: str, tier: Optional[str] = None) -> str:
     """
     Generates a model response based on a text prompt.
+
+    Answers are reused for prompts whose embedding is close enough to one
+    answered before by the same model, see SEMANTIC_CACHE_THRESHOLD. `tier`
+    picks the model as in image_resp.
+    """
+    chosen = router.choose(tier, chars=len(prompt), history=False)
+
+    def generate() -> str:
+        with MODEL_LATENCY.labels("text_resp").time():
+            return clients[chosen].generate(_text_prompt(prompt))
+
+    return text_cache.get_or_compute(prompt, generate, namespace=chosen)
+
+def text_resp_stream(prompt: str, tier: Optional[str] = None) -> Iterator[str]:
+    """
+    Like text_resp, but yields the response in chunks as it is generated.
+    """
+    chosen = router.choose(tier, chars=len(prompt), history=False)
+    return clients[chosen].stream(_text_prompt(prompt))
+
+def reciept_two_stage(
+    image: Union[ImageFile, PreparedImage],
+    deadline: Optional[Deadline] = None,
+    tier: Optional[str] = None,
+) -> str:
+    """Extracts the item list from the image, then scores it with the RAG chain."""
+    itemlist = image_resp(RECIEPT_PROMPT, image, deadline, tier)
+    return lang_chain_process.list_resp(itemlist, deadline, tier)
+
+def reciept_multimodal(
+    image: Union[ImageFile, PreparedImage],
+    deadline: Optional[Deadline] = None,
+    tier: Optional[str] = None,
+) -> str:
+    """
+    Scores the items on the image in a single model call. Low confidence
+    items from the fast model are re-scored by the strong model's RAG chain.
+    """
+    prompt = multimodal_prompt()
+    chosen = _choose_for_image(prompt, image, tier)
+    estimates = parse_estimates(_image_call(prompt, image, deadline, chosen))
+    scores = lang_chain_process.screen_estimates(
+        estimates.items(), deadline, tier, chosen, "reciept_multimodal"
+    )
+    return json.dumps(dict(scores))
+
+def _reciept_key(
+    image: Union[ImageFile, PreparedImage], mode: str, tier: Optional[str]
+) -> str:
+    return make_key(
+        contents_key([_as_part(image)]),
+        mode,
+        tier or "auto",
+        RECIEPT_PROMPT,
+        multimodal_prompt(),
+        lang_chain_process.template,
+        lang_chain_process.ESTIMATE_QUESTION,
+        MODEL_NAME,
+        STRONG_MODEL_NAME,
+        lang_chain_process.MODEL_NAME,
+        lang_chain_process.STRONG_MODEL_NAME,
+    )
+
+def _reciept_mode(mode: Optional[str]) -> str:
+    mode = mode or config.RECIEPT_MODE
+    if mode not in RECIEPT_MODES:
+        raise ValueError(f"Unknown reciept mode: {mode}")
+    return mode
+
+def _stream_multimodal(
+    image: Union[ImageFile, PreparedImage], deadline: Deadline, tier: Optional[str]
+) -> Iterator[Tuple[str, float]]:
+    prompt = multimodal_prompt()
+    chosen = _choose_for_image(prompt, image, tier)
+
+    def estimates() -> Iterator[Tuple[str, List[float]]]:
+        parser = EstimateStreamParser()
+        contents = [prompt, _as_part(image)]
+        for chunk in clients[chosen].stream(contents, deadline=deadline):
+            yield from parser.feed(chunk)
+        if not parser.entries:
+            raise ValueError("No estimates found in model output")
+
+    yield from lang_chain_process.screen_estimates(
+        estimates(), deadline, tier, chosen, "reciept_multimodal"
+    )
+
+def reciept_resp(
+    image: Union[ImageFile, PreparedImage],
+    mode: Optional[str] = None,
+    deadline: Optional[Deadline] = None,
+    tier: Optional[str] = None,
+) -> str:
+    """
+    Extracts the items from a reciept image and estimates their footprint.
+
+    Parameters:
+        image: The reciept.
+        mode: One of RECIEPT_MODES, defaults to config.RECIEPT_MODE.
+        deadline: Time budget shared by every model call, defaults to
+            config.RECIEPT_DEADLINE seconds.
+        tier: "fast", "strong", or None to let the router pick per call.
+
+    Results are cached by the image content, the mode, the tier, the prompts
+    and the model versions, so a re-uploaded reciept skips every model call.
+    """
+    mode = _reciept_mode(mode)
+    key = _reciept_key(image, mode, tier)
+    cached = reciept_cache.get(key)
+    if cached is not None:
+        return cached
+    deadline = deadline or Deadline(config.RECIEPT_DEADLINE)
+    if mode == "multimodal":
+        result = reciept_multimodal(image, deadline, tier)
+    else:
+        result = reciept_two_stage(image, deadline, tier)
+    reciept_cache.set(key, result)
+    return result
+
+def reciept_events(
+    image: Union[ImageFile, PreparedImage],
+    mode: Optional[str] = None,
+    deadline: Optional[Deadline] = None,
+    tier: Optional[str] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Runs reciept_resp step by step, yielding progress events:
+    {"event": "stage"}, {"event": "items"}, one {"event": "item"} per scored
+    item, then {"event": "done"} with the same response reciept_resp returns.
+
+    Stopping iteration early skips any model calls that haven't started yet.
     """
-    response = model.generate_content(f"given the following prompt, restrict your response to less than 300 words {prompt}")
-    return response.text
+    mode = _reciept_mode(mode)
+    key = _reciept_key(image, mode, tier)
+    cached = reciept_cache.get(key)
+    if cached is not None:
+        for item, footprint in json.loads(cached).items():
+            yield {"event": "item", "item": item, "footprint": footprint}
+        yield {"event": "done", "response": cached}
+        return
 
-def reciept_resp(image: ImageFile) -> str:
-   prompt = "break down all items in this reciept into a list of the raw materials, then return that as a comma seperated list"  
-   itemlist=image_resp(prompt, image)
-   print(f"item list : {itemlist}")
-   return lang_chain_process.list_resp(itemlist)
+    scores: Dict[str, float] = {}
+    deadline = deadline or Deadline(config.RECIEPT_DEADLINE)
+    if mode == "multimodal":
+        yield {"event": "stage", "stage": "scoring"}
+        items = _stream_multimodal(image, deadline, tier)
+    else:
+        yield {"event": "stage", "stage": "extracting"}
+        itemlist = image_resp(RECIEPT_PROMPT, image, deadline, tier)
+        yield {"event": "items", "items": list(lang_chain_process.line_items(itemlist))}
+        yield {"event": "stage", "stage": "scoring"}
+        items = lang_chain_process.iter_list_resp(itemlist, deadline, tier)
+    for item, footprint in items:
+        scores[item] = footprint
+        yield {"event": "item", "item": item, "footprint": footprint}
+    result = json.dumps(scores)
+    reciept_cache.set(key, result)
+    yield {"event": "done", "response": result}
 
 if __name__ == "__main__":
     # Example usage
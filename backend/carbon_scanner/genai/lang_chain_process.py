@@ -1,5 +1,9 @@
 import os
+import re
 import json
+import logging
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
 from dotenv import load_dotenv
 import google.generativeai as genai
 
@@ -7,35 +11,130 @@ import google.generativeai as genai
 from langchain.chains import RetrievalQA
 from langchain_core.messages import HumanMessage
 from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
-from langchain.vectorstores import DocArrayInMemorySearch
 from langchain_google_datastore import DatastoreLoader
 from langchain.schema.runnable import RunnableMap
 from langchain.prompts import ChatPromptTemplate
 from langchain.schema.output_parser import StrOutputParser
-from langchain_community.document_loaders.csv_loader import CSVLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from carbon_scanner.config import config
+from carbon_scanner.factors import store
+from carbon_scanner.genai.cache import TieredCache, make_key
+from carbon_scanner.genai.emissions_lookup import normalize
+from carbon_scanner.genai.footprint import (
+    STAGES,
+    LineItem,
+    parse_line_item,
+    score_items,
+    weighted_scores,
+)
+from carbon_scanner.genai.llm_metrics import LLMMetricsHandler
+from carbon_scanner.genai.rag_index import (
+    HybridRetriever,
+    IndexRetriever,
+    ItemRetriever,
+    KeywordIndex,
+    load_or_build,
+)
+from carbon_scanner.genai.resilience import (
+    Deadline,
+    LatencyTracker,
+    hedge_policy,
+    hedged_stream,
+    retry_policy,
+)
+from carbon_scanner.genai.routing import TIERS, router
+from carbon_scanner.genai.stream_parser import EstimateStreamParser
+from carbon_scanner.metrics import MODEL_EXTRA_CALLS
+
+logger = logging.getLogger(__name__)
 
 # --- loading env for api keys ---
 load_dotenv()
 # --- fetch the google gemini ---
-llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0.7)
+MODEL_NAME = config.FAST_MODEL
+STRONG_MODEL_NAME = config.STRONG_MODEL
+# one attempt per call, retries and hedging are done by text_resp_stream
+llms = {
+    tier: ChatGoogleGenerativeAI(
+        model=name,
+        temperature=0.7,
+        max_retries=1,
+        timeout=config.GEMINI_TIMEOUT,
+        callbacks=[LLMMetricsHandler(name)],
+    )
+    for tier, name in zip(TIERS, (MODEL_NAME, STRONG_MODEL_NAME))
+}
+llm = llms["fast"]
+llm_retry = retry_policy()
+llm_hedge = hedge_policy()
+# time to first streamed chunk, which hedging is keyed on
+llm_latencies = {tier: LatencyTracker() for tier in TIERS}
 # gemni-2.0-pro-exp-02-05
 # result = llm.invoke("hello who is this?")
 # print(result.text)
 
 #  ------ setup RAG -----
 
-# load all the data
-loader = CSVLoader(file_path="./genai/Food_Production.csv")
-data = loader.load()
-text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-docs = text_splitter.split_documents(data)
-embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-vectorstore = DocArrayInMemorySearch.from_documents(docs, embedding=embeddings)
-
-# making the RAG
-retriever = vectorstore.as_retriever()
-# print(retriever.get_relevant_documents("Who is the current CEO of microsoft?"))
+# the vector index is built once per dataset/model and persisted, so workers
+# only open a local file instead of embedding the whole CSV on every start
+EMBEDDING_MODEL = "models/embedding-001"
+embeddings = GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODEL)
+_chain_lock = threading.RLock()
+_retriever = None
+_item_retriever = None
+_qa_chain = None
+
+
+def get_retriever() -> Union[HybridRetriever, IndexRetriever]:
+    """Opens (or builds) the persisted index on first use."""
+    global _retriever
+    with _chain_lock:
+        if _retriever is None:
+            index = load_or_build(embeddings, EMBEDDING_MODEL, config.RAG_INDEX_DIR)
+            if config.RAG_RETRIEVER == "vector":
+                _retriever = IndexRetriever(index=index, embeddings=embeddings)
+            else:
+                _retriever = HybridRetriever(
+                    index=index,
+                    keywords=KeywordIndex(index.documents),
+                    embeddings=embeddings,
+                    min_lexical_score=config.RAG_MIN_LEXICAL_SCORE,
+                )
+    return _retriever
+
+
+def get_item_retriever() -> ItemRetriever:
+    """Per item retriever over the same persisted index, created on first use."""
+    global _item_retriever
+    with _chain_lock:
+        if _item_retriever is None:
+            retriever = get_retriever()
+            keywords = getattr(retriever, "keywords", None)
+            _item_retriever = ItemRetriever(
+                retriever.index,
+                keywords or KeywordIndex(retriever.index.documents),
+                embeddings,
+                k=config.RAG_ITEM_K,
+                min_lexical_score=config.RAG_MIN_LEXICAL_SCORE,
+            )
+    return _item_retriever
+
+
+def item_context(items: List[str]) -> str:
+    """
+    The dataset rows retrieved for `items` as one compact table, each row
+    once and only the columns the estimate needs.
+    """
+    table = store.table("food_production")
+    columns = ["Total_emissions"] + [column for column, _ in STAGES]
+    lines = [" | ".join(["Food product", "Total"] + [name for _, name in STAGES])]
+    for product in get_item_retriever().products(items):
+        rows = table.find(product)
+        if len(rows):
+            values = [table.column(column)[rows[0]] for column in columns]
+            lines.append(" | ".join([product] + [f"{v:.1f}" for v in values]))
+    return "kg CO2e per kg of product:\n" + "\n".join(lines)
+
+
 # --- Making chain ---
 # setting up the format for output and the specific prompt engineering
 template = """You are a personal carbon footprint estimator expert.
@@ -51,25 +150,218 @@ for this question: {question}
 """
 prompt = ChatPromptTemplate.from_template(template)
 output_parser = StrOutputParser()
-# creating chain
-qa_chain = RetrievalQA.from_chain_type(
-    llm=llm,
-    chain_type="stuff",  # "stuff" is a simple chain type.  Explore others like "map_reduce"
-    retriever=retriever,
-    return_source_documents=False,  # Return the source documents used for context
-    chain_type_kwargs={"prompt": prompt},
+
+# per item [carbon cost, confidence] estimates, shared across reciepts and users
+item_cache = TieredCache(
+    config.RESULT_CACHE_PATH,
+    table="item_estimates",
+    max_entries=config.ITEM_CACHE_SIZE,
+    ttl=config.ITEM_CACHE_TTL,
+    max_rows=config.RESULT_CACHE_MAX_ROWS,
+)
+# estimates are per kg, the reciept's quantities are applied when scoring
+ESTIMATE_QUESTION = (
+    "what is the carbon footprint in kg CO2e per kg of each item in this list?"
+)
+# the dataset version is added per lookup, see item_key
+ITEM_CACHE_VERSION = make_key(
+    EMBEDDING_MODEL,
+    template,
+    ESTIMATE_QUESTION,
+    MODEL_NAME,
+    STRONG_MODEL_NAME,
+    config.RAG_CONTEXT,
 )
 
+
+def item_key(item: str) -> str:
+    """Cache key for an item's estimate under the current dataset and prompt."""
+    # read at lookup time so a reloaded dataset never serves stale estimates
+    version = store.table("food_production").version
+    return make_key(
+        normalize(item) or item.strip().lower(), ITEM_CACHE_VERSION, version
+    )
+
+
+def get_qa_chain() -> RetrievalQA:
+    """Creates the RAG chain on first use."""
+    global _qa_chain
+    with _chain_lock:
+        if _qa_chain is None:
+            _qa_chain = RetrievalQA.from_chain_type(
+                llm=llm,
+                chain_type="stuff",  # "stuff" is a simple chain type.  Explore others like "map_reduce"
+                retriever=get_retriever(),
+                return_source_documents=False,  # Return the source documents used for context
+                chain_type_kwargs={"prompt": prompt},
+            )
+    return _qa_chain
+
 def text_resp(text: str):
-    a = qa_chain({"query": text})["result"]
+    a = get_qa_chain()({"query": text})["result"]
     return a
 
-def list_resp(text: str):
-    resp = text_resp(f"what is the carbon footprint for each item in this list? {text}")
-    ret_dict = dict()
-    for i,v in dict(json.loads(resp)).items():
-        ret_dict[i] = round(v[0] * v[1], 2)
-    return json.dumps(ret_dict)
+def text_resp_stream(
+    text: str,
+    deadline: Optional[Deadline] = None,
+    tier: str = "fast",
+    context: Optional[str] = None,
+) -> Iterator[str]:
+    """
+    Same retrieval and prompt as qa_chain, but yields the answer in chunks as
+    the `tier` model streams it. Retried and hedged until the first chunk
+    arrives, within `deadline`. A `context` given by the caller replaces the
+    retrieval.
+    """
+    if context is None:
+        docs = get_retriever().invoke(text)
+        context = "\n\n".join(doc.page_content for doc in docs)
+    messages = prompt.format_messages(context=context, question=text)
+    chunks = hedged_stream(
+        lambda: llms[tier].stream(messages),
+        deadline or Deadline(config.GEMINI_TIMEOUT),
+        llm_retry,
+        llm_hedge,
+        llm_latencies[tier],
+        on_extra=lambda kind: MODEL_EXTRA_CALLS.labels("langchain", kind).inc(),
+    )
+    for chunk in chunks:
+        yield chunk.content
+
+def split_items(text: str) -> List[str]:
+    """Splits the model's comma seperated item list, dropping blanks and bullets."""
+    items = [i.strip(" \t*-.") for i in re.split(r"[,\n]", text)]
+    return list(dict.fromkeys(i for i in items if i))
+
+def line_items(text: str) -> Dict[str, float]:
+    """
+    Kilograms of each item in the model's item list, e.g. "2 x Milk 1L",
+    adding up the lines that name the same item. Lines without a quantity
+    count as 1 kg.
+    """
+    kilograms: Dict[str, float] = {}
+    for line in split_items(text):
+        item = parse_line_item(line)
+        if item.name:
+            kilograms[item.name] = kilograms.get(item.name, 0.0) + item.kilograms
+    return kilograms
+
+def score_estimates(
+    estimates: Dict[str, List[float]], kilograms: Optional[Dict[str, float]] = None
+) -> Dict[str, float]:
+    """
+    Turns {item: [carbon cost, confidence]} into confidence weighted costs,
+    times each item's `kilograms` when given.
+    """
+    return weighted_scores(estimates, kilograms)
+
+def score_estimate(estimate: List[float], kilograms: float = 1.0) -> float:
+    """score_estimates for a single [carbon cost, confidence], as items stream in."""
+    return round(estimate[0] * estimate[1] * kilograms, 2)
+
+def _stream_estimates(
+    items: List[str], deadline: Optional[Deadline], tier: str
+) -> Iterator[Tuple[str, List[float]]]:
+    # items are yielded as soon as each entry of the streamed answer closes
+    question = f"{ESTIMATE_QUESTION} {', '.join(items)}"
+    context = item_context(items) if config.RAG_CONTEXT == "per_item" else None
+    parser = EstimateStreamParser()
+    for chunk in text_resp_stream(question, deadline, tier, context):
+        yield from parser.feed(chunk)
+    if not parser.entries:
+        raise ValueError("No estimates found in model output")
+
+def _escalate(
+    estimates: Dict[str, List[float]],
+    deadline: Optional[Deadline],
+    call: str,
+    kilograms: Optional[Dict[str, float]] = None,
+) -> Iterator[Tuple[str, float]]:
+    router.escalated(call, len(estimates))
+    pending = dict(estimates)
+    try:
+        for i, v in _stream_estimates(list(estimates), deadline, "strong"):
+            # a renamed or repeated item would be counted twice
+            if i not in pending:
+                continue
+            del pending[i]
+            item_cache.set(item_key(i), json.dumps(v))
+            yield i, score_estimate(v, (kilograms or {}).get(i, 1.0))
+    except Exception as e:
+        logger.warning("escalation to %s failed: %s", STRONG_MODEL_NAME, e)
+    # a better answer was optional, the fast model's stands for anything left
+    yield from score_estimates(pending, kilograms).items()
+
+def screen_estimates(
+    estimates: Iterable[Tuple[str, List[float]]],
+    deadline: Optional[Deadline],
+    tier: Optional[str],
+    chosen: str,
+    call: str,
+    kilograms: Optional[Dict[str, float]] = None,
+) -> Iterator[Tuple[str, float]]:
+    """
+    Scores (item, [carbon cost, confidence]) pairs answered by the `chosen`
+    tier as they arrive, per kg estimates times the item's `kilograms` when
+    given.
+
+    Fast model estimates below the router's confidence threshold are held
+    back and re-asked of the strong model once the rest are through, unless
+    the caller explicitly asked for the fast `tier`. Confident estimates from
+    the text chain are stored in item_cache.
+    """
+    low = {}
+    for i, v in estimates:
+        doubtful = chosen == "fast" and router.needs_escalation(v[1])
+        if chosen == "fast":
+            router.record([v[1]])
+        if doubtful and tier != "fast":
+            low[i] = v
+            continue
+        # kept out of the shared cache so later reciepts can still escalate
+        if call == "list_resp" and not doubtful:
+            item_cache.set(item_key(i), json.dumps(v))
+        yield i, score_estimate(v, (kilograms or {}).get(i, 1.0))
+    if low:
+        yield from _escalate(low, deadline, call, kilograms)
+
+def iter_list_resp(
+    text: str, deadline: Optional[Deadline] = None, tier: Optional[str] = None
+) -> Iterator[Tuple[str, float]]:
+    """
+    Yields (item, confidence weighted carbon cost) for each item in the list,
+    for the quantity the list gives (see line_items), cheapest source first,
+    so callers can report results as they resolve.
+
+    Items the dataset and item_cache can't answer are estimated by the model
+    `tier` ("fast", "strong", or None to let the router decide).
+    """
+    kilograms = line_items(text)
+    # items that are rows of the dataset don't need the model at all
+    scored = score_items([LineItem(name, kg) for name, kg in kilograms.items()])
+    for item in scored["items"]:
+        yield item["name"], item["footprint"]
+    # then anything already estimated for an earlier reciept, scored together
+    cached_estimates = {}
+    unseen = []
+    for item in scored["unresolved"]:
+        cached = item_cache.get(item_key(item))
+        if cached is not None:
+            cached_estimates[item] = json.loads(cached)
+        else:
+            unseen.append(item)
+    yield from score_estimates(cached_estimates, kilograms).items()
+    if unseen:
+        chosen = router.choose(tier, chars=sum(len(i) for i in unseen))
+        estimates = _stream_estimates(unseen, deadline, chosen)
+        yield from screen_estimates(
+            estimates, deadline, tier, chosen, "list_resp", kilograms
+        )
+
+def list_resp(
+    text: str, deadline: Optional[Deadline] = None, tier: Optional[str] = None
+):
+    return json.dumps(dict(iter_list_resp(text, deadline, tier)))
 
 if __name__ == "__main__":
     # Example usage
@@ -0,0 +1,51 @@
+import threading
+import time
+from typing import Any, Dict, List
+from uuid import UUID
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from carbon_scanner.metrics import LLM_LATENCY, MODEL_TOKENS
+
+
+class LLMMetricsHandler(BaseCallbackHandler):
+    """Records LangChain LLM latency and token usage, streamed or not."""
+
+    def __init__(self, model: str) -> None:
+        self._latency = LLM_LATENCY.labels(model)
+        self._prompt_tokens = MODEL_TOKENS.labels(model, "prompt")
+        self._output_tokens = MODEL_TOKENS.labels(model, "output")
+        self._started: Dict[UUID, float] = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id: UUID) -> None:
+        with self._lock:
+            self._started[run_id] = time.perf_counter()
+
+    def _finish(self, run_id: UUID) -> None:
+        with self._lock:
+            started = self._started.pop(run_id, None)
+        if started is not None:
+            self._latency.observe(time.perf_counter() - started)
+
+    def on_llm_start(
+        self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, **_: Any
+    ) -> None:
+        self._start(run_id)
+
+    def on_chat_model_start(
+        self, serialized: Dict[str, Any], messages: List[Any], *, run_id: UUID, **_: Any
+    ) -> None:
+        self._start(run_id)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **_: Any) -> None:
+        self._finish(run_id)
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None)
+                if usage:
+                    self._prompt_tokens.inc(usage.get("input_tokens", 0))
+                    self._output_tokens.inc(usage.get("output_tokens", 0))
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **_: Any) -> None:
+        self._finish(run_id)
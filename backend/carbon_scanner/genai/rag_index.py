@@ -0,0 +1,263 @@
+import hashlib
+import json
+import math
+import os
+import shutil
+import tempfile
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from langchain_community.document_loaders.csv_loader import CSVLoader
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from carbon_scanner.genai.emissions_lookup import tokens
+from carbon_scanner.metrics import RETRIEVALS, RETRIEVER_LATENCY
+
+DATASET_PATH = os.path.join(os.path.dirname(__file__), "Food_Production.csv")
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 100
+
+
+def load_documents(path: str = DATASET_PATH) -> List[Document]:
+    """Loads a CSV as one document per row, split into retrieval sized chunks."""
+    data = CSVLoader(file_path=path).load()
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP
+    )
+    return splitter.split_documents(data)
+
+
+def fingerprint(path: str, embedding_model: str) -> str:
+    """Identifies an index by the source file contents, the model and the chunking."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        digest.update(f.read())
+    digest.update(f"{embedding_model}:{CHUNK_SIZE}:{CHUNK_OVERLAP}".encode())
+    return digest.hexdigest()[:16]
+
+
+class VectorIndex:
+    """Unit-normalised document embeddings with brute force cosine search."""
+
+    def __init__(self, vectors: np.ndarray, documents: List[Dict[str, Any]]) -> None:
+        self.vectors: np.ndarray = vectors
+        self.documents: List[Dict[str, Any]] = documents
+
+    def document(self, i: int) -> Document:
+        return Document(**self.documents[i])
+
+    def rank(self, query: List[float], k: int = 4) -> List[int]:
+        """Positions of the `k` documents closest to `query`, best first."""
+        q = np.asarray(query, dtype=np.float32)
+        q /= np.linalg.norm(q) or 1.0
+        scores = self.vectors @ q
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top])].tolist()
+
+    def search(self, query: List[float], k: int = 4) -> List[Document]:
+        return [self.document(i) for i in self.rank(query, k)]
+
+    def save(self, directory: str) -> None:
+        np.save(os.path.join(directory, "vectors.npy"), np.asarray(self.vectors))
+        with open(os.path.join(directory, "documents.json"), "w") as f:
+            json.dump(self.documents, f)
+
+    @classmethod
+    def load(cls, directory: str) -> "VectorIndex":
+        vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r")
+        with open(os.path.join(directory, "documents.json")) as f:
+            documents = json.load(f)
+        return cls(vectors, documents)
+
+    @classmethod
+    def build(cls, documents: List[Document], embeddings: Embeddings) -> "VectorIndex":
+        vectors = np.asarray(
+            embeddings.embed_documents([d.page_content for d in documents]),
+            dtype=np.float32,
+        )
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.where(norms == 0, 1.0, norms)
+        return cls(
+            vectors,
+            [{"page_content": d.page_content, "metadata": d.metadata} for d in documents],
+        )
+
+
+def load_or_build(
+    embeddings: Embeddings,
+    embedding_model: str,
+    index_dir: str,
+    path: str = DATASET_PATH,
+) -> VectorIndex:
+    """
+    Opens the saved index for `path` and `embedding_model`, embedding the
+    dataset only if no index with a matching fingerprint exists yet.
+    """
+    target = os.path.join(index_dir, fingerprint(path, embedding_model))
+    if os.path.isdir(target):
+        return VectorIndex.load(target)
+
+    os.makedirs(index_dir, exist_ok=True)
+    index = VectorIndex.build(load_documents(path), embeddings)
+    # Build in a scratch directory so other workers never see a partial index
+    scratch = tempfile.mkdtemp(dir=index_dir)
+    index.save(scratch)
+    try:
+        os.rename(scratch, target)
+    except OSError:
+        # Another worker finished first, theirs is identical
+        shutil.rmtree(scratch, ignore_errors=True)
+    return VectorIndex.load(target)
+
+
+class KeywordIndex:
+    """
+    Okapi BM25 over the page content of a VectorIndex's documents, so
+    lexical lookups need no embedding call.
+    """
+
+    def __init__(
+        self, documents: Sequence[Dict[str, Any]], k1: float = 1.5, b: float = 0.75
+    ) -> None:
+        counts = [Counter(tokens(d["page_content"])) for d in documents]
+        lengths = np.array([sum(c.values()) for c in counts], dtype=np.float64)
+        # per document part of the BM25 denominator, fixed once indexed
+        self._norm: np.ndarray = k1 * (1 - b + b * lengths / (lengths.mean() or 1.0))
+        self._k1: float = k1
+        self._postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        for term in {t for c in counts for t in c}:
+            docs = [i for i, c in enumerate(counts) if term in c]
+            self._postings[term] = (
+                np.array(docs, dtype=np.intp),
+                np.array([counts[i][term] for i in docs], dtype=np.float64),
+            )
+        n = len(documents)
+        self._idf: Dict[str, float] = {
+            term: math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, (docs, _) in self._postings.items()
+        }
+        self._size: int = n
+
+    def search(self, query: str, k: int = 4) -> List[Tuple[int, float]]:
+        """(position, score) of up to `k` documents sharing a term with `query`."""
+        scores = np.zeros(self._size)
+        for term in set(tokens(query)):
+            if term not in self._postings:
+                continue
+            docs, tf = self._postings[term]
+            weight = tf * (self._k1 + 1) / (tf + self._norm[docs])
+            scores[docs] += self._idf[term] * weight
+        hits = np.flatnonzero(scores)
+        top = hits[np.argsort(-scores[hits], kind="stable")][:k]
+        return [(int(i), float(scores[i])) for i in top]
+
+
+def fuse(rankings: Sequence[Sequence[int]], k: int = 60) -> List[int]:
+    """Reciprocal rank fusion of several best-first rankings."""
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, i in enumerate(ranking):
+            scores[i] = scores.get(i, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=lambda i: -scores[i])
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    LangChain retriever that tries BM25 first and only embeds the query when
+    the best lexical score is below `min_lexical_score`; the lexical and
+    vector rankings are then fused.
+    """
+
+    index: Any
+    keywords: Any
+    embeddings: Any
+    k: int = 4
+    min_lexical_score: float = 3.0
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: Optional[CallbackManagerForRetrieverRun] = None
+    ) -> List[Document]:
+        with RETRIEVER_LATENCY.time():
+            lexical = self.keywords.search(query, self.k)
+            if lexical and lexical[0][1] >= self.min_lexical_score:
+                RETRIEVALS.labels("lexical").inc()
+                return [self.index.document(i) for i, _ in lexical]
+            RETRIEVALS.labels("hybrid").inc()
+            vector = self.index.rank(self.embeddings.embed_query(query), self.k)
+            fused = fuse([[i for i, _ in lexical], vector])[: self.k]
+            return [self.index.document(i) for i in fused]
+
+
+class ItemRetriever:
+    """
+    Dataset rows for many reciept items at once. Each item is looked up with
+    BM25 first; the items without a strong lexical match are embedded together
+    in a single call, and their lexical and vector rankings fused.
+    """
+
+    def __init__(
+        self,
+        index: VectorIndex,
+        keywords: KeywordIndex,
+        embeddings: Embeddings,
+        k: int = 2,
+        min_lexical_score: float = 3.0,
+        name_field: str = "Food product",
+    ) -> None:
+        self.index: VectorIndex = index
+        self.keywords: KeywordIndex = keywords
+        self.embeddings: Embeddings = embeddings
+        self.k: int = k
+        self.min_lexical_score: float = min_lexical_score
+        # a long row is split over several chunks, only the first has its name
+        prefix = f"{name_field}: "
+        self._names: Dict[int, str] = {}
+        for d in index.documents:
+            first = d["page_content"].split("\n", 1)[0]
+            if first.startswith(prefix):
+                self._names[d["metadata"]["row"]] = first[len(prefix) :].strip()
+
+    def products(self, items: Sequence[str]) -> List[str]:
+        """Names of the top `k` rows for each item, each name listed once."""
+        with RETRIEVER_LATENCY.time():
+            lexical = [self.keywords.search(item, self.k) for item in items]
+            rankings = [[i for i, _ in hits] for hits in lexical]
+            weak = [
+                n
+                for n, hits in enumerate(lexical)
+                if not hits or hits[0][1] < self.min_lexical_score
+            ]
+            RETRIEVALS.labels("lexical").inc(len(items) - len(weak))
+            if weak:
+                RETRIEVALS.labels("hybrid").inc(len(weak))
+                # one batched call, embedded as queries as embed_query would
+                vectors = self.embeddings.embed_documents(
+                    [items[n] for n in weak], task_type="retrieval_query"
+                )
+                for n, vector in zip(weak, vectors):
+                    rankings[n] = fuse([rankings[n], self.index.rank(vector, self.k)])
+            rows = [
+                self.index.documents[i]["metadata"]["row"]
+                for ranking in rankings
+                for i in ranking[: self.k]
+            ]
+            return [self._names[r] for r in dict.fromkeys(rows) if r in self._names]
+
+
+class IndexRetriever(BaseRetriever):
+    """LangChain retriever over a VectorIndex."""
+
+    index: Any
+    embeddings: Any
+    k: int = 4
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: Optional[CallbackManagerForRetrieverRun] = None
+    ) -> List[Document]:
+        with RETRIEVER_LATENCY.time():
+            RETRIEVALS.labels("vector").inc()
+            return self.index.search(self.embeddings.embed_query(query), self.k)
@@ -0,0 +1,249 @@
+import queue
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Iterator, Optional
+from google.api_core import exceptions as api_exceptions
+from carbon_scanner.config import config
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class Deadline:
+    """
+    A request's overall time budget, passed down so every model call it makes
+    (including retries and hedges) fits inside it.
+    """
+
+    def __init__(self, seconds: float) -> None:
+        self.expires_at: float = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def budget(self, cap: float) -> float:
+        """Time allowed for the next attempt, at most `cap` seconds."""
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded("Request deadline exceeded")
+        return min(cap, remaining)
+
+
+# Upstream errors worth another attempt; anything else (bad request, blocked
+# content, unparseable output) would fail the same way again
+RETRYABLE = (
+    TimeoutError,
+    ConnectionError,
+    api_exceptions.TooManyRequests,
+    api_exceptions.ResourceExhausted,
+    api_exceptions.InternalServerError,
+    api_exceptions.ServiceUnavailable,
+    api_exceptions.GatewayTimeout,
+    api_exceptions.DeadlineExceeded,
+)
+
+
+def is_retryable(error: BaseException) -> bool:
+    return isinstance(error, RETRYABLE) and not isinstance(error, DeadlineExceeded)
+
+
+class RetryPolicy:
+    """Up to `attempts` tries, with full jitter exponential backoff between them."""
+
+    def __init__(
+        self, attempts: int = 3, base_delay: float = 0.5, max_delay: float = 8.0
+    ) -> None:
+        self.attempts: int = max(1, attempts)
+        self.base_delay: float = base_delay
+        self.max_delay: float = max_delay
+
+    def backoff(self, retry: int) -> float:
+        """Delay before retry number `retry` (1 based)."""
+        cap = min(self.max_delay, self.base_delay * 2 ** (retry - 1))
+        return random.uniform(0, cap)
+
+
+class LatencyTracker:
+    """Percentiles over the most recent `window` successful call latencies."""
+
+    def __init__(self, window: int = 500) -> None:
+        self._samples: "deque[float]" = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < 20:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * q / 100))]
+
+
+class HedgePolicy:
+    """
+    Fires one duplicate request once the first has been outstanding longer
+    than the `percentile` latency of recent calls (or `min_delay` seconds,
+    whichever is longer). The first successful reply wins.
+    """
+
+    def __init__(self, percentile: float = 95.0, min_delay: float = 1.0) -> None:
+        self.percentile: float = percentile
+        self.min_delay: float = min_delay
+
+    def delay(self, tracker: LatencyTracker) -> float:
+        observed = tracker.percentile(self.percentile)
+        return max(self.min_delay, observed or 0.0)
+
+
+def retry_policy() -> RetryPolicy:
+    """The configured retry policy for model calls."""
+    return RetryPolicy(
+        config.MODEL_ATTEMPTS,
+        config.MODEL_RETRY_BASE_DELAY,
+        config.MODEL_RETRY_MAX_DELAY,
+    )
+
+
+def hedge_policy() -> Optional[HedgePolicy]:
+    """The configured hedge policy for model calls, None if hedging is off."""
+    if config.MODEL_HEDGE_PERCENTILE <= 0:
+        return None
+    return HedgePolicy(config.MODEL_HEDGE_PERCENTILE, config.MODEL_HEDGE_MIN_DELAY)
+
+
+def hedged_stream(
+    start: Callable[[], Iterator[Any]],
+    deadline: Deadline,
+    retry: RetryPolicy,
+    hedge: Optional[HedgePolicy] = None,
+    tracker: Optional[LatencyTracker] = None,
+    on_extra: Optional[Callable[[str], None]] = None,
+) -> Iterator[Any]:
+    """
+    Iterates the stream returned by `start()`, hedged on time to first chunk.
+
+    Failures before the first chunk are retried with backoff while the deadline
+    allows. Once a chunk has been yielded the winning stream is followed to the
+    end and its errors are raised as they are.
+    """
+    tracker = tracker or LatencyTracker()
+    for attempt in range(1, retry.attempts + 1):
+        try:
+            yield from _first_to_respond(start, deadline, hedge, tracker, on_extra)
+            return
+        except _NoChunks as e:
+            delay = retry.backoff(attempt)
+            if (
+                attempt == retry.attempts
+                or not is_retryable(e.error)
+                or delay >= deadline.remaining()
+            ):
+                raise e.error
+            if on_extra:
+                on_extra("retry")
+            time.sleep(delay)
+
+
+class _NoChunks(Exception):
+    def __init__(self, error: BaseException) -> None:
+        self.error = error
+
+
+def _run(
+    runner: int,
+    start: Callable[[], Iterator[Any]],
+    events: "queue.Queue[Any]",
+    stop: threading.Event,
+) -> None:
+    stream = None
+    try:
+        stream = start()
+        for chunk in stream:
+            if stop.is_set():
+                break
+            events.put((runner, chunk, None))
+    except Exception as e:
+        events.put((runner, None, e))
+        return
+    finally:
+        close = getattr(stream, "close", None)
+        if close:
+            close()
+    events.put((runner, _END, None))
+
+
+_END = object()
+
+
+def _first_to_respond(
+    start: Callable[[], Iterator[Any]],
+    deadline: Deadline,
+    hedge: Optional[HedgePolicy],
+    tracker: LatencyTracker,
+    on_extra: Optional[Callable[[str], None]],
+) -> Iterator[Any]:
+    events: "queue.Queue[Any]" = queue.Queue()
+    stops = []
+    began = time.monotonic()
+
+    def launch() -> None:
+        stop = threading.Event()
+        stops.append(stop)
+        threading.Thread(
+            target=_run,
+            args=(len(stops) - 1, start, events, stop),
+            name="llm-stream",
+            daemon=True,
+        ).start()
+
+    launch()
+    hedge_at = began + hedge.delay(tracker) if hedge else None
+    winner, running, error = None, 1, None
+    try:
+        while True:
+            wait = deadline.remaining()
+            if winner is None and hedge_at is not None:
+                wait = min(wait, max(0.0, hedge_at - time.monotonic()))
+            try:
+                runner, chunk, failure = events.get(timeout=wait)
+            except queue.Empty:
+                due = hedge_at is not None and time.monotonic() >= hedge_at
+                if winner is None and due:
+                    hedge_at = None
+                    if on_extra:
+                        on_extra("hedge")
+                    launch()
+                    running += 1
+                else:
+                    deadline.budget(0)  # raises once the deadline has passed
+                continue
+            if winner is not None and runner != winner:
+                continue
+            if failure is not None or chunk is _END:
+                if winner is not None:
+                    if failure is not None:
+                        raise failure
+                    return
+                running -= 1
+                error = failure or ValueError("Model returned an empty response")
+                if running == 0:
+                    raise _NoChunks(error)
+                continue
+            if winner is None:
+                winner = runner
+                # a losing primary is recorded at its elapsed time, otherwise
+                # the slow tail that triggers hedges would go unseen
+                tracker.record(time.monotonic() - began)
+                for i, stop in enumerate(stops):
+                    if i != winner:
+                        stop.set()
+            yield chunk
+    finally:
+        for stop in stops:
+            stop.set()
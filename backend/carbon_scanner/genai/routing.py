@@ -0,0 +1,103 @@
+import threading
+from collections import deque
+from typing import Optional, Sequence, Tuple
+from carbon_scanner.config import config
+from carbon_scanner.metrics import MODEL_ESCALATIONS, MODEL_ROUTED
+
+TIERS = ("fast", "strong")
+# what a request may ask for, "auto" leaves it to the router
+REQUEST_TIERS = ("auto",) + TIERS
+
+
+class ModelRouter:
+    """
+    Picks the fast or strong model for a request.
+
+    An explicit tier is honoured as-is. Otherwise long prompts and large
+    images go to the strong model, as do requests while the fast model's
+    recent confidence average is below `min_confidence`; one in
+    `probe_every` of those still tries the fast model so the history can
+    recover. Fast answers whose confidence is below `min_confidence` are
+    escalated by the caller, see needs_escalation.
+    """
+
+    def __init__(
+        self,
+        max_fast_chars: int = 4000,
+        max_fast_pixels: int = 2_000_000,
+        min_confidence: float = 0.5,
+        window: int = 50,
+        probe_every: int = 10,
+    ) -> None:
+        self.max_fast_chars: int = max_fast_chars
+        self.max_fast_pixels: int = max_fast_pixels
+        self.min_confidence: float = min_confidence
+        self.probe_every: int = max(1, probe_every)
+        self._confidences: "deque[float]" = deque(maxlen=window)
+        self._skipped: int = 0
+        self._lock = threading.Lock()
+
+    def _degraded(self) -> bool:
+        with self._lock:
+            if len(self._confidences) < self._confidences.maxlen // 2:
+                return False
+            mean = sum(self._confidences) / len(self._confidences)
+            if mean >= self.min_confidence:
+                return False
+            self._skipped += 1
+            return self._skipped % self.probe_every != 0
+
+    def _reason(
+        self, tier: Optional[str], chars: int, pixels: int, history: bool
+    ) -> Tuple[str, str]:
+        if tier in TIERS:
+            return tier, "requested"
+        if tier not in (None, "", "auto"):
+            raise ValueError(f"tier must be one of {', '.join(REQUEST_TIERS)}")
+        if self.max_fast_chars and chars > self.max_fast_chars:
+            return "strong", "input_size"
+        if self.max_fast_pixels and pixels > self.max_fast_pixels:
+            return "strong", "resolution"
+        if history and self._degraded():
+            return "strong", "confidence_history"
+        return "fast", "default"
+
+    def choose(
+        self,
+        tier: Optional[str] = None,
+        chars: int = 0,
+        pixels: int = 0,
+        history: bool = True,
+    ) -> str:
+        """
+        Returns the tier to call.
+
+        Parameters:
+            tier: "fast", "strong", or None/"auto" to decide from the input.
+            chars: Length of the text sent to the model.
+            pixels: Width * height of the image sent to the model, if any.
+            history: Whether the fast model's recent confidences apply, only
+                for calls that return confidence values.
+        """
+        chosen, reason = self._reason(tier, chars, pixels, history)
+        MODEL_ROUTED.labels(chosen, reason).inc()
+        return chosen
+
+    def record(self, confidences: Sequence[float]) -> None:
+        """Adds confidences returned by the fast model to the history."""
+        with self._lock:
+            self._confidences.extend(confidences)
+
+    def needs_escalation(self, confidence: float) -> bool:
+        return confidence < self.min_confidence
+
+    def escalated(self, call: str, count: int = 1) -> None:
+        MODEL_ESCALATIONS.labels(call).inc(count)
+
+
+router = ModelRouter(
+    config.ROUTE_MAX_FAST_CHARS,
+    config.ROUTE_MAX_FAST_PIXELS,
+    config.ESCALATION_CONFIDENCE,
+    config.ROUTE_HISTORY,
+)
@@ -0,0 +1,137 @@
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+from carbon_scanner.metrics import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize(prompt: str) -> str:
+    return " ".join(prompt.lower().split())
+
+
+class SemanticCache:
+    """
+    Answer cache keyed on prompt meaning rather than exact text.
+
+    Each prompt is embedded and compared by cosine similarity against the
+    prompts answered before; a match at or above `threshold` returns the
+    stored answer. Entries expire after `ttl` seconds and the least recently
+    used one is evicted once `max_entries` are stored. Answers only match
+    prompts in the same namespace, e.g. the model that produced them.
+    """
+
+    def __init__(
+        self,
+        embed: Callable[[str], List[float]],
+        name: str = "semantic",
+        threshold: float = 0.93,
+        max_entries: int = 2048,
+        ttl: float = 24 * 3600,
+    ) -> None:
+        self.embed: Callable[[str], List[float]] = embed
+        self.threshold: float = threshold
+        self.max_entries: int = max_entries
+        self.ttl: float = ttl
+        # rows of unit vectors, allocated once the embedding size is known
+        self._vectors: Optional[np.ndarray] = None
+        self._answers: List[Optional[str]] = [None] * max_entries
+        self._prompts: List[Optional[Tuple[str, str]]] = [None] * max_entries
+        self._namespaces = np.full(max_entries, None, dtype=object)
+        self._created = np.zeros(max_entries)
+        self._used = np.zeros(max_entries)
+        self._active = np.zeros(max_entries, dtype=bool)
+        self._exact: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+        self._stats: Dict[str, int] = {"exact_hits": 0, "semantic_hits": 0, "misses": 0}
+        self._counters = {
+            outcome: CACHE_REQUESTS.labels(name, outcome) for outcome in self._stats
+        }
+
+    def _count(self, outcome: str) -> None:
+        self._stats[outcome] += 1
+        self._counters[outcome].inc()
+
+    def _live(self, now: float) -> np.ndarray:
+        return self._active & (self._created >= now - self.ttl)
+
+    def _hit(self, row: int, now: float, outcome: str) -> str:
+        self._used[row] = now
+        self._count(outcome)
+        return self._answers[row]
+
+    def _lookup(
+        self, key: Tuple[str, str], vector: Optional[np.ndarray]
+    ) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            live = self._live(now) & (self._namespaces == key[0])
+            row = self._exact.get(key)
+            if row is not None and live[row]:
+                return self._hit(row, now, "exact_hits")
+            if vector is None or self._vectors is None or not live.any():
+                return None
+            scores = self._vectors @ vector
+            scores[~live] = -np.inf
+            row = int(np.argmax(scores))
+            if scores[row] >= self.threshold:
+                return self._hit(row, now, "semantic_hits")
+            return None
+
+    def _store(self, key: Tuple[str, str], vector: np.ndarray, answer: str) -> None:
+        now = time.time()
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, len(vector)), np.float32)
+            free = np.flatnonzero(~self._live(now))
+            row = int(free[0]) if len(free) else int(np.argmin(self._used))
+            old = self._prompts[row]
+            if old is not None and self._exact.get(old) == row:
+                del self._exact[old]
+            self._vectors[row] = vector
+            self._answers[row] = answer
+            self._prompts[row] = key
+            self._namespaces[row] = key[0]
+            self._created[row] = self._used[row] = now
+            self._active[row] = True
+            self._exact[key] = row
+
+    def _vector(self, text: str) -> np.ndarray:
+        vector = np.asarray(self.embed(text), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def get_or_compute(
+        self, prompt: str, compute: Callable[[], str], namespace: str = ""
+    ) -> str:
+        """Returns a cached answer to an equivalent prompt, or computes and stores one."""
+        text = _normalize(prompt)
+        key = (namespace, text)
+        cached = self._lookup(key, None)
+        if cached is not None:
+            return cached
+        try:
+            vector = self._vector(text)
+        except Exception as e:
+            logger.warning("semantic cache skipped, embedding failed: %s", e)
+            return compute()
+        cached = self._lookup(key, vector)
+        if cached is not None:
+            return cached
+        with self._lock:
+            self._count("misses")
+        answer = compute()
+        self._store(key, vector, answer)
+        return answer
+
+    def stats(self) -> Dict[str, float]:
+        """Returns hit/miss counters, the hit rate and the number of live entries."""
+        with self._lock:
+            lookups = sum(self._stats.values())
+            hits = lookups - self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "entries": int(self._live(time.time()).sum()),
+            }
@@ -0,0 +1,61 @@
+import json
+import re
+from typing import Dict, List, Tuple
+
+# Quoted or bare, with or without a leading digit ("0.7" and ".7" alike)
+_NUMBER = r"""["']?(-?(?:\d+(?:\.\d+)?|\.\d+)(?:[eE][-+]?\d+)?)["']?"""
+
+# One `<item name>: [<carbon cost>, <confidence>]` entry. Keys may be double
+# quoted, single quoted or bare; anything between entries (code fences,
+# braces, prose, trailing commas) is skipped.
+_ENTRY = re.compile(
+    r"""(?:"((?:[^"\\\n]|\\.)*)"|'([^'\n]*)'|([A-Za-z][^:{}\[\],"'\n]*?))"""
+    rf"""\s*:\s*\[\s*{_NUMBER}\s*,\s*{_NUMBER}\s*\]"""
+)
+
+
+def _key(match: "re.Match[str]") -> str:
+    double, single, bare = match.group(1, 2, 3)
+    if double is not None:
+        try:
+            return json.loads(f'"{double}"')
+        except ValueError:
+            return double
+    return (single if single is not None else bare).strip()
+
+
+class EstimateStreamParser:
+    """
+    Incrementally extracts {item: [carbon cost, confidence]} entries from
+    model output as it streams in.
+
+    Each call to feed() returns the entries completed by that chunk, so an
+    item is available as soon as its closing bracket arrives.
+    """
+
+    def __init__(self) -> None:
+        self._buffer: str = ""
+        self.entries: int = 0
+
+    def feed(self, chunk: str) -> List[Tuple[str, List[float]]]:
+        self._buffer += chunk
+        parsed = []
+        end = 0
+        for match in _ENTRY.finditer(self._buffer):
+            parsed.append((_key(match), [float(match.group(4)), float(match.group(5))]))
+            end = match.end()
+        # Only the unfinished tail can still become an entry
+        self._buffer = self._buffer[end:]
+        self.entries += len(parsed)
+        return parsed
+
+
+def parse_estimates(text: str) -> Dict[str, List[float]]:
+    """
+    Parses a complete model response, tolerating code fences, surrounding
+    prose, single quotes and trailing commas.
+    """
+    estimates = dict(EstimateStreamParser().feed(text))
+    if not estimates and text.strip():
+        raise ValueError(f"No estimates found in model output: {text[:200]!r}")
+    return estimates
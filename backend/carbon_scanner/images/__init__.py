@@ -1,3 +1,10 @@
 from carbon_scanner.images.image_uploader import ImageUploader
+from carbon_scanner.images.preprocess import (
+    InvalidImage,
+    PreparedImage,
+    PreprocessReport,
+    load_prepared,
+    preprocess_image,
+)
 
-__all__ = ['ImageUploader']
+__all__ = ['ImageUploader', 'InvalidImage', 'PreparedImage', 'PreprocessReport', 'load_prepared', 'preprocess_image']
@@ -0,0 +1,177 @@
+import io
+import math
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+from PIL import ExifTags, Image, ImageOps, ImageStat
+from carbon_scanner.config import config
+
+
+class InvalidImage(ValueError):
+    """The upload is not an image Pillow can decode, retrying will not help."""
+
+
+@dataclass
+class PreprocessReport:
+    """Sizes and per stage latencies (in milliseconds) of one preprocessing run."""
+
+    original_bytes: int
+    final_bytes: int = 0
+    original_size: tuple = (0, 0)
+    final_size: tuple = (0, 0)
+    grayscale: bool = False
+    reencoded: bool = True
+    timings: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.original_bytes - self.final_bytes
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "original_bytes": self.original_bytes,
+            "final_bytes": self.final_bytes,
+            "bytes_saved": self.bytes_saved,
+            "original_size": list(self.original_size),
+            "final_size": list(self.final_size),
+            "grayscale": self.grayscale,
+            "reencoded": self.reencoded,
+            "timings": self.timings,
+        }
+
+
+@dataclass
+class PreparedImage:
+    """
+    An upload re-encoded for the model.
+
+    `data` is sent to Gemini as-is; handing the SDK a PIL image instead would
+    make it re-encode the pixels as lossless WebP.
+    """
+
+    image: Image.Image
+    data: bytes
+    mime_type: str
+    report: PreprocessReport
+
+    @property
+    def part(self) -> Dict[str, Any]:
+        return {"mime_type": self.mime_type, "data": self.data}
+
+
+def _is_monochrome(image: Image.Image, max_saturation: float) -> bool:
+    # A small thumbnail is enough to judge how colourful the photo is; resizing
+    # straight to it avoids copying the full image first
+    scale = min(1.0, 64 / max(image.size))
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    sample = image.resize(size, Image.Resampling.NEAREST)
+    hsv = sample.convert("RGB").convert("HSV")
+    saturation = ImageStat.Stat(hsv.getchannel("S")).mean[0]
+    return saturation <= max_saturation
+
+
+def preprocess_image(
+    data: bytes,
+    max_edge: Optional[int] = None,
+    quality: Optional[int] = None,
+    max_saturation: Optional[float] = None,
+) -> PreparedImage:
+    """
+    Prepares an uploaded image for the model: fixes EXIF orientation, drops
+    colour when the photo is essentially monochrome, downsamples so the longest
+    edge is at most `max_edge` and re-encodes as JPEG at `quality`.
+
+    Raises InvalidImage if `data` cannot be decoded.
+    """
+    max_edge = max_edge or config.IMAGE_MAX_EDGE
+    quality = quality or config.IMAGE_JPEG_QUALITY
+    if max_saturation is None:
+        max_saturation = config.IMAGE_GRAYSCALE_MAX_SATURATION
+    report = PreprocessReport(original_bytes=len(data))
+
+    def timed(stage: str, start: float) -> None:
+        report.timings[stage] = round((time.perf_counter() - start) * 1000, 2)
+
+    start = time.perf_counter()
+    try:
+        image = Image.open(io.BytesIO(data))
+        report.original_size = image.size
+        scale = max_edge / max(image.size)
+        if scale < 1:
+            # Lets JPEG decode straight to a reduced scale that still covers max_edge
+            image.draft(
+                image.mode,
+                (math.ceil(image.width * scale), math.ceil(image.height * scale)),
+            )
+        image.load()
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise InvalidImage(f"Unreadable image: {e}") from e
+    timed("decode", start)
+
+    original_format = image.format
+    original_mode = image.mode
+    upright = image.getexif().get(ExifTags.Base.Orientation, 1) == 1
+
+    start = time.perf_counter()
+    if not upright:
+        image = ImageOps.exif_transpose(image)
+    timed("orient", start)
+
+    start = time.perf_counter()
+    if _is_monochrome(image, max_saturation):
+        image = image.convert("L")
+        report.grayscale = True
+    elif image.mode != "RGB":
+        image = image.convert("RGB")
+    timed("grayscale", start)
+
+    start = time.perf_counter()
+    if max(image.size) > max_edge:
+        image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+    report.final_size = image.size
+    timed("resize", start)
+
+    start = time.perf_counter()
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality, optimize=True)
+    encoded = buffer.getvalue()
+    mime_type = "image/jpeg"
+    # Small, upright uploads can come out larger after a lossy re-encode
+    if (
+        len(encoded) >= len(data)
+        and upright
+        and image.size == report.original_size
+        and original_format in ("JPEG", "PNG", "WEBP")
+    ):
+        encoded, mime_type = data, Image.MIME[original_format]
+        # the model gets the upload as it was, colour included
+        report.reencoded = False
+        report.grayscale = original_mode in ("1", "L", "LA")
+    report.final_bytes = len(encoded)
+    timed("encode", start)
+
+    return PreparedImage(image=image, data=encoded, mime_type=mime_type, report=report)
+
+
+def load_prepared(data: bytes) -> PreparedImage:
+    """
+    Wraps bytes preprocess_image already produced, e.g. a queued job's payload,
+    without decoding and re-encoding them again.
+
+    Raises InvalidImage if `data` is not an image.
+    """
+    try:
+        # only reads the header, the size and format are all that is needed
+        image = Image.open(io.BytesIO(data))
+        mime_type = Image.MIME[image.format]
+    except (OSError, ValueError, KeyError) as e:
+        raise InvalidImage(f"Unreadable image: {e}") from e
+    report = PreprocessReport(
+        original_bytes=len(data),
+        final_bytes=len(data),
+        original_size=image.size,
+        final_size=image.size,
+        grayscale=image.mode in ("1", "L", "LA"),
+        reencoded=False,
+    )
+    return PreparedImage(image=image, data=data, mime_type=mime_type, report=report)
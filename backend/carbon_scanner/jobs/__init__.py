@@ -0,0 +1,4 @@
+from carbon_scanner.jobs.job_queue import Job, JobQueue
+from carbon_scanner.jobs.worker import WorkerPool
+
+__all__ = ['Job', 'JobQueue', 'WorkerPool']
@@ -0,0 +1,208 @@
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+
+@dataclass
+class Job:
+    """A claimed job. `attempt` doubles as the lease token for completing it."""
+
+    id: str
+    payload: bytes
+    options: Dict[str, Any]
+    attempt: int
+    max_attempts: int
+
+
+class JobQueue:
+    """
+    Durable job queue in a SQLite table.
+
+    A claimed job stays invisible to other workers for `visibility_timeout`
+    seconds. If its worker dies it becomes claimable again, so queued and
+    running jobs survive restarts. Failed attempts are retried with
+    exponential backoff up to `max_attempts`, unless the failure is
+    permanent. Every `purge_every` finished jobs, those finished more than
+    `retention` seconds ago are deleted.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        visibility_timeout: float = 300.0,
+        max_attempts: int = 3,
+        retry_delay: float = 5.0,
+        retention: float = 7 * 24 * 3600,
+        purge_every: int = 512,
+    ) -> None:
+        self.visibility_timeout: float = visibility_timeout
+        self.max_attempts: int = max_attempts
+        self.retry_delay: float = retry_delay
+        self.retention: float = retention
+        self.purge_every: int = max(1, purge_every)
+        self._finished: int = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            payload BLOB,
+            options TEXT NOT NULL,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL,
+            result TEXT,
+            error TEXT,
+            visible_at REAL NOT NULL,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL)"""
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_claimable ON jobs (status, visible_at)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (status, updated_at)"
+        )
+        self._conn.commit()
+
+    def submit(self, payload: bytes, options: Optional[Dict[str, Any]] = None) -> str:
+        """Queues a job and returns its id."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """INSERT INTO jobs (id, payload, options, status, max_attempts,
+                visible_at, created_at, updated_at)
+                VALUES (?, ?, ?, 'queued', ?, ?, ?, ?)""",
+                (
+                    job_id,
+                    payload,
+                    json.dumps(options or {}),
+                    self.max_attempts,
+                    now,
+                    now,
+                    now,
+                ),
+            )
+            self._conn.commit()
+        return job_id
+
+    def claim(self) -> Optional[Job]:
+        """Leases the oldest visible job, or returns None if there is nothing to do."""
+        now = time.time()
+        with self._lock:
+            # Running jobs whose lease ran out on their last attempt are given up
+            self._conn.execute(
+                """UPDATE jobs SET status = 'failed', payload = NULL,
+                error = COALESCE(error, 'visibility timeout expired'), updated_at = ?
+                WHERE status = 'running' AND visible_at <= ? AND attempts >= max_attempts""",
+                (now, now),
+            )
+            row = self._conn.execute(
+                """UPDATE jobs SET status = 'running', attempts = attempts + 1,
+                visible_at = ?, updated_at = ?
+                WHERE id = (
+                    SELECT id FROM jobs
+                    WHERE status IN ('queued', 'running') AND visible_at <= ?
+                    ORDER BY created_at LIMIT 1)
+                RETURNING id, payload, options, attempts, max_attempts""",
+                (now + self.visibility_timeout, now, now),
+            ).fetchone()
+            self._conn.commit()
+        if not row:
+            return None
+        return Job(row[0], row[1], json.loads(row[2]), row[3], row[4])
+
+    def complete(self, job: Job, result: str) -> bool:
+        """Stores a job's result. Returns False if the lease was lost to another worker."""
+        with self._lock:
+            cursor = self._conn.execute(
+                """UPDATE jobs SET status = 'done', result = ?, error = NULL,
+                payload = NULL, updated_at = ?
+                WHERE id = ? AND attempts = ? AND status = 'running'""",
+                (result, time.time(), job.id, job.attempt),
+            )
+            self._count_finished(cursor.rowcount)
+            self._conn.commit()
+            return cursor.rowcount == 1
+
+    def fail(self, job: Job, error: str, retry: bool = True) -> bool:
+        """
+        Schedules a retry, or marks the job failed once its attempts are used up
+        or `retry` is False.
+        """
+        now = time.time()
+        with self._lock:
+            if retry and job.attempt < job.max_attempts:
+                retry_at = now + self.retry_delay * 2 ** (job.attempt - 1)
+                cursor = self._conn.execute(
+                    """UPDATE jobs SET status = 'queued', error = ?, visible_at = ?,
+                    updated_at = ?
+                    WHERE id = ? AND attempts = ? AND status = 'running'""",
+                    (error, retry_at, now, job.id, job.attempt),
+                )
+            else:
+                cursor = self._conn.execute(
+                    """UPDATE jobs SET status = 'failed', error = ?, payload = NULL,
+                    updated_at = ?
+                    WHERE id = ? AND attempts = ? AND status = 'running'""",
+                    (error, now, job.id, job.attempt),
+                )
+                self._count_finished(cursor.rowcount)
+            self._conn.commit()
+            return cursor.rowcount == 1
+
+    def _count_finished(self, jobs: int) -> None:
+        for _ in range(jobs):
+            self._finished += 1
+            if self._finished % self.purge_every == 0:
+                self._purge()
+
+    def _purge(self) -> int:
+        return self._conn.execute(
+            """DELETE FROM jobs WHERE status IN ('done', 'failed')
+            AND updated_at < ?""",
+            (time.time() - self.retention,),
+        ).rowcount
+
+    def purge_finished(self) -> int:
+        """
+        Deletes jobs that finished more than `retention` seconds ago, returns
+        how many were removed.
+        """
+        with self._lock:
+            removed = self._purge()
+            self._conn.commit()
+            return removed
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Returns the status of a job, with its result or last error."""
+        with self._lock:
+            row = self._conn.execute(
+                """SELECT id, status, attempts, result, error, created_at, updated_at
+                FROM jobs WHERE id = ?""",
+                (job_id,),
+            ).fetchone()
+        if not row:
+            return None
+        return {
+            "id": row[0],
+            "status": row[1],
+            "attempts": row[2],
+            "result": row[3],
+            "error": row[4],
+            "created_at": row[5],
+            "updated_at": row[6],
+        }
+
+    def depth(self) -> int:
+        """Number of queued or running jobs."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')"
+            ).fetchone()[0]
@@ -0,0 +1,69 @@
+import logging
+import threading
+from typing import Callable, List, Tuple, Type
+from carbon_scanner.jobs.job_queue import Job, JobQueue
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerPool:
+    """
+    Threads that claim jobs from a JobQueue and run `handler` on each.
+
+    Exceptions of a `permanent` type fail the job at once, anything else is
+    retried.
+    """
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        handler: Callable[[Job], str],
+        workers: int = 2,
+        poll_interval: float = 1.0,
+        permanent: Tuple[Type[BaseException], ...] = (),
+    ) -> None:
+        self.queue: JobQueue = queue
+        self.handler: Callable[[Job], str] = handler
+        self.workers: int = workers
+        self.poll_interval: float = poll_interval
+        self.permanent: Tuple[Type[BaseException], ...] = permanent
+        self._threads: List[threading.Thread] = []
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(
+                target=self._run, name=f"job-worker-{i}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        self._stop.clear()
+
+    def notify(self) -> None:
+        """Wakes idle workers, call after submitting a job."""
+        self._wakeup.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            job = self.queue.claim()
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            try:
+                result = self.handler(job)
+            except Exception as e:
+                logger.warning("job %s attempt %d failed: %s", job.id, job.attempt, e)
+                self.queue.fail(job, str(e), retry=not isinstance(e, self.permanent))
+            else:
+                self.queue.complete(job, result)
@@ -0,0 +1,21 @@
+from carbon_scanner.metrics.instruments import (
+    ADMISSION_QUEUE_DEPTH,
+    ADMISSION_REJECTED,
+    ADMISSION_WAIT,
+    CACHE_REQUESTS,
+    DB_QUERY_LATENCY,
+    LLM_LATENCY,
+    MODEL_ESCALATIONS,
+    MODEL_EXTRA_CALLS,
+    MODEL_LATENCY,
+    MODEL_ROUTED,
+    MODEL_TOKENS,
+    REQUEST_LATENCY,
+    RETRIEVALS,
+    RETRIEVER_LATENCY,
+    UPLOADED_BYTES,
+    registry,
+    statement_kind,
+)
+
+__all__ = ['registry', 'statement_kind', 'ADMISSION_QUEUE_DEPTH', 'ADMISSION_REJECTED', 'ADMISSION_WAIT', 'CACHE_REQUESTS', 'DB_QUERY_LATENCY', 'LLM_LATENCY', 'MODEL_ESCALATIONS', 'MODEL_EXTRA_CALLS', 'MODEL_LATENCY', 'MODEL_ROUTED', 'MODEL_TOKENS', 'REQUEST_LATENCY', 'RETRIEVALS', 'RETRIEVER_LATENCY', 'UPLOADED_BYTES']
@@ -0,0 +1,109 @@
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram
+
+# Seconds, from a cache hit to a slow multimodal model call
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+# the app's own metrics only, /metrics leaves out the process collectors
+registry = CollectorRegistry()
+
+REQUEST_LATENCY = Histogram(
+    "carbon_scanner_request_seconds",
+    "Time to produce a response, per route. Streams count until the headers.",
+    ("method", "route", "status"),
+    registry=registry,
+    buckets=DEFAULT_BUCKETS,
+)
+UPLOADED_BYTES = Counter(
+    "carbon_scanner_uploaded_bytes_total",
+    "Request body bytes received, per route.",
+    ("route",),
+    registry=registry,
+)
+MODEL_LATENCY = Histogram(
+    "carbon_scanner_model_call_seconds",
+    "Latency of Gemini calls, per calling function.",
+    ("call",),
+    registry=registry,
+    buckets=DEFAULT_BUCKETS,
+)
+MODEL_TOKENS = Counter(
+    "carbon_scanner_model_tokens_total",
+    "Tokens reported by Gemini and the LangChain LLM.",
+    ("model", "kind"),
+    registry=registry,
+)
+MODEL_EXTRA_CALLS = Counter(
+    "carbon_scanner_model_extra_calls_total",
+    "Model calls beyond the first attempt, per client and kind (hedge, retry).",
+    ("client", "kind"),
+    registry=registry,
+)
+MODEL_ROUTED = Counter(
+    "carbon_scanner_model_routed_total",
+    "Model tier picked per request, with the reason it was picked.",
+    ("tier", "reason"),
+    registry=registry,
+)
+MODEL_ESCALATIONS = Counter(
+    "carbon_scanner_model_escalations_total",
+    "Low confidence fast model answers re-asked of the strong model, per call.",
+    ("call",),
+    registry=registry,
+)
+RETRIEVER_LATENCY = Histogram(
+    "carbon_scanner_retriever_seconds",
+    "Time to retrieve dataset chunks for a RAG prompt.",
+    registry=registry,
+    buckets=DEFAULT_BUCKETS,
+)
+RETRIEVALS = Counter(
+    "carbon_scanner_retrievals_total",
+    "RAG retrievals per method; only vector and hybrid ones embed the query.",
+    ("method",),
+    registry=registry,
+)
+LLM_LATENCY = Histogram(
+    "carbon_scanner_llm_seconds",
+    "Time spent in the LangChain LLM, per model.",
+    ("model",),
+    registry=registry,
+    buckets=DEFAULT_BUCKETS,
+)
+DB_QUERY_LATENCY = Histogram(
+    "carbon_scanner_db_query_seconds",
+    "SQLite statement latency, per database and statement kind.",
+    ("database", "statement"),
+    registry=registry,
+    buckets=DEFAULT_BUCKETS,
+)
+CACHE_REQUESTS = Counter(
+    "carbon_scanner_cache_requests_total",
+    "Result cache lookups, per cache and outcome.",
+    ("cache", "result"),
+    registry=registry,
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "carbon_scanner_admission_queue_depth",
+    "Requests waiting for a model call slot.",
+    registry=registry,
+)
+ADMISSION_WAIT = Histogram(
+    "carbon_scanner_admission_wait_seconds",
+    "Time admitted requests waited for a model call slot.",
+    registry=registry,
+    buckets=DEFAULT_BUCKETS,
+)
+ADMISSION_REJECTED = Counter(
+    "carbon_scanner_admission_rejected_total",
+    "Requests answered with 429, per reason.",
+    ("reason",),
+    registry=registry,
+)
+
+
+def statement_kind(sql: str) -> str:
+    """First keyword of a SQL statement, a bounded label value."""
+    return sql.lstrip().split(None, 1)[0].upper() if sql.strip() else "EMPTY"
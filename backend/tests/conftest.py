@@ -0,0 +1,5 @@
+from carbon_scanner.benchmarks.fakes import LatencyDistribution, install_fakes
+
+# The genai package builds its model clients on import, so they are swapped
+# for the offline fakes (and databases for a scratch directory) first
+install_fakes(LatencyDistribution(), LatencyDistribution(), LatencyDistribution())
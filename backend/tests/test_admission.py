@@ -0,0 +1,178 @@
+import threading
+import time
+import pytest
+from carbon_scanner.admission import (
+    AdmissionController,
+    FairQueue,
+    Overloaded,
+    RateLimiter,
+    TokenBucket,
+)
+from carbon_scanner.genai import batch
+
+
+def test_token_bucket_allows_a_burst_then_refills_at_rate():
+    bucket = TokenBucket(rate=2.0, burst=3.0)
+    now = bucket.updated
+    assert [bucket.take(now=now) for _ in range(3)] == [0.0, 0.0, 0.0]
+    # empty: the next token is half a second away at 2 per second
+    assert bucket.take(now=now) == pytest.approx(0.5)
+    assert bucket.take(now=now + 0.5) == 0.0
+    assert bucket.take(now=now + 0.5) == pytest.approx(0.5)
+
+
+def test_token_bucket_never_refills_past_burst():
+    bucket = TokenBucket(rate=10.0, burst=2.0)
+    now = bucket.updated + 60
+    assert bucket.take(2.0, now=now) == 0.0
+    assert bucket.take(1.0, now=now) == pytest.approx(0.1)
+
+
+def test_refused_take_costs_nothing():
+    bucket = TokenBucket(rate=1.0, burst=2.0)
+    now = bucket.updated
+    bucket.take(2.0, now=now)
+    assert bucket.take(1.0, now=now + 0.5) == pytest.approx(0.5)
+    assert bucket.take(1.0, now=now + 1.0) == 0.0
+
+
+def test_costs_above_burst_are_charged_in_full():
+    bucket = TokenBucket(rate=1.0, burst=4.0)
+    now = bucket.updated
+    assert bucket.take(40.0, now=now) == 0.0
+    assert bucket.tokens == -36.0
+    # the debt is paid off at `rate` before anything else gets through
+    assert bucket.take(1.0, now=now) == pytest.approx(37.0)
+    assert bucket.take(40.0, now=now + 39.0) == pytest.approx(1.0)
+    assert bucket.take(40.0, now=now + 40.0) == 0.0
+
+
+def test_rate_limiter_keeps_a_bucket_per_client():
+    limiter = RateLimiter(rate=0.001, burst=1.0)
+    assert limiter.take("a") == 0.0
+    assert limiter.take("a") > 0
+    assert limiter.take("b") == 0.0
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+class Requests:
+    """Queues requests on a FairQueue from threads, recording grant order."""
+
+    def __init__(self, queue):
+        self.queue = queue
+        self.granted = []
+        self.rejected = []
+        self.threads = []
+
+    def send(self, name, client):
+        def run():
+            try:
+                self.queue.acquire(client)
+            except Overloaded:
+                self.rejected.append(name)
+                return
+            self.granted.append(name)
+
+        depth = self.queue.depth
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        self.threads.append(thread)
+        # queue one at a time so arrival order is deterministic
+        wait_for(lambda: self.queue.depth > depth or self.rejected)
+
+    def serve(self, count):
+        for _ in range(count):
+            served = len(self.granted)
+            self.queue.release()
+            wait_for(lambda: len(self.granted) > served)
+
+
+def test_fair_queue_serves_a_light_client_ahead_of_a_heavy_backlog():
+    queue = FairQueue(slots=1, max_depth=10, max_wait=5)
+    queue.acquire("heavy")
+    requests = Requests(queue)
+    for i in range(3):
+        requests.send(f"heavy{i}", "heavy")
+    requests.send("light", "light")
+
+    requests.serve(4)
+    # the heavy client already holds the slot, so its backlog queues behind
+    assert requests.granted == ["light", "heavy0", "heavy1", "heavy2"]
+
+
+def test_full_fair_queue_evicts_the_heaviest_client():
+    queue = FairQueue(slots=1, max_depth=2, max_wait=5)
+    queue.acquire("heavy")
+    requests = Requests(queue)
+    requests.send("heavy0", "heavy")
+    requests.send("heavy1", "heavy")
+    requests.send("light", "light")
+
+    wait_for(lambda: requests.rejected)
+    assert requests.rejected == ["heavy1"]
+    requests.serve(2)
+    assert requests.granted == ["light", "heavy0"]
+
+
+def test_full_fair_queue_turns_away_the_newcomer_with_the_latest_tag():
+    queue = FairQueue(slots=1, max_depth=1, max_wait=5)
+    queue.acquire("heavy")
+    requests = Requests(queue)
+    requests.send("light", "light")
+    with pytest.raises(Overloaded) as error:
+        queue.acquire("heavy")
+    assert error.value.retry_after >= 1.0
+    requests.serve(1)
+    assert requests.granted == ["light"]
+
+
+def test_waiting_past_max_wait_raises():
+    queue = FairQueue(slots=1, max_depth=4, max_wait=0.05)
+    queue.acquire("a")
+    with pytest.raises(Overloaded, match="Timed out"):
+        queue.acquire("b")
+    assert queue.depth == 0
+
+
+def test_charge_takes_no_slot():
+    admission = AdmissionController(
+        RateLimiter(rate=0.001, burst=4.0), FairQueue(slots=1, max_wait=0.05)
+    )
+    admission.charge("a", 6.0)
+    with pytest.raises(Overloaded, match="Rate limit"):
+        admission.charge("a", 1.0)
+    with admission.slot("a"):
+        assert admission.queue._free == 0
+
+
+def test_batch_holds_a_slot_per_running_reciept(monkeypatch):
+    queue = FairQueue(slots=2, max_wait=5)
+    admission = AdmissionController(RateLimiter(rate=1.0, burst=10.0), queue)
+    lock = threading.Lock()
+    running = []
+    peak = []
+
+    def process(data, mode, tier):
+        with lock:
+            running.append(data)
+            peak.append((len(running), queue._free))
+        time.sleep(0.02)
+        with lock:
+            running.remove(data)
+        return "{}"
+
+    monkeypatch.setattr(batch, "_process", process)
+    uploads = [(f"{i}.png", bytes([i])) for i in range(6)]
+    results = list(batch.reciept_batch(uploads, admit=lambda: admission.slot("a")))
+
+    assert sorted(r["index"] for r in results) == list(range(6))
+    # every running reciept holds one of the slots taken
+    assert all(count <= 2 - free for count, free in peak)
+    assert max(count for count, _ in peak) == 2
+    assert queue._free == 2
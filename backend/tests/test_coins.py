@@ -0,0 +1,85 @@
+import asyncio
+import sqlite3
+import uuid
+from carbon_scanner.database import sqllite_manager
+from carbon_scanner.database.db_manager import DatabaseManager
+
+
+def ledger(path, user_id):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(
+            "SELECT amount, balance FROM coin_ledger WHERE user_id = ? ORDER BY id",
+            (user_id,),
+        ).fetchall()
+    finally:
+        conn.close()
+
+
+def new_user(coins=100):
+    # the coins database outlives a test, so every test gets fresh names
+    name = f"user-{uuid.uuid4().hex}"
+    sqllite_manager.insert_user(name, coins)
+    return name, sqllite_manager.get_user(name)[0]
+
+
+def test_repeated_key_applies_once():
+    name, user_id = new_user()
+    assert sqllite_manager.inc_coins(name, 10, "k1") == (110,)
+    assert sqllite_manager.inc_coins(name, 10, "k1") == (110,)
+    assert sqllite_manager.get_coins(name) == (110,)
+    assert ledger(sqllite_manager.config.CARBON_DB_PATH, user_id) == [
+        (100, 100),
+        (10, 110),
+    ]
+
+
+def test_idempotency_keys_are_per_user():
+    alice, _ = new_user()
+    bob, _ = new_user()
+    assert sqllite_manager.inc_coins(alice, 10, "k1") == (110,)
+    assert sqllite_manager.inc_coins(bob, 10, "k1") == (110,)
+    assert sqllite_manager.inc_coins(bob, 5, "k1") == (110,)
+    assert sqllite_manager.get_coins(bob) == (110,)
+
+
+def test_ledger_sums_to_the_balance():
+    name, user_id = new_user(coins=3)
+    sqllite_manager.inc_coins(name, 4)
+    sqllite_manager.set_coins(name, 20)
+    sqllite_manager.inc_coins(name, -5, "spend")
+    rows = ledger(sqllite_manager.config.CARBON_DB_PATH, user_id)
+    assert sum(amount for amount, _ in rows) == rows[-1][1] == 15
+    assert sqllite_manager.get_coins(name) == (15,)
+
+
+def test_unknown_user_changes_nothing():
+    assert sqllite_manager.inc_coins(f"missing-{uuid.uuid4().hex}", 10, "k") is None
+
+
+def test_database_manager_keys_are_per_user(tmp_path):
+    path = str(tmp_path / "app.db")
+    db = DatabaseManager(path)
+
+    async def run():
+        for email in ("alice@example.com", "bob@example.com"):
+            await db.create_user(
+                {
+                    "email": email,
+                    "password_hash": "hash",
+                    "password_salt": "salt",
+                    "created_at": "2024-01-01T00:00:00",
+                }
+            )
+        alice = await db.get_user_by_email("alice@example.com")
+        return [
+            await db.change_coins(alice["id"], 10, "k1"),
+            await db.change_coins(alice["id"], 10, "k1"),
+            await db.change_coins(alice["id"], -20, "k2"),
+            await db.update_coins_by_email("bob@example.com", 10, "k1"),
+            await db.get_coins_by_id(alice["id"]),
+        ]
+
+    assert asyncio.run(run()) == [10, 10, None, True, 10]
+    assert ledger(path, 2) == [(10, 10)]
+
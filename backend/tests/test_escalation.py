@@ -0,0 +1,51 @@
+import pytest
+from carbon_scanner.genai import lang_chain_process
+
+HELD_BACK = {
+    "Beef mince": [20.0, 0.3],
+    "Kale chips": [2.0, 0.4],
+    "Rice": [4.0, 0.2],
+}
+
+
+def strong_answer(*entries, error=None):
+    def stream(items, deadline, tier):
+        assert tier == "strong" and items == list(HELD_BACK)
+        yield from entries
+        if error is not None:
+            raise error
+
+    return stream
+
+
+def escalate(monkeypatch, stream):
+    monkeypatch.setattr(lang_chain_process, "_stream_estimates", stream)
+    return list(lang_chain_process._escalate(dict(HELD_BACK), None, "list_resp"))
+
+
+def test_items_the_strong_model_leaves_out_keep_the_fast_estimate(monkeypatch):
+    stream = strong_answer(("Rice", [4.5, 0.8]), ("beef, minced", [27.0, 1.0]))
+    scored = escalate(monkeypatch, stream)
+
+    # strong answers first, then the fast model's for what it skipped or renamed
+    assert scored[0] == ("Rice", 3.6)
+    assert dict(scored) == {"Rice": 3.6, "Beef mince": 6.0, "Kale chips": 0.8}
+    assert len(scored) == 3
+
+
+def test_repeated_strong_entries_are_scored_once(monkeypatch):
+    stream = strong_answer(("Rice", [4.5, 0.8]), ("Rice", [9.0, 0.9]))
+    scored = escalate(monkeypatch, stream)
+    assert [item for item, _ in scored].count("Rice") == 1
+    assert dict(scored)["Rice"] == 3.6
+
+
+@pytest.mark.parametrize("entries", [(), (("Rice", [4.5, 0.8]),)])
+def test_failed_escalation_falls_back_to_the_fast_estimates(monkeypatch, entries):
+    stream = strong_answer(*entries, error=TimeoutError("deadline"))
+    scored = dict(escalate(monkeypatch, stream))
+    assert scored == {
+        "Beef mince": 6.0,
+        "Kale chips": 0.8,
+        "Rice": 3.6 if entries else 0.8,
+    }
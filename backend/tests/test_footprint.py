@@ -0,0 +1,125 @@
+import json
+import numpy as np
+import pytest
+from carbon_scanner.app import app
+from carbon_scanner.genai import footprint
+from carbon_scanner.genai.footprint import LineItem, parse_line_item
+from carbon_scanner.genai.lang_chain_process import line_items, list_resp
+
+
+@pytest.mark.parametrize(
+    "text, kilograms",
+    [
+        ("2 x Milk 1L", 2.0),
+        ("500g Beef mince", 0.5),
+        ("Rice", 1.0),
+        ("Oats 16 oz", 0.454),
+    ],
+)
+def test_parsed_lines_convert_to_kilograms(text, kilograms):
+    assert parse_line_item(text).kilograms == pytest.approx(kilograms, abs=1e-3)
+
+
+def test_units_are_case_insensitive():
+    assert LineItem("Milk", 50, "CL").kilograms == pytest.approx(0.5)
+
+
+@pytest.mark.parametrize("unit", ["pcs", "each", ""])
+def test_unknown_units_are_rejected(unit):
+    with pytest.raises(ValueError, match="Unknown unit"):
+        LineItem("Eggs", 6, unit)
+
+
+class Table:
+    """Two rows of a compiled dataset, Milk missing its processing stage."""
+
+    version = "test"
+
+    def column(self, name):
+        stages = {
+            "Rice": [0.0, 0.0, 3.0, 0.1, 0.1, 0.1, 0.1],
+            "Milk": [0.5, 0.2, 1.5, float("nan"), 0.1, 0.1, 0.3],
+        }
+        if name == "Food product":
+            return np.array(list(stages), dtype=object)
+        index = [column for column, _ in footprint.STAGES].index(name)
+        return np.array([row[index] for row in stages.values()])
+
+
+@pytest.fixture
+def factors(monkeypatch):
+    factors = footprint.EmissionsFactors(Table())
+    monkeypatch.setattr(footprint, "current_factors", lambda: factors)
+    return factors
+
+
+def test_footprints_scale_each_stage_by_quantity(factors):
+    items = [LineItem("Rice", 500, "g"), LineItem("Milk", 2, "l")]
+    scored = footprint.score_items(items)
+    assert [(i["name"], i["kilograms"], i["footprint"]) for i in scored["items"]] == [
+        ("Rice", 0.5, 1.7),
+        ("Milk", 2.0, 5.4),
+    ]
+    assert scored["stages"]["Farm"] == pytest.approx(0.5 * 3.0 + 2 * 1.5)
+    assert scored["total"] == pytest.approx(7.1)
+
+
+def test_missing_stages_count_as_zero(factors):
+    scored = footprint.score_items([LineItem("Milk", 1)])
+    assert scored["stages"]["Processing"] == 0.0
+    assert scored["total"] == pytest.approx(2.7)
+
+
+def test_unresolved_items_are_reported_and_add_nothing(factors):
+    scored = footprint.score_items([LineItem("Rice"), LineItem("Zorblax crunch")])
+    assert [i["name"] for i in scored["items"]] == ["Rice"]
+    assert scored["unresolved"] == ["Zorblax crunch"]
+    assert scored["total"] == pytest.approx(3.4)
+
+
+def test_confidences_weight_the_footprint(factors):
+    scored = footprint.score_items([LineItem("Rice", 2)], confidences=[0.5])
+    assert scored["items"][0]["confidence"] == 0.5
+    assert scored["total"] == pytest.approx(3.4)
+
+
+def test_batch_scores_each_reciept_like_score_items(factors):
+    reciepts = [
+        [LineItem("Rice", 250, "g")],
+        [],
+        [LineItem("Milk", 1, "l"), LineItem("Zorblax crunch"), LineItem("Rice")],
+    ]
+    assert footprint.score_batch(reciepts) == [
+        footprint.score_items(reciept) for reciept in reciepts
+    ]
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        {"items": [{"name": "Eggs", "quantity": 6, "unit": "pcs"}]},
+        {"reciepts": [["Rice"], [{"name": "Eggs", "quantity": 6, "unit": "each"}]]},
+    ],
+)
+def test_unknown_units_are_refused_rather_than_scored(body):
+    response = app.test_client().post("/genai/footprint", json=body)
+    assert response.status_code == 400
+    assert "Unknown unit" in response.get_json()["error"]
+
+
+def test_estimates_are_weighted_by_kilograms():
+    estimates = {"Kale chips": [2.8, 0.5], "Tofu": [3.0, 1.0]}
+    assert footprint.weighted_scores(estimates, {"Kale chips": 0.2}) == {
+        "Kale chips": 0.28,
+        "Tofu": 3.0,
+    }
+
+
+def test_reciept_lines_are_scored_for_their_quantities():
+    assert line_items("2 x Milk 1L, 500g Beef mince, Milk 500ml, Rice") == {
+        "Milk": 2.5,
+        "Beef mince": 0.5,
+        "Rice": 1.0,
+    }
+    per_kg = footprint.score_items([LineItem("Milk")])["total"]
+    assert json.loads(list_resp("2 x Milk 1L"))["Milk"] == pytest.approx(2 * per_kg)
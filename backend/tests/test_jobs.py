@@ -0,0 +1,149 @@
+import io
+import time
+from PIL import Image
+from carbon_scanner.images import load_prepared, preprocess_image
+from carbon_scanner.jobs import JobQueue, WorkerPool
+
+
+def make_queue(tmp_path, **kwargs):
+    options = {"visibility_timeout": 0.05, "max_attempts": 3, "retry_delay": 0.01}
+    options.update(kwargs)
+    return JobQueue(str(tmp_path / "jobs.db"), **options)
+
+
+def test_claimed_job_is_invisible_until_its_lease_expires(tmp_path):
+    queue = make_queue(tmp_path)
+    job_id = queue.submit(b"image", {"mode": "two_stage"})
+
+    job = queue.claim()
+    assert job.id == job_id and job.attempt == 1
+    assert job.payload == b"image" and job.options == {"mode": "two_stage"}
+    assert queue.claim() is None
+
+    time.sleep(0.06)
+    redelivered = queue.claim()
+    assert redelivered.id == job_id and redelivered.attempt == 2
+
+
+def test_lost_lease_cannot_complete(tmp_path):
+    queue = make_queue(tmp_path)
+    queue.submit(b"image")
+    stale = queue.claim()
+    time.sleep(0.06)
+    current = queue.claim()
+
+    assert not queue.complete(stale, "late")
+    assert queue.complete(current, "result")
+    assert queue.get(current.id)["status"] == "done"
+    assert queue.get(current.id)["result"] == "result"
+
+
+def test_expired_lease_on_last_attempt_fails_the_job(tmp_path):
+    queue = make_queue(tmp_path, max_attempts=1)
+    job_id = queue.submit(b"image")
+    queue.claim()
+    time.sleep(0.06)
+
+    assert queue.claim() is None
+    status = queue.get(job_id)
+    assert status["status"] == "failed"
+    assert status["error"] == "visibility timeout expired"
+
+
+def test_failed_attempt_is_retried_after_backoff(tmp_path):
+    queue = make_queue(tmp_path, visibility_timeout=10, retry_delay=0.05)
+    job_id = queue.submit(b"image")
+    assert queue.fail(queue.claim(), "upstream timeout")
+
+    assert queue.get(job_id)["status"] == "queued"
+    assert queue.claim() is None
+    time.sleep(0.06)
+    assert queue.claim().attempt == 2
+
+
+def test_permanent_failure_is_not_retried(tmp_path):
+    queue = make_queue(tmp_path, visibility_timeout=10)
+    job_id = queue.submit(b"image")
+    assert queue.fail(queue.claim(), "unreadable image", retry=False)
+
+    status = queue.get(job_id)
+    assert status["status"] == "failed" and status["attempts"] == 1
+    assert queue.depth() == 0
+
+
+def test_finished_jobs_are_purged_after_retention(tmp_path):
+    queue = make_queue(tmp_path, visibility_timeout=10, retention=0.05)
+    done = queue.submit(b"image")
+    queue.complete(queue.claim(), "result")
+    failed = queue.submit(b"image")
+    queue.fail(queue.claim(), "unreadable image", retry=False)
+    queued = queue.submit(b"image")
+
+    assert queue.purge_finished() == 0
+    time.sleep(0.06)
+    assert queue.purge_finished() == 2
+    assert queue.get(done) is None and queue.get(failed) is None
+    assert queue.get(queued)["status"] == "queued"
+
+
+def test_finished_jobs_are_purged_every_purge_every(tmp_path):
+    queue = make_queue(tmp_path, visibility_timeout=10, retention=0, purge_every=2)
+    first = queue.submit(b"image")
+    queue.complete(queue.claim(), "result")
+    assert queue.get(first) is not None
+    queue.submit(b"image")
+    queue.complete(queue.claim(), "result")
+    assert queue.get(first) is None
+
+
+def test_queued_payload_is_sent_as_prepared():
+    buffer = io.BytesIO()
+    Image.new("RGB", (3000, 2000), (200, 40, 40)).save(buffer, format="PNG")
+    prepared = preprocess_image(buffer.getvalue())
+
+    loaded = load_prepared(prepared.data)
+    assert loaded.part == prepared.part
+    assert loaded.image.size == prepared.image.size
+
+
+class Unreadable(Exception):
+    pass
+
+
+def run_workers(queue, handler, permanent=()):
+    workers = WorkerPool(
+        queue, handler, workers=1, poll_interval=0.01, permanent=permanent
+    )
+    workers.start()
+    deadline = time.time() + 2
+    while queue.depth() and time.time() < deadline:
+        time.sleep(0.01)
+    workers.stop()
+
+
+def test_worker_fails_permanent_errors_at_once(tmp_path):
+    queue = make_queue(tmp_path, visibility_timeout=10)
+    job_id = queue.submit(b"image")
+    calls = []
+
+    def handler(job):
+        calls.append(job.attempt)
+        raise Unreadable("not an image")
+
+    run_workers(queue, handler, permanent=(Unreadable,))
+    assert calls == [1]
+    assert queue.get(job_id)["status"] == "failed"
+
+
+def test_worker_retries_other_errors(tmp_path):
+    queue = make_queue(tmp_path, visibility_timeout=10)
+    job_id = queue.submit(b"image")
+
+    def handler(job):
+        if job.attempt < 3:
+            raise ConnectionError("reset")
+        return "ok"
+
+    run_workers(queue, handler, permanent=(Unreadable,))
+    status = queue.get(job_id)
+    assert status["status"] == "done" and status["attempts"] == 3
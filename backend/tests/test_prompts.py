@@ -0,0 +1,52 @@
+import pytest
+from carbon_scanner.app import app
+
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+
+def store(client, user_id, count):
+    for n in range(count):
+        response = client.post(
+            "/db/prompts", json={"user_id": user_id, "prompt": f"prompt {n}"}
+        )
+        assert response.status_code == 201
+
+
+def test_pages_through_a_users_history(client):
+    store(client, 101, 5)
+    store(client, 102, 2)
+
+    prompts, cursor, pages = [], "", 0
+    while True:
+        response = client.get(f"/db/prompts?user_id=101&limit=2&cursor={cursor}")
+        assert response.status_code == 200
+        body = response.get_json()
+        prompts += [p["prompt"] for p in body["prompts"]]
+        pages += 1
+        if body["next_cursor"] is None:
+            break
+        cursor = body["next_cursor"]
+
+    assert prompts == [f"prompt {n}" for n in range(5)]
+    assert pages == 3
+
+
+def test_a_full_last_page_ends_with_an_empty_one(client):
+    store(client, 103, 2)
+    body = client.get("/db/prompts?user_id=103&limit=2").get_json()
+    assert len(body["prompts"]) == 2
+    body = client.get(
+        f"/db/prompts?user_id=103&limit=2&cursor={body['next_cursor']}"
+    ).get_json()
+    assert body == {"prompts": [], "next_cursor": None}
+
+
+@pytest.mark.parametrize(
+    "query",
+    ["", "user_id=abc", "user_id=101&cursor=x", "user_id=101&limit=0"],
+)
+def test_bad_queries_answer_400(client, query):
+    assert client.get(f"/db/prompts?{query}").status_code == 400
@@ -0,0 +1,73 @@
+import pytest
+from carbon_scanner.genai.stream_parser import EstimateStreamParser, parse_estimates
+
+RESPONSE = '```json\n{"Beef mince": [27.0, 0.9], "Rice": [4.5, 0.75]}\n```'
+
+
+def feed_all(chunks):
+    parser = EstimateStreamParser()
+    parsed = []
+    for chunk in chunks:
+        parsed.extend(parser.feed(chunk))
+    return parsed
+
+
+def test_entries_arrive_with_their_closing_bracket():
+    parser = EstimateStreamParser()
+    assert parser.feed('{"Beef mince": [27.0, 0.9') == []
+    assert parser.feed('], "Rice": [4.5,') == [("Beef mince", [27.0, 0.9])]
+    assert parser.feed(" 0.75]}") == [("Rice", [4.5, 0.75])]
+    assert parser.entries == 2
+
+
+@pytest.mark.parametrize("split", range(1, len(RESPONSE)))
+def test_any_chunk_boundary_gives_the_same_entries(split):
+    # covers splits mid-key, mid-number and between key and value
+    assert feed_all([RESPONSE[:split], RESPONSE[split:]]) == [
+        ("Beef mince", [27.0, 0.9]),
+        ("Rice", [4.5, 0.75]),
+    ]
+
+
+def test_single_character_chunks():
+    assert dict(feed_all(list(RESPONSE))) == {
+        "Beef mince": [27.0, 0.9],
+        "Rice": [4.5, 0.75],
+    }
+
+
+def test_number_split_across_chunks_is_not_truncated():
+    assert feed_all(['"Cheese": [2', '1.3', "5, 0.", "8]"]) == [("Cheese", [21.35, 0.8])]
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ('"Milk": [3.2, 0.8]', [3.2, 0.8]),
+        ('"Milk": ["3.2", "0.8"]', [3.2, 0.8]),
+        ("'Milk': ['3.2', '0.8']", [3.2, 0.8]),
+        ('"Milk": [3.2e0, 8E-1]', [3.2, 0.8]),
+        ('"Milk": [1.5e+1, 0.8]', [15.0, 0.8]),
+        ('"Milk": [.7, .85]', [0.7, 0.85]),
+        ('"Milk": [-.5, 0.8]', [-0.5, 0.8]),
+        ('"Milk": [3, 1]', [3.0, 1.0]),
+        ("Milk: [3.2, 0.8]", [3.2, 0.8]),
+    ],
+)
+def test_number_and_key_forms(text, expected):
+    assert parse_estimates(text) == {"Milk": expected}
+
+
+def test_escaped_quotes_in_keys():
+    assert parse_estimates(r'{"12\" pizza": [5.1, 0.6]}') == {'12" pizza': [5.1, 0.6]}
+
+
+def test_prose_and_trailing_commas_are_skipped():
+    text = 'Here you go:\n{\n  "Eggs": [4.7, 0.8],\n  "Tofu": [3.0, 0.7],\n}\nThanks!'
+    assert parse_estimates(text) == {"Eggs": [4.7, 0.8], "Tofu": [3.0, 0.7]}
+
+
+def test_output_without_entries_is_an_error():
+    with pytest.raises(ValueError):
+        parse_estimates("I cannot estimate these items.")
+    assert parse_estimates("") == {}